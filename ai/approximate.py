@@ -0,0 +1,243 @@
+"""
+快速估计模式：分层抽样tile + bootstrap置信区间
+
+分诊时不需要逐个细胞分析整张切片就能给出 H-Score / 阳性率。这里：
+
+1. 由切片缩略图计算每个tile的组织占比（RGB光密度之和阈值，与 color_deconvolution 相同），
+   组织过少的tile直接跳过
+2. 按组织占比分位数把组织tile分成若干层，层内随机排列后按比例交错，
+   得到一个任意前缀都近似按层比例分配的抽样顺序
+3. 按顺序逐批对抽中的tile运行完整的逐细胞流程（检测 → 分割 → 颜色分类），
+   每个tile汇总成 roi_integrals 的通道和（各等级细胞数、面积、阳性面积、阳性IOD）
+4. 分层估计全切片的通道和 Σ N_h · mean_h，指标与整图分析共用同一套公式；
+   层内有放回重抽样得到 bootstrap 分布，给出阳性率、H-Score、IRS、阳性密度的置信区间
+5. 当 bootstrap 中 IRS 和 PP 等级与点估计一致的比例达到置信水平时提前停止
+
+所有组织tile都抽到时，结果等于这些tile上逐细胞流程的合计（置信区间退化为一个点）；
+组织占比低于 min_tissue 的tile从不分析，其中即使有细胞也不计入，
+所以只有 min_tissue=0 时才与 analyze_tiled 完全一致。
+
+用法：
+    metrics = analyzer.analyze_approximate('slide.svs', confidence=0.95)
+    metrics['h_score'], metrics['approximate']['ci']['h_score']
+"""
+
+import logging
+from typing import Dict, List, Optional, Union
+
+import cv2
+import numpy as np
+
+from batching import iter_batches
+from color_deconvolution import DEFAULT_TISSUE_THRESHOLD, OD_LUT
+from roi_integrals import CHANNELS, cell_channels, metrics_from_sums
+from streaming import prefetch
+from tiling import SlideSource, Tile, iter_tile_grid, open_slide
+
+logger = logging.getLogger(__name__)
+
+# 给出置信区间的指标
+CI_METRICS = ('positive_ratio', 'h_score', 'irs', 'positive_density')
+
+
+def tile_tissue_fractions(
+    source: SlideSource,
+    tiles: List[Tile],
+    thumbnail_side: int = 1024,
+    tissue_threshold: float = DEFAULT_TISSUE_THRESHOLD
+) -> np.ndarray:
+    """
+    每个tile的core区域中组织像素所占比例（在缩略图上估计）
+
+    Returns:
+        (len(tiles),) float64，0~1
+    """
+    thumb = source.thumbnail(thumbnail_side)
+    total_od = OD_LUT[thumb[..., 0]] + OD_LUT[thumb[..., 1]] + OD_LUT[thumb[..., 2]]
+    integral = cv2.integral((total_od > tissue_threshold).astype(np.uint8))
+    th, tw = thumb.shape[:2]
+
+    cores = np.array([tile.core for tile in tiles], dtype=np.float64).reshape(-1, 4)
+    x0 = np.clip(np.floor(cores[:, 0] * tw / source.width), 0, tw - 1).astype(np.int64)
+    y0 = np.clip(np.floor(cores[:, 1] * th / source.height), 0, th - 1).astype(np.int64)
+    # 至少覆盖缩略图的一个像素
+    x1 = np.clip(np.ceil(cores[:, 2] * tw / source.width), x0 + 1, tw).astype(np.int64)
+    y1 = np.clip(np.ceil(cores[:, 3] * th / source.height), y0 + 1, th).astype(np.int64)
+    tissue = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+    return tissue / ((x1 - x0) * (y1 - y0))
+
+
+def stratify(fractions: np.ndarray, strata: int) -> np.ndarray:
+    """按组织占比的分位数分层，返回每个tile的层号 0..strata-1（相同占比不会被拆到不同层）"""
+    if len(fractions) == 0:
+        return np.zeros(0, dtype=np.int64)
+    edges = np.unique(np.quantile(fractions, np.linspace(0, 1, strata + 1)[1:-1]))
+    return np.searchsorted(edges, fractions, side='right')
+
+
+def sampling_order(labels: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    按比例交错的抽样顺序
+
+    层 h 中随机排列后第 i 个tile的键为 (i + u) / N_h（u 为 [0, 1) 随机数），
+    按键排序后任意前缀中各层的数量都接近按层大小的比例分配。
+    """
+    keys = np.empty(len(labels))
+    for h in np.unique(labels):
+        members = np.flatnonzero(labels == h)
+        keys[rng.permutation(members)] = (np.arange(len(members)) + rng.random(len(members))) / len(members)
+    return np.argsort(keys, kind='stable')
+
+
+def stratified_totals(
+    sums: np.ndarray,
+    labels: np.ndarray,
+    sizes: np.ndarray,
+    replicates: int,
+    rng: np.random.Generator
+):
+    """
+    分层估计总和及其 bootstrap 重复
+
+    Args:
+        sums: (n, C) 已抽样tile的通道和
+        labels: (n,) 已抽样tile的层号
+        sizes: 每层的tile总数 N_h
+        replicates: bootstrap 次数
+
+    Returns:
+        (点估计 (C,), bootstrap重复 (replicates, C))
+    """
+    point = np.zeros(sums.shape[1])
+    boot = np.zeros((replicates, sums.shape[1]))
+    for h, size in enumerate(sizes):
+        values = sums[labels == h]
+        n = len(values)
+        if n == 0:
+            continue
+        point += size * values.mean(axis=0)
+        if n >= size:
+            # 整层都已抽到，没有抽样误差
+            boot += values.sum(axis=0)
+        else:
+            # 有放回重抽样：每个tile被抽中的次数服从多项分布
+            weights = rng.multinomial(n, np.full(n, 1 / n), size=replicates)
+            boot += size * (weights @ values) / n
+    return point, boot
+
+
+def _summarize(analyzer, sums, labels, sizes, replicates, rng, alpha):
+    """点估计指标、各指标的置信区间，以及bootstrap中IRS和PP等级与点估计一致的比例"""
+    point, boot = stratified_totals(sums, labels, sizes, replicates, rng)
+    metrics = metrics_from_sums(analyzer, point)
+    replicate_metrics = [metrics_from_sums(analyzer, b) for b in boot]
+    ci = {}
+    for key in CI_METRICS:
+        values = np.array([m[key] for m in replicate_metrics], dtype=np.float64)
+        ci[key] = [float(np.quantile(values, alpha)), float(np.quantile(values, 1 - alpha))]
+    agreement = float(np.mean([m['irs'] == metrics['irs'] and m['pp'] == metrics['pp']
+                               for m in replicate_metrics]))
+    return metrics, ci, agreement
+
+
+def estimate_slide(
+    analyzer,
+    slide: Union[str, np.ndarray, SlideSource],
+    tile_size: int = 1024,
+    overlap: int = 64,
+    strata: int = 4,
+    min_tissue: float = 0.05,
+    confidence: float = 0.95,
+    min_tiles: int = 16,
+    max_tiles: Optional[int] = None,
+    replicates: int = 200,
+    seed: int = 0
+) -> Dict:
+    """
+    分层抽样tile估计全切片指标
+
+    Args:
+        analyzer: PathologyQuantitativeAnalyzer
+        slide: 切片路径、ndarray，或 tiling.open_slide 返回的切片对象
+        tile_size: tile边长（像素），越小抽样单元越多、估计越早收敛
+        overlap: 相邻tile重叠宽度（像素）
+        strata: 按组织占比分层的层数
+        min_tissue: 组织占比低于此值的tile不参与抽样，其中的细胞不计入估计（为0时不跳过任何tile）
+        confidence: 置信水平，同时也是提前停止时要求IRS/PP等级确定的比例
+        min_tiles: 判断是否停止前至少分析的tile数
+        max_tiles: 最多分析的tile数（缺省不限制，最坏情况分析全部组织tile）
+        replicates: bootstrap 次数
+        seed: 抽样和重抽样的随机种子
+
+    Returns:
+        与 analyze() 格式相同的指标（不含形态学和 dab_* 指标），细胞数等为估计值；
+        approximate 项包含抽样情况和 ci（各指标的置信区间）
+    """
+    source = slide if hasattr(slide, 'read') else open_slide(slide)
+    rng = np.random.default_rng(seed)
+    trace = analyzer.tracer.start_trace(analyzer._trace_name(slide) if source is not slide else None)
+
+    tiles = list(iter_tile_grid(source.width, source.height, tile_size, overlap))
+    with trace.stage('tissue', tiles=len(tiles)):
+        fractions = tile_tissue_fractions(source, tiles)
+    tissue_index = np.flatnonzero(fractions >= min_tissue)
+    labels = stratify(fractions[tissue_index], strata)
+    sizes = np.bincount(labels, minlength=labels.max() + 1 if len(labels) else 0)
+    order = tissue_index[sampling_order(labels, rng)]
+    order_labels = labels[np.searchsorted(tissue_index, order)]
+    if max_tiles is not None:
+        order, order_labels = order[:max_tiles], order_labels[:max_tiles]
+    logger.info("快速估计: %d 个tile中 %d 个含组织，分 %d 层", len(tiles), len(tissue_index), len(sizes))
+
+    sums = np.zeros((len(order), len(CHANNELS)))
+    sampled, cells_measured, stopped_early = 0, 0, False
+    alpha = (1 - confidence) / 2
+    summary = None
+
+    def read_batches():
+        for batch in iter_batches(len(order), analyzer.detect_batch_size):
+            batch_tiles = [tiles[i] for i in order[batch]]
+            with trace.stage('load', tiles=len(batch_tiles)):
+                images = [source.read(t.x, t.y, t.w, t.h) for t in batch_tiles]
+            yield batch, batch_tiles, images
+
+    for batch, batch_tiles, images in prefetch(read_batches(), depth=1):
+        with trace.stage('detect', pixels=sum(t.w * t.h for t in batch_tiles)):
+            detections = analyzer._detect_cells_batch(images)
+        for row, tile, image, cells in zip(range(batch.start, batch.stop), batch_tiles, images, detections):
+            cells = analyzer._analyze_tile(tile, image, cells, trace)
+            sums[row] = cell_channels(cells.grade, cells.area_pixels, cells.iod).sum(axis=0)
+            cells_measured += len(cells)
+        sampled = batch.stop
+
+        # 每层至少2个tile才能估计层内方差
+        per_stratum = np.bincount(order_labels[:sampled], minlength=len(sizes))
+        ready = sampled >= min_tiles and np.all(per_stratum >= np.minimum(sizes, 2))
+        if ready or sampled == len(order):
+            with trace.stage('bootstrap', tiles=sampled):
+                summary = _summarize(analyzer, sums[:sampled], order_labels[:sampled], sizes,
+                                     replicates, rng, alpha)
+            if sampled < len(order) and summary[2] >= confidence:
+                stopped_early = True
+                break
+
+    if summary is None:
+        # 没有组织tile
+        summary = _summarize(analyzer, sums[:0], order_labels[:0], sizes, replicates, rng, alpha)
+    metrics, ci, agreement = summary
+
+    metrics['approximate'] = {
+        'tiles_total': len(tiles),
+        'tissue_tiles': int(len(tissue_index)),
+        'tiles_sampled': int(sampled),
+        'strata': sizes.tolist(),
+        'cells_measured': int(cells_measured),
+        'stopped_early': stopped_early,
+        'confidence': confidence,
+        'category_agreement': round(agreement, 4),
+        'ci': ci,
+    }
+    logger.info("  分析了 %d/%d 个组织tile，IRS=%d（等级一致率 %.1f%%）",
+                sampled, len(tissue_index), metrics['irs'], agreement * 100)
+    trace.finish()
+    return metrics
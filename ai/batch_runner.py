@@ -0,0 +1,288 @@
+"""
+并行批量分析
+
+把 PathologyQuantitativeAnalyzer.analyze()（或任意 path → dict 的检测函数）
+分发到进程池中执行：
+- 工作进程数可配置，每个进程只初始化一次分析器/模型
+- 返回结果严格按输入顺序排列，与完成顺序无关
+- 每完成一张图就追加写入磁盘日志（JSONL），中断后重新运行会跳过已完成的图像
+
+输入也可以是分割清单（image_split.SplitEntry），日志和细胞表按 "源文件#名称" 区分。
+
+用法：
+    python batch_runner.py demo/processed/original --workers 4 --journal demo/batch_journal.jsonl
+    python batch_runner.py demo/processed --manifest demo/processed/manifest.jsonl
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from image_split import SplitEntry, load_manifest
+from json_utils import to_jsonable
+
+
+# 工作进程内的分析器（由 _init_worker 创建，每个进程一个）
+_worker_analyzer = None
+# 细胞表保存目录（供 regrade.py 重新分级），为None时不保存
+_worker_cells_dir = None
+
+
+def _init_worker(
+    analyzer_kwargs: Dict[str, Any],
+    model_specs: Dict[str, Tuple[str, Dict]],
+    cells_dir: Optional[str] = None,
+    trace_dir: Optional[str] = None
+) -> None:
+    """
+    工作进程初始化：创建分析器，模型通过 model_registry 加载（每进程一次）
+
+    Args:
+        analyzer_kwargs: 传给 PathologyQuantitativeAnalyzer 的参数（需可pickle）
+        model_specs: {'yolo_model': ('yolo', {...}), ...}，构造参数名 → 注册表中的模型
+        cells_dir: 每张图的细胞表保存目录（<图像名>-<哈希>.npz，见 _cells_filename）
+        trace_dir: 每张图的分阶段追踪JSON保存目录（<图像名>.trace.json）
+    """
+    global _worker_analyzer, _worker_cells_dir
+    _worker_cells_dir = cells_dir
+    from tracing import Tracer
+
+    kwargs = dict(analyzer_kwargs)
+    if trace_dir:
+        # 各进程直接写追踪文件，不在内存中累积
+        kwargs['tracer'] = Tracer(trace_dir, keep=False)
+    _worker_analyzer = build_analyzer(kwargs, model_specs)
+
+
+def build_analyzer(
+    analyzer_kwargs: Dict[str, Any],
+    model_specs: Dict[str, Tuple[str, Dict]]
+):
+    """
+    创建分析器，model_specs 中的模型从 model_registry 获取；未指定的模型为None（演示/桩模型）
+    """
+    from demo_pipeline import PathologyQuantitativeAnalyzer
+    from model_registry import get_model
+
+    kwargs = {'yolo_model': None, 'segmentation_model': None, **analyzer_kwargs}
+    for arg, (kind, params) in model_specs.items():
+        kwargs[arg] = get_model(kind, **params)
+    return PathologyQuantitativeAnalyzer(**kwargs)
+
+
+def _source_key(source: Union[str, Path, SplitEntry]) -> str:
+    """日志中的任务标识：路径，或分割清单记录的 源文件#名称"""
+    if isinstance(source, SplitEntry):
+        return f"{source.source}#{source.name}"
+    return str(source)
+
+
+def _cells_filename(source: Union[str, Path, SplitEntry]) -> str:
+    """细胞表文件名：图像名 + 任务标识的短哈希，不同目录下的同名图像不会互相覆盖"""
+    name = source.name if isinstance(source, SplitEntry) else Path(source).stem
+    digest = hashlib.sha1(_source_key(source).encode('utf-8')).hexdigest()[:10]
+    return f"{name}-{digest}.npz"
+
+
+def analyze_image(image_path: Union[str, SplitEntry]) -> Dict:
+    """默认任务：用当前进程的分析器分析一张图"""
+    if _worker_cells_dir is None:
+        return _worker_analyzer.analyze(image_path)
+
+    metrics, cells = _worker_analyzer.analyze(image_path, return_cells=True)
+    cells.save(os.path.join(_worker_cells_dir, _cells_filename(image_path)))
+    return metrics
+
+
+def _run_task(
+    task: Callable[[str], Dict],
+    image_path: Union[str, SplitEntry]
+) -> Tuple[str, Optional[Dict], Optional[str]]:
+    """在工作进程中执行，异常转换为错误信息而不是让整个批次失败"""
+    key = _source_key(image_path)
+    try:
+        return key, to_jsonable(task(image_path)), None
+    except Exception as e:
+        return key, None, f"{type(e).__name__}: {e}"
+
+
+class JobJournal:
+    """
+    追加写入的任务日志（每行一个JSON）
+
+    每条记录写完立即 flush + fsync；进程崩溃导致的半行记录在读取时忽略。
+    只有 status == 'ok' 的记录视为已完成，失败的图像在下次运行时会重试。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.completed: Dict[str, Dict] = {}
+
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if entry.get('status') == 'ok':
+                        self.completed[entry['path']] = entry['result']
+                    else:
+                        self.completed.pop(entry.get('path'), None)
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def record(self, image_path: str, result: Optional[Dict], error: Optional[str]) -> None:
+        entry = {'path': image_path, 'status': 'ok' if error is None else 'error'}
+        if error is None:
+            entry['result'] = result
+            self.completed[image_path] = result
+        else:
+            entry['error'] = error
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def run_batch(
+    image_paths: Sequence[Union[str, SplitEntry]],
+    task: Callable[[str], Dict] = analyze_image,
+    workers: Optional[int] = None,
+    journal_path: Optional[str] = None,
+    analyzer_kwargs: Optional[Dict[str, Any]] = None,
+    model_specs: Optional[Dict[str, Tuple[str, Dict]]] = None,
+    max_pending: Optional[int] = None,
+    cells_dir: Optional[str] = None,
+    trace_dir: Optional[str] = None
+) -> List[Dict]:
+    """
+    并行分析一批图像
+
+    Args:
+        image_paths: 图像路径或分割清单记录列表
+        task: 工作进程中执行的函数 path → dict（需可pickle，即模块级函数）
+        workers: 进程数，默认 os.cpu_count()
+        journal_path: 任务日志路径；为None时不记录、不可恢复
+        analyzer_kwargs / model_specs: 默认任务使用的分析器配置，见 _init_worker
+        max_pending: 同时提交的任务上限（控制内存），默认 workers × 4
+        cells_dir: 默认任务额外保存每张图的细胞表，供 regrade.py 调整阈值后重新分级
+        trace_dir: 默认任务额外保存每张图的分阶段追踪，结束后可用 tracing.summarize_trace_dir 汇总
+
+    Returns:
+        与 image_paths 顺序一致的列表，每项为
+        {'path': ..., 'status': 'ok'/'error', 'result': {...} 或 'error': '...'}
+    """
+    sources = {_source_key(p): (p if isinstance(p, SplitEntry) else str(p)) for p in image_paths}
+    paths = [_source_key(p) for p in image_paths]
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 4
+
+    journal = JobJournal(journal_path) if journal_path else None
+    outcomes: Dict[str, Dict] = {}
+    if journal:
+        for path in paths:
+            if path in journal.completed:
+                outcomes[path] = {'path': path, 'status': 'ok', 'result': journal.completed[path]}
+    todo = [p for p in sources if p not in outcomes]
+    if cells_dir:
+        filenames: Dict[str, str] = {}
+        for key, source in sources.items():
+            other = filenames.setdefault(_cells_filename(source), key)
+            if other != key:
+                raise ValueError(f"细胞表文件名冲突：{other} 和 {key} 都会保存为 {_cells_filename(source)}")
+        os.makedirs(cells_dir, exist_ok=True)
+    print(f"共 {len(paths)} 张图像，已完成 {len(paths) - len(todo)} 张，待处理 {len(todo)} 张（{workers} 个进程）")
+
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(analyzer_kwargs or {}, model_specs or {}, cells_dir, trace_dir)
+        ) as executor:
+            pending = set()
+            queue = iter(todo)
+            done_count = 0
+
+            while True:
+                # 滑动窗口提交，避免一次性创建上千个future
+                for path in queue:
+                    pending.add(executor.submit(_run_task, task, sources[path]))
+                    if len(pending) >= max_pending:
+                        break
+                if not pending:
+                    break
+
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path, result, error = future.result()
+                    if journal:
+                        journal.record(path, result, error)
+                    outcomes[path] = (
+                        {'path': path, 'status': 'ok', 'result': result} if error is None
+                        else {'path': path, 'status': 'error', 'error': error}
+                    )
+                    done_count += 1
+                    if error is not None:
+                        print(f"  ⚠ {path}: {error}")
+                    if done_count % 20 == 0:
+                        print(f"处理进度: {done_count}/{len(todo)}")
+    finally:
+        if journal:
+            journal.close()
+
+    return [outcomes[p] for p in paths]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并行批量分析病理图像（支持断点续跑）")
+    parser.add_argument('input_dir', help="图像目录")
+    parser.add_argument('--pattern', default='*.jpg', help="文件匹配模式（默认 *.jpg）")
+    parser.add_argument('--workers', type=int, default=None, help="进程数（默认CPU核数）")
+    parser.add_argument('--journal', default=None, help="任务日志路径（默认 <input_dir>/batch_journal.jsonl）")
+    parser.add_argument('--output', default=None, help="汇总结果JSON输出路径")
+    parser.add_argument('--pixel-to-mm', type=float, default=350, help="像素到毫米的转换比例")
+    parser.add_argument('--cells-dir', default=None, help="保存每张图的细胞表（npz），供 regrade.py 使用")
+    parser.add_argument('--trace-dir', default=None, help="保存每张图的分阶段追踪JSON，结束后写出汇总 summary.json")
+    parser.add_argument('--manifest', default=None, help="分割清单（01_split_images.py --manifest），指定时忽略 --pattern")
+    args = parser.parse_args()
+
+    if args.manifest:
+        image_paths = load_manifest(args.manifest)
+    else:
+        image_paths = sorted(Path(args.input_dir).glob(args.pattern))
+    journal_path = args.journal or os.path.join(args.input_dir, 'batch_journal.jsonl')
+
+    results = run_batch(
+        image_paths,
+        workers=args.workers,
+        journal_path=journal_path,
+        analyzer_kwargs={'pixel_to_mm_ratio': args.pixel_to_mm},
+        cells_dir=args.cells_dir,
+        trace_dir=args.trace_dir,
+    )
+
+    ok = sum(1 for r in results if r['status'] == 'ok')
+    print(f"\n完成！成功 {ok}/{len(results)}，日志: {journal_path}")
+
+    if args.trace_dir:
+        from tracing import format_summary, summarize_trace_dir
+        summary_path = os.path.join(args.trace_dir, 'summary.json')
+        print(format_summary(summarize_trace_dir(args.trace_dir, summary_path)))
+        print(f"追踪汇总: {summary_path}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果保存到: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
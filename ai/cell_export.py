@@ -0,0 +1,299 @@
+"""
+逐细胞结果的列式导出
+
+analyze() 只返回汇总指标，逐细胞的明细（bbox、面积、等级、颜色统计、形态）
+要么随 CellTable.save() 存成压缩npz（读取时必须整体解压），要么丢弃。
+队列研究和前端需要扫描数百万个细胞，这里提供两种列式格式：
+
+- npy（默认，只依赖NumPy）：一个目录，每列一个原始二进制文件 <列名>.bin，
+  列的dtype和行数写在 meta.json。读取时用 np.memmap，按需分页，不解压、不复制
+- parquet（需要安装 pyarrow）：单个文件，每次写入一个 row group，
+  可被 pandas / DuckDB / Spark 直接读取
+
+两种格式的列相同：CellTable 的数值列（bbox 拆成 bbox_x/bbox_y/bbox_w/bbox_h）
+加上 sample 列（样本序号，对应元数据中的 samples 列表），多张切片可以写入同一个数据集。
+
+写入是分块追加的，分块分析时每个tile的细胞直接写出，不在内存中累积：
+    with CellWriter('cells_out') as writer:
+        analyzer.analyze_tiled('slide.svs', cell_writer=writer)
+
+读取：
+    columns = open_cells('cells_out', columns=['grade', 'area_pixels'])
+    for chunk in iter_cell_chunks('cells_out', chunk_rows=1_000_000):
+        ...
+
+把批处理 --cells-dir 保存的npz合并成一个队列数据集：
+    python cell_export.py demo/cells --output demo/cells_dataset [--format parquet]
+"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from cell_table import CellTable
+
+# 数据集格式版本（meta.json / parquet元数据中的 format_version）
+FORMAT_VERSION = 1
+
+META_FILE = 'meta.json'
+
+# bbox 拆分后的列名
+BBOX_COLUMNS = ('bbox_x', 'bbox_y', 'bbox_w', 'bbox_h')
+
+
+def export_schema() -> Dict[str, np.dtype]:
+    """导出列名 → dtype"""
+    schema = {'sample': np.dtype(np.int32)}
+    for name, (dtype, shape) in CellTable.COLUMNS.items():
+        if name == 'bbox':
+            schema.update({column: np.dtype(dtype) for column in BBOX_COLUMNS})
+        else:
+            schema[name] = np.dtype(dtype)
+    return schema
+
+
+def cell_columns(cells: CellTable, sample: int = 0) -> Dict[str, np.ndarray]:
+    """细胞表 → 导出列（bbox 拆成四列）"""
+    columns = {'sample': np.full(len(cells), sample, dtype=np.int32)}
+    for name in CellTable.COLUMNS:
+        if name == 'bbox':
+            for k, column in enumerate(BBOX_COLUMNS):
+                columns[column] = np.ascontiguousarray(cells.bbox[:, k])
+        else:
+            columns[name] = getattr(cells, name)
+    return columns
+
+
+def to_cell_table(columns: Dict[str, np.ndarray]) -> CellTable:
+    """导出列 → 细胞表（缺少的列补0，mask为None）"""
+    size = len(next(iter(columns.values()))) if columns else 0
+    table = CellTable(size)
+    if all(column in columns for column in BBOX_COLUMNS):
+        table.bbox[:] = np.stack([columns[column] for column in BBOX_COLUMNS], axis=1)
+    for name in CellTable.COLUMNS:
+        if name in columns:
+            getattr(table, name)[:] = columns[name]
+    return table
+
+
+class CellWriter:
+    """
+    分块追加写出逐细胞结果
+
+    Args:
+        path: npy格式为目录，parquet格式为文件路径
+        format: 'npy' 或 'parquet'
+        metadata: 额外写入元数据的信息（例如 pixel_to_mm_ratio、模型标识）
+    """
+
+    def __init__(self, path: str, format: str = 'npy', metadata: Optional[Dict] = None):
+        if format not in ('npy', 'parquet'):
+            raise ValueError(f"不支持的导出格式: {format}，可选 'npy' / 'parquet'")
+        self.path = path
+        self.format = format
+        self.metadata = dict(metadata or {})
+        self.schema = export_schema()
+        self.samples: List[str] = []
+        self._sample_ids: Dict[str, int] = {}
+        self.rows = 0
+        self._files = {}
+        self._parquet = None
+
+        if format == 'npy':
+            os.makedirs(path, exist_ok=True)
+            # 先删除旧的元数据：写到一半中断时读取方会发现数据集不完整
+            if os.path.exists(os.path.join(path, META_FILE)):
+                os.remove(os.path.join(path, META_FILE))
+            self._files = {name: open(os.path.join(path, name + '.bin'), 'wb') for name in self.schema}
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            self._pa = pa
+            arrow_schema = pa.schema([(name, pa.from_numpy_dtype(dtype)) for name, dtype in self.schema.items()])
+            self._parquet = pq.ParquetWriter(path, arrow_schema)
+
+    def _sample_index(self, sample: Optional[str]) -> int:
+        name = '' if sample is None else str(sample)
+        index = self._sample_ids.get(name)
+        if index is None:
+            index = self._sample_ids[name] = len(self.samples)
+            self.samples.append(name)
+        return index
+
+    def write(self, cells: CellTable, sample: Optional[str] = None) -> None:
+        """
+        追加一批细胞
+
+        Args:
+            cells: 细胞表（例如一个tile中归属于该tile的细胞）
+            sample: 样本名（切片/图像名），同一样本可以分多次写入
+        """
+        if len(cells) == 0:
+            self._sample_index(sample)
+            return
+        columns = cell_columns(cells, self._sample_index(sample))
+        if self._parquet is not None:
+            pa = self._pa
+            self._parquet.write_table(pa.table({name: pa.array(values) for name, values in columns.items()}))
+        else:
+            for name, values in columns.items():
+                self._files[name].write(np.ascontiguousarray(values, dtype=self.schema[name]).tobytes())
+        self.rows += len(cells)
+
+    def _meta(self) -> Dict:
+        return {
+            'format_version': FORMAT_VERSION,
+            'rows': self.rows,
+            'columns': {name: dtype.str for name, dtype in self.schema.items()},
+            'samples': self.samples,
+            'metadata': self.metadata,
+        }
+
+    def close(self) -> None:
+        """结束写入并写出元数据；之前读取方看不到这个数据集"""
+        if self._parquet is not None:
+            self._parquet.add_key_value_metadata({'cell_export': json.dumps(self._meta(), ensure_ascii=False)})
+            self._parquet.close()
+            self._parquet = None
+            return
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+        with open(os.path.join(self.path, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(self._meta(), f, ensure_ascii=False, indent=2)
+
+    def abort(self) -> None:
+        """
+        放弃写入：关闭文件但不写元数据，读取方不会把写了一半的数据集当成完整的
+
+        npy格式保留已写入的列文件（没有 meta.json，read_metadata 会报未写完）；
+        parquet格式关闭时总会写出可读的文件尾，因此直接删除该文件。
+        """
+        if self._parquet is not None:
+            self._parquet.close()
+            self._parquet = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+    def __enter__(self) -> 'CellWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        # with 块中出现异常（例如分块分析中途失败）时不发布不完整的数据集
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+def export_cells(
+    cells: CellTable,
+    path: str,
+    format: str = 'npy',
+    sample: Optional[str] = None,
+    metadata: Optional[Dict] = None
+) -> None:
+    """把一张细胞表写成列式数据集"""
+    with CellWriter(path, format, metadata) as writer:
+        writer.write(cells, sample)
+
+
+def read_metadata(path: str) -> Dict:
+    """数据集元数据：rows、columns（dtype）、samples、metadata"""
+    if os.path.isdir(path):
+        meta_path = os.path.join(path, META_FILE)
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"{meta_path} 不存在（数据集未写完或不是细胞导出目录）")
+        with open(meta_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    import pyarrow.parquet as pq
+
+    raw = pq.ParquetFile(path).metadata.metadata or {}
+    if b'cell_export' not in raw:
+        raise ValueError(f"{path} 不是细胞导出文件")
+    return json.loads(raw[b'cell_export'])
+
+
+def open_cells(path: str, columns: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+    """
+    打开列式数据集
+
+    npy格式返回只读 np.memmap（不读入内存，切片时才按需读取）；
+    parquet格式通过内存映射读取指定列后转换为NumPy数组。
+
+    Args:
+        columns: 需要的列，缺省为全部
+    """
+    meta = read_metadata(path)
+    names = list(columns) if columns is not None else list(meta['columns'])
+    unknown = [name for name in names if name not in meta['columns']]
+    if unknown:
+        raise KeyError(f"数据集中没有这些列: {unknown}")
+
+    if os.path.isdir(path):
+        rows = meta['rows']
+        result = {}
+        for name in names:
+            dtype = np.dtype(meta['columns'][name])
+            if rows == 0:
+                result[name] = np.zeros(0, dtype=dtype)
+            else:
+                result[name] = np.memmap(os.path.join(path, name + '.bin'), dtype=dtype, mode='r', shape=(rows,))
+        return result
+
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(path, columns=names, memory_map=True)
+    return {name: table.column(name).to_numpy() for name in names}
+
+
+def iter_cell_chunks(
+    path: str,
+    chunk_rows: int = 1_000_000,
+    columns: Optional[Sequence[str]] = None
+) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    按块扫描数据集，每块最多 chunk_rows 行（内存占用与数据集大小无关）
+    """
+    if os.path.isdir(path):
+        data = open_cells(path, columns)
+        rows = read_metadata(path)['rows']
+        for start in range(0, rows, chunk_rows):
+            yield {name: np.asarray(values[start:start + chunk_rows]) for name, values in data.items()}
+        return
+
+    import pyarrow.parquet as pq
+
+    names = list(columns) if columns is not None else None
+    for batch in pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunk_rows, columns=names):
+        yield {name: batch.column(name).to_numpy() for name in batch.schema.names}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把细胞表npz（批处理 --cells-dir）合并导出为列式数据集")
+    parser.add_argument('cells', help="细胞表npz文件或包含npz文件的目录")
+    parser.add_argument('--output', required=True, help="输出目录（npy）或文件（parquet）")
+    parser.add_argument('--format', choices=('npy', 'parquet'), default='npy', help="导出格式（默认 npy）")
+    parser.add_argument('--pixel-to-mm', type=float, default=350, help="像素到毫米的转换比例（写入元数据）")
+    args = parser.parse_args()
+
+    source = Path(args.cells)
+    cell_paths = sorted(source.glob('*.npz')) if source.is_dir() else [source]
+    with CellWriter(args.output, args.format, {'pixel_to_mm_ratio': args.pixel_to_mm}) as writer:
+        for path in cell_paths:
+            writer.write(CellTable.load(str(path)), sample=path.stem)
+    print(f"导出 {len(cell_paths)} 个样本、{writer.rows} 个细胞到: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
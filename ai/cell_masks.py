@@ -0,0 +1,158 @@
+"""
+紧凑的逐细胞mask存储
+
+原来每个细胞的mask是一个独立的bbox大小 bool ndarray：每像素1字节，外加每个数组
+约100字节的对象开销，10万个细胞时是大量小对象，也没法随细胞表保存。
+
+CellMasks 把所有mask按行优先展平后首尾相接，整体 np.packbits 成一个 uint8 缓冲区
+（每像素1 bit），另存每个细胞的 (高, 宽) 和在缓冲区中的 bit 偏移：
+
+- masks[i]：解出第i个细胞bbox大小的bool mask（缺失时为None）
+- 遍历：一次性解包整个缓冲区，依次产出视图
+- pixels()：所有前景像素的 (细胞序号, 行, 列)，不需要逐个细胞解包（rasterize_labels 栅格化标签图时使用）
+- take / concat：与 CellTable 的行选择、拼接对齐
+- to_arrays / from_arrays：三个数值数组，可直接写入 npz（CellTable.save）
+- rle_encode / rle_decode：COCO风格的非压缩RLE（列优先），用于与其他工具交换
+
+需要整张标签图时用 label_image.rasterize_labels(shape, cells.bbox_pixels(), cells.masks)。
+"""
+
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 缺失mask的形状标记
+_MISSING = -1
+
+
+class CellMasks:
+    """
+    按行对齐的bit-packed mask集合
+
+    Args:
+        shapes: (N, 2) int32，每个mask的 (高, 宽)，缺失为 (-1, -1)
+        offsets: (N + 1,) int64，第i个mask的bit区间为 [offsets[i], offsets[i+1])
+        bits: packbits 后的 uint8 缓冲区
+    """
+
+    def __init__(self, shapes: np.ndarray, offsets: np.ndarray, bits: np.ndarray):
+        self.shapes = np.asarray(shapes, dtype=np.int32).reshape(-1, 2)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.bits = np.asarray(bits, dtype=np.uint8)
+
+    @classmethod
+    def empty(cls, count: int) -> 'CellMasks':
+        """count 个缺失的mask"""
+        return cls(np.full((count, 2), _MISSING), np.zeros(count + 1), np.zeros(0))
+
+    @classmethod
+    def from_masks(cls, masks: Sequence[Optional[np.ndarray]]) -> 'CellMasks':
+        """由bool mask列表打包（None表示缺失）"""
+        shapes = np.array([m.shape if m is not None else (_MISSING, _MISSING) for m in masks],
+                          dtype=np.int32).reshape(-1, 2)
+        sizes = np.where(shapes[:, 0] >= 0, shapes[:, 0].astype(np.int64) * shapes[:, 1], 0)
+        offsets = np.concatenate([[0], np.cumsum(sizes)])
+        present = [np.asarray(m, dtype=bool).ravel() for m in masks if m is not None]
+        flat = np.concatenate(present) if present else np.zeros(0, dtype=bool)
+        return cls(shapes, offsets, np.packbits(flat))
+
+    @classmethod
+    def concat(cls, parts: Sequence['CellMasks']) -> 'CellMasks':
+        """按行拼接"""
+        if not parts:
+            return cls.empty(0)
+        flat = np.concatenate([part._unpack() for part in parts])
+        shapes = np.concatenate([part.shapes for part in parts])
+        sizes = np.concatenate([np.diff(part.offsets) for part in parts])
+        return cls(shapes, np.concatenate([[0], np.cumsum(sizes)]), np.packbits(flat))
+
+    def _unpack(self) -> np.ndarray:
+        """解包整个缓冲区为展平的bool数组（长度为总bit数）"""
+        return np.unpackbits(self.bits, count=int(self.offsets[-1])).view(bool)
+
+    def __len__(self) -> int:
+        return len(self.shapes)
+
+    def __getitem__(self, i: int) -> Optional[np.ndarray]:
+        height, width = self.shapes[i]
+        if height < 0:
+            return None
+        start, stop = int(self.offsets[i]), int(self.offsets[i + 1])
+        # 只解包覆盖 [start, stop) 的字节
+        chunk = np.unpackbits(self.bits[start // 8:(stop + 7) // 8])
+        return chunk[start % 8:start % 8 + stop - start].view(bool).reshape(height, width)
+
+    def __iter__(self) -> Iterator[Optional[np.ndarray]]:
+        flat = self._unpack()
+        for (height, width), start, stop in zip(self.shapes, self.offsets[:-1], self.offsets[1:]):
+            yield None if height < 0 else flat[start:stop].reshape(height, width)
+
+    def pixels(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """所有前景像素：(细胞序号, mask内的行, mask内的列)，按细胞序号升序"""
+        positions = np.flatnonzero(self._unpack())
+        cell = np.repeat(np.arange(len(self), dtype=np.int32), np.diff(self.offsets))[positions]
+        # 单个mask的bit数不超过int32范围，mask内的偏移用int32计算
+        local = (positions - self.offsets[cell]).astype(np.int32)
+        row, col = np.divmod(local, self.shapes[cell, 1])
+        return cell, row, col
+
+    def take(self, index) -> 'CellMasks':
+        """按行选取（bool掩码或整数索引）"""
+        index = np.asarray(index)
+        if index.dtype == bool:
+            index = np.flatnonzero(index)
+        index = index.astype(np.int64)
+        starts = self.offsets[index]
+        sizes = self.offsets[index + 1] - starts
+        # 选中区间的bit位置：repeat起点 + 区间内的序号
+        positions = np.repeat(starts - (np.cumsum(sizes) - sizes), sizes)
+        positions += np.arange(int(sizes.sum()))
+        return CellMasks(self.shapes[index], np.concatenate([[0], np.cumsum(sizes)]),
+                         np.packbits(self._unpack()[positions]))
+
+    def areas(self) -> np.ndarray:
+        """每个mask的前景像素数（缺失为0）"""
+        flat = self._unpack()
+        counts = np.concatenate([[0], np.cumsum(flat, dtype=np.int64)])
+        return counts[self.offsets[1:]] - counts[self.offsets[:-1]]
+
+    @property
+    def nbytes(self) -> int:
+        """占用的字节数"""
+        return self.shapes.nbytes + self.offsets.nbytes + self.bits.nbytes
+
+    def rle(self, i: int) -> Optional[Dict]:
+        """第i个mask的COCO风格RLE {'size': [高, 宽], 'counts': [...]}"""
+        mask = self[i]
+        return None if mask is None else {'size': list(mask.shape), 'counts': rle_encode(mask).tolist()}
+
+    def to_arrays(self, prefix: str = 'mask_') -> Dict[str, np.ndarray]:
+        """保存用的数值数组"""
+        return {f'{prefix}shapes': self.shapes, f'{prefix}offsets': self.offsets, f'{prefix}bits': self.bits}
+
+    @classmethod
+    def from_arrays(cls, data, prefix: str = 'mask_') -> 'CellMasks':
+        """由 to_arrays 的结果（或包含这些键的npz）恢复"""
+        return cls(data[f'{prefix}shapes'], data[f'{prefix}offsets'], data[f'{prefix}bits'])
+
+
+def rle_encode(mask: np.ndarray) -> np.ndarray:
+    """
+    COCO风格非压缩RLE：按列优先展平，交替记录 0 和 1 的游程长度，第一个游程为0
+    """
+    flat = np.asarray(mask, dtype=bool).ravel(order='F')
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    bounds = np.concatenate([[0], changes, [len(flat)]])
+    counts = np.diff(bounds)
+    if len(flat) and flat[0]:
+        counts = np.concatenate([[0], counts])
+    return counts.astype(np.int64)
+
+
+def rle_decode(counts: Sequence[int], shape: Sequence[int]) -> np.ndarray:
+    """rle_encode 的逆变换"""
+    counts = np.asarray(counts, dtype=np.int64)
+    values = np.arange(len(counts)) % 2 == 1
+    flat = np.repeat(values, counts)
+    return flat.reshape(shape[1], shape[0]).T.copy()
+
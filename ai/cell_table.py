@@ -0,0 +1,143 @@
+"""
+细胞列式表（struct-of-arrays）
+
+每一列是一个NumPy数组，第i行对应第i个细胞。
+Pipeline的各个阶段直接读写这些列，不再为每个细胞构造dict。
+"""
+
+import numpy as np
+from typing import Dict, List, Sequence
+
+from cell_masks import CellMasks
+
+
+# 阳性等级 → 标签（与 _classify_cell_positivity 的返回值一致）
+GRADE_LABELS = ('negative', 'weak_positive', 'moderate_positive', 'strong_positive')
+
+
+class CellTable:
+    """
+    细胞列式表
+
+    列:
+        bbox:         (N, 4) float32，[x, y, w, h]（左上角 + 宽高，像素）
+        confidence:   (N,)   float32，检测置信度
+        area_pixels:  (N,)   int64，分割mask的像素数
+        grade:        (N,)   int8，阳性等级 0/1/2/3
+        mean_h/s/v:   (N,)   float32，细胞区域平均HSV
+        iod:          (N,)   float64，细胞累积光密度
+        perimeter:    (N,)   float32，周长（像素，见 morphometry）
+        circularity:  (N,)   float32，圆度 4π·面积/周长²
+        major_axis / minor_axis: (N,) float32，等矩椭圆的长/短轴全长（像素）
+        orientation:  (N,)   float32，长轴与x轴夹角（度）
+
+    masks 不是数值列，单独保存为与行对齐的 CellMasks（bit-packed，cells.masks[i] 为
+    bbox大小的bool数组，未分割时为None）。
+    """
+
+    # 列名 → (dtype, 每行形状)
+    COLUMNS = {
+        'bbox': (np.float32, (4,)),
+        'confidence': (np.float32, ()),
+        'area_pixels': (np.int64, ()),
+        'grade': (np.int8, ()),
+        'mean_h': (np.float32, ()),
+        'mean_s': (np.float32, ()),
+        'mean_v': (np.float32, ()),
+        'iod': (np.float64, ()),
+        'perimeter': (np.float32, ()),
+        'circularity': (np.float32, ()),
+        'major_axis': (np.float32, ()),
+        'minor_axis': (np.float32, ()),
+        'orientation': (np.float32, ()),
+    }
+
+    def __init__(self, size: int = 0):
+        for name, (dtype, shape) in self.COLUMNS.items():
+            setattr(self, name, np.zeros((size,) + shape, dtype=dtype))
+        self.masks = CellMasks.empty(size)
+
+    @classmethod
+    def from_detections(cls, bboxes, confidences) -> 'CellTable':
+        """由检测结果（bbox列表 + 置信度列表）创建表，其余列为0"""
+        bboxes = np.asarray(bboxes, dtype=np.float32).reshape(-1, 4)
+        table = cls(len(bboxes))
+        table.bbox[:] = bboxes
+        table.confidence[:] = np.asarray(confidences, dtype=np.float32).reshape(-1)
+        return table
+
+    @classmethod
+    def concat(cls, tables: Sequence['CellTable']) -> 'CellTable':
+        """按行拼接多张表（例如分块分析的各个tile）"""
+        table = cls(0)
+        if not tables:
+            return table
+        for name in cls.COLUMNS:
+            setattr(table, name, np.concatenate([getattr(t, name) for t in tables]))
+        table.masks = CellMasks.concat([t.masks for t in tables])
+        return table
+
+    def take(self, index) -> 'CellTable':
+        """按行选取（bool掩码或整数索引），返回新表"""
+        index = np.asarray(index)
+        if index.dtype == bool:
+            index = np.flatnonzero(index)
+        table = CellTable(0)
+        for name in self.COLUMNS:
+            setattr(table, name, getattr(self, name)[index])
+        table.masks = self.masks.take(index)
+        return table
+
+    def __len__(self) -> int:
+        return len(self.grade)
+
+    def bbox_pixels(self) -> np.ndarray:
+        """整数像素bbox，与原来 int(x), int(y), int(x+w), int(y+h) 的切片方式一致"""
+        x, y, w, h = self.bbox.T
+        return np.stack([x, y, x + w, y + h], axis=1).astype(np.int64)
+
+    def centroids(self) -> np.ndarray:
+        """bbox中心点 (N, 2)，[cx, cy]"""
+        return self.bbox[:, :2] + self.bbox[:, 2:] / 2
+
+    def grade_counts(self) -> np.ndarray:
+        """各等级细胞数 [阴性, 弱阳性, 中度阳性, 强阳性]"""
+        return np.bincount(self.grade.astype(np.int64), minlength=4)[:4]
+
+    def labels(self) -> List[str]:
+        """阳性等级对应的文字标签"""
+        return [GRADE_LABELS[g] for g in self.grade]
+
+    def save(self, path: str, masks: bool = True) -> None:
+        """保存数值列到npz；masks为True时一并保存bit-packed的mask（每像素1 bit）"""
+        arrays = {name: getattr(self, name) for name in self.COLUMNS}
+        if masks:
+            arrays.update(self.masks.to_arrays())
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> 'CellTable':
+        """从 save() 写出的npz读取；文件中缺少的列补0，没有保存mask时mask为None"""
+        with np.load(path) as data:
+            size = len(data['grade'])
+            table = cls(size)
+            for name in cls.COLUMNS:
+                if name in data:
+                    setattr(table, name, data[name])
+            if 'mask_bits' in data:
+                table.masks = CellMasks.from_arrays(data)
+        return table
+
+    def to_records(self) -> List[Dict]:
+        """转换为旧的 List[Dict] 格式（调试/兼容用，热路径不要调用）"""
+        records = []
+        for i in range(len(self)):
+            records.append({
+                'bbox': self.bbox[i].tolist(),
+                'confidence': float(self.confidence[i]),
+                'mask': self.masks[i],
+                'area_pixels': int(self.area_pixels[i]),
+                'grade': int(self.grade[i]),
+                'label': GRADE_LABELS[self.grade[i]],
+            })
+        return records
@@ -0,0 +1,141 @@
+"""
+H-DAB颜色反卷积（Ruifrok & Johnston 染色矩阵）
+
+_calculate_total_iod 用 255 - 灰度 近似光密度，而且只统计检测到的细胞内的像素，
+得不到报告里"阳性面积 / 组织面积"这类基于像素面积的指标。
+这里对整张图（或单个tile）做颜色反卷积，分离苏木素(H)和DAB通道：
+
+    OD_c = -log10(I_c / I0)                    （每个通道的光密度）
+    [H, DAB, 残差] = OD · M⁻¹                   （M为染色矩阵）
+
+I 只有256种取值，所以 -log10 预先算成查找表；再把 M⁻¹ 的对应列乘进去，
+每个通道得到一张"像素值 → 该通道对DAB浓度的贡献"的256项表，
+整图的DAB光密度图只需要三次查表和两次加法，没有逐像素的对数运算。
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+# 入射光强（白色背景）
+I0 = 255.0
+
+# 染色矩阵（RGB光密度方向，Ruifrok & Johnston 2001）
+HEMATOXYLIN_RGB = np.array([0.650, 0.704, 0.286])
+DAB_RGB = np.array([0.268, 0.570, 0.776])
+
+# 默认阈值（DAB光密度）
+DEFAULT_DAB_THRESHOLD = 0.15     # 超过即判为DAB阳性像素
+DEFAULT_TISSUE_THRESHOLD = 0.10  # RGB光密度之和超过即判为组织（而不是白色背景）
+
+
+def _stain_matrix() -> np.ndarray:
+    """归一化的3×3染色矩阵（行：H、DAB、残差；列：R、G、B）"""
+    h = HEMATOXYLIN_RGB / np.linalg.norm(HEMATOXYLIN_RGB)
+    d = DAB_RGB / np.linalg.norm(DAB_RGB)
+    residual = np.cross(h, d)
+    residual /= np.linalg.norm(residual)
+    return np.stack([h, d, residual])
+
+
+# 256项光密度查找表：OD_LUT[I] = -log10(max(I, 1) / I0)
+OD_LUT = (-np.log10(np.maximum(np.arange(256), 1) / I0)).astype(np.float32)
+
+# 反卷积矩阵，按 BGR 通道顺序排列行（与 cv2.imread 一致）
+_UNMIX_BGR = np.linalg.inv(_stain_matrix())[::-1]
+
+# 每个通道的查找表：像素值 → 该通道对 H / DAB 浓度的贡献
+HEMATOXYLIN_LUTS = (OD_LUT[None, :] * _UNMIX_BGR[:, 0:1]).astype(np.float32)
+DAB_LUTS = (OD_LUT[None, :] * _UNMIX_BGR[:, 1:2]).astype(np.float32)
+
+
+def deconvolve(image: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    BGR图像 → (苏木素光密度图, DAB光密度图)，均为float32，负值截断为0
+    """
+    b, g, r = image[..., 0], image[..., 1], image[..., 2]
+
+    hematoxylin = HEMATOXYLIN_LUTS[0][b]
+    hematoxylin += HEMATOXYLIN_LUTS[1][g]
+    hematoxylin += HEMATOXYLIN_LUTS[2][r]
+    np.maximum(hematoxylin, 0, out=hematoxylin)
+
+    dab = DAB_LUTS[0][b]
+    dab += DAB_LUTS[1][g]
+    dab += DAB_LUTS[2][r]
+    np.maximum(dab, 0, out=dab)
+
+    return hematoxylin, dab
+
+
+@dataclass
+class StainMeasurement:
+    """
+    基于像素面积的染色统计，可在tile之间直接相加后再换算指标
+    """
+    tissue_pixels: int = 0
+    positive_pixels: int = 0
+    dab_iod: float = 0.0
+    hematoxylin_iod: float = 0.0
+
+    def __add__(self, other: 'StainMeasurement') -> 'StainMeasurement':
+        return StainMeasurement(
+            self.tissue_pixels + other.tissue_pixels,
+            self.positive_pixels + other.positive_pixels,
+            self.dab_iod + other.dab_iod,
+            self.hematoxylin_iod + other.hematoxylin_iod,
+        )
+
+    def to_metrics(self, pixel_to_mm_ratio: float) -> Dict:
+        """换算为面积（mm²）和光密度指标"""
+        pixel_area = pixel_to_mm_ratio ** 2
+        return {
+            'dab_tissue_area_mm2': round(self.tissue_pixels / pixel_area, 4),
+            'dab_tissue_area_pixels': self.tissue_pixels,
+            'dab_positive_area_mm2': round(self.positive_pixels / pixel_area, 4),
+            'dab_positive_area_pixels': self.positive_pixels,
+            'dab_positive_area_ratio': round(
+                self.positive_pixels / self.tissue_pixels * 100 if self.tissue_pixels > 0 else 0, 2
+            ),
+            'dab_iod': round(self.dab_iod, 2),
+            'dab_mean_od': round(self.dab_iod / self.positive_pixels if self.positive_pixels > 0 else 0, 4),
+        }
+
+
+def measure_stains(
+    image: np.ndarray,
+    dab_threshold: float = DEFAULT_DAB_THRESHOLD,
+    tissue_threshold: float = DEFAULT_TISSUE_THRESHOLD,
+    valid_mask: Optional[np.ndarray] = None
+) -> Tuple[StainMeasurement, np.ndarray, np.ndarray]:
+    """
+    一次遍历得到DAB光密度图、阳性面积mask和IOD
+
+    Args:
+        image: BGR图像（整图或tile）
+        dab_threshold: DAB阳性像素的光密度阈值
+        tissue_threshold: 组织像素的RGB光密度之和阈值
+        valid_mask: 只统计mask内的像素（分块分析时用tile的core区域，避免重叠区重复计数）
+
+    Returns:
+        (统计结果, DAB光密度图, 阳性mask)
+    """
+    hematoxylin, dab = deconvolve(image)
+
+    total_od = OD_LUT[image[..., 0]]
+    total_od += OD_LUT[image[..., 1]]
+    total_od += OD_LUT[image[..., 2]]
+    tissue = total_od > tissue_threshold
+    if valid_mask is not None:
+        tissue &= valid_mask
+    positive = tissue & (dab > dab_threshold)
+
+    measurement = StainMeasurement(
+        tissue_pixels=int(np.count_nonzero(tissue)),
+        positive_pixels=int(np.count_nonzero(positive)),
+        dab_iod=float(dab[positive].sum(dtype=np.float64)),
+        hematoxylin_iod=float(hematoxylin[tissue].sum(dtype=np.float64)),
+    )
+    return measurement, dab, positive
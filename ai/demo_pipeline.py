@@ -3,135 +3,615 @@
 展示如何从图像到专业指标
 """
 
+import logging
+import time
+from pathlib import Path
+
 import cv2
 import numpy as np
-from typing import List, Dict, Tuple
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from approximate import estimate_slide
+from batching import ThroughputMeter, iter_batches, pack_crops, unpack_masks
+from cell_masks import CellMasks
+from cell_table import CellTable, GRADE_LABELS
+from color_deconvolution import DEFAULT_DAB_THRESHOLD, StainMeasurement, measure_stains
+from image_split import SplitEntry, load_image
+from label_image import rasterize_labels, label_sums
+from morphometry import fill_morphometry, summarize_morphometry
+from roi_edits import EditSession
+from roi_integrals import RoiIntegrals
+from spatial_index import SpatialIndex
+from tiling import SlideSource, iter_tile_grid, open_slide, tile_size_for_budget
+from streaming import prefetch
+from tracing import NULL_TRACER
+
+logger = logging.getLogger(__name__)
+
+
+# DAB阳性判定的HSV阈值（需要根据实际图像标定）
+DEFAULT_HSV_THRESHOLDS = {
+    'h_min': 10,        # H: 10-30 (黄色到橙棕色)
+    'h_max': 30,
+    's_min': 50,        # S: 50-255 (有饱和度，不是灰色)
+    'v_min': 50,        # V: 50-200 (中等亮度)
+    'v_max': 200,
+    'v_strong': 100,    # V < 100 → 强阳性
+    'v_moderate': 150,  # V < 150 → 中度阳性，否则弱阳性
+}
+
+# 分块分析预读的批次数；同时在内存中的批次还包括正在分析的一批和预读线程手中的一批
+_TILE_PREFETCH_DEPTH = 1
+_TILE_BATCHES_IN_FLIGHT = _TILE_PREFETCH_DEPTH + 2
 
 
 class PathologyQuantitativeAnalyzer:
     """病理图像定量分析器"""
 
-    def __init__(self, yolo_model, segmentation_model, pixel_to_mm_ratio=350):
+    def __init__(
+        self,
+        yolo_model,
+        segmentation_model,
+        pixel_to_mm_ratio=350,
+        detect_batch_size=8,
+        segment_batch_size=64,
+        crop_size=64,
+        hsv_thresholds=None,
+        result_cache=None,
+        stain_deconvolution=False,
+        dab_threshold=DEFAULT_DAB_THRESHOLD,
+        tracer=None
+    ):
         """
         Args:
             yolo_model: YOLO细胞检测模型
             segmentation_model: MobileNet分割模型
             pixel_to_mm_ratio: 像素到毫米的转换比例（取决于放大倍数）
+            detect_batch_size: 每批送入检测模型的图像/tile数
+            segment_batch_size: 每批送入分割模型的细胞crop数
+            crop_size: 细胞crop统一缩放+填充后的边长（分割模型输入尺寸）
+            hsv_thresholds: DAB阳性判定阈值，缺省项使用 DEFAULT_HSV_THRESHOLDS
+            result_cache: result_cache.ResultCache，命中时 analyze() 跳过所有模型
+            stain_deconvolution: 为True时额外做整图H-DAB颜色反卷积，
+                指标中增加基于像素面积的 dab_* 项（阳性面积、IOD等）
+            dab_threshold: DAB阳性像素的光密度阈值
+            tracer: tracing.Tracer，记录每个阶段的耗时/CPU/内存/数量；缺省为不记录的 NULL_TRACER
         """
         self.yolo_model = yolo_model
         self.segmentation_model = segmentation_model
         self.pixel_to_mm_ratio = pixel_to_mm_ratio
+        self.detect_batch_size = detect_batch_size
+        self.segment_batch_size = segment_batch_size
+        self.crop_size = crop_size
+        self.hsv_thresholds = {**DEFAULT_HSV_THRESHOLDS, **(hsv_thresholds or {})}
+        self.result_cache = result_cache
+        self.stain_deconvolution = stain_deconvolution
+        self.dab_threshold = dab_threshold
+        self.tracer = tracer or NULL_TRACER
+        # 检测/分割的累计吞吐（始终开启，不依赖 tracer）
+        self.throughput = ThroughputMeter()
+
+    def config_fingerprint(self) -> Dict[str, Any]:
+        """影响分析结果的配置（用作结果缓存键的一部分）"""
+        return {
+            'detector': self._model_identifier(self.yolo_model),
+            'segmenter': self._model_identifier(self.segmentation_model),
+            'crop_size': self.crop_size,
+            'pixel_to_mm_ratio': self.pixel_to_mm_ratio,
+            'hsv_thresholds': self.hsv_thresholds,
+            'stain_deconvolution': self.stain_deconvolution,
+            'dab_threshold': self.dab_threshold,
+        }
 
-    def analyze(self, image_path: str) -> Dict:
+    @staticmethod
+    def _model_identifier(model) -> Optional[str]:
+        """模型标识：优先使用 model_id / ckpt_path 属性，否则用类名"""
+        if model is None:
+            return None
+        for attr in ('model_id', 'ckpt_path'):
+            value = getattr(model, attr, None)
+            if value:
+                return str(value)
+        return f"{type(model).__module__}.{type(model).__qualname__}"
+
+    def analyze(self, image_path: Union[str, np.ndarray, SplitEntry], return_cells: bool = False):
         """
         完整分析流程
 
+        配置了 result_cache 时，先按 (图像内容哈希, 分析器配置) 查缓存，
+        命中则直接返回缓存的指标和细胞表。
+
+        Args:
+            image_path: 图像路径、已解码的BGR图像，或分割清单记录（分析其原始图像半边）
+            return_cells: 为True时返回 (指标, 细胞表)
+
         Returns:
             包含所有定量指标的字典
         """
-        # 加载图像
-        image = cv2.imread(image_path)
+        trace = self.tracer.start_trace(self._trace_name(image_path))
+
+        cache_key, cached = self._lookup_cache(image_path, trace)
+        if cached is not None:
+            trace.finish()
+            metrics, cells = cached
+            return (metrics, cells) if return_cells else metrics
+
+        image = self._load_stage(image_path, trace)
+        cells = self._infer_stage(image, trace)
+        metrics = self._measure_stage(image, cells, trace)
+        self._store_cache(cache_key, metrics, cells, trace)
 
+        trace.finish()
+        logger.info("吞吐: %s", self.throughput.summary())
+        return (metrics, cells) if return_cells else metrics
+
+    def analyze_batch(self, images: List[np.ndarray], return_cells: bool = False) -> List:
+        """
+        一次分析多张已解码的图像（例如推理服务合并的并发请求）
+
+        检测按 detect_batch_size 合批调用模型，分割和指标计算逐图执行；
+        整批共用一条追踪记录。返回与 images 顺序一致的指标列表
+        （return_cells 为True时每项为 (指标, 细胞表)）。
+        """
+        trace = self.tracer.start_trace(None)
+        with trace.stage('detect', pixels=sum(image.shape[0] * image.shape[1] for image in images)) as counts:
+            tables = self._detect_cells_batch(images)
+            counts['cells_out'] = sum(len(cells) for cells in tables)
+
+        results = []
+        for image, cells in zip(images, tables):
+            with trace.stage('segment', cells_in=len(cells)) as counts:
+                self._segment_cells(image, cells)
+                counts['mask_pixels'] = int(cells.area_pixels.sum())
+            metrics = self._measure_stage(image, cells, trace)
+            results.append((metrics, cells) if return_cells else metrics)
+
+        trace.finish()
+        return results
+
+    # analyze() 拆成以下几个阶段，streaming.stream_analyze 在不同线程中流水线执行它们
+
+    def _lookup_cache(self, source, trace) -> Tuple[Optional[Tuple[str, str]], Optional[Tuple[Dict, CellTable]]]:
+        """返回 (缓存键, 命中的 (指标, 细胞表))；未配置缓存时均为None"""
+        cache_key = self._cache_key(source)
+        if cache_key is None:
+            return None, None
+        with trace.stage('cache_lookup') as counts:
+            cached = self.result_cache.get(cache_key)
+            counts['hits'] = int(cached is not None)
+        if cached is not None:
+            logger.info("命中结果缓存，跳过模型推理")
+        return cache_key, cached
+
+    def _store_cache(self, cache_key, metrics: Dict, cells: CellTable, trace) -> None:
+        if cache_key is not None:
+            with trace.stage('cache_store'):
+                self.result_cache.put(cache_key, metrics, cells)
+
+    def _load_stage(self, source, trace) -> np.ndarray:
+        """加载图像（路径、数组或分割清单记录）"""
+        with trace.stage('load') as counts:
+            image = load_image(source)
+            counts['pixels'] = image.shape[0] * image.shape[1]
+        return image
+
+    def _infer_stage(self, image: np.ndarray, trace) -> CellTable:
+        """Step 1-2：模型推理（检测 + 分割）"""
         # Step 1: YOLO检测细胞
-        print("Step 1: 检测细胞...")
-        cells = self._detect_cells(image)
-        print(f"  检测到 {len(cells)} 个细胞")
+        logger.info("Step 1: 检测细胞...")
+        with trace.stage('detect', pixels=image.shape[0] * image.shape[1]) as counts:
+            # 所有阶段共用同一张列式细胞表，原地写入各自的列
+            cells = self._detect_cells(image)
+            counts['cells_out'] = len(cells)
+        logger.info("  检测到 %d 个细胞", len(cells))
 
         # Step 2: MobileNet精确分割
-        print("Step 2: 精确分割细胞...")
-        cell_masks = self._segment_cells(image, cells)
+        logger.info("Step 2: 精确分割细胞...")
+        with trace.stage('segment', cells_in=len(cells)) as counts:
+            self._segment_cells(image, cells)
+            counts['mask_pixels'] = int(cells.area_pixels.sum())
+        return cells
 
+    def _measure_stage(self, image: np.ndarray, cells: CellTable, trace) -> Dict:
+        """Step 3-6：颜色分级和指标计算（纯NumPy，不需要模型）"""
         # Step 3: 颜色分析（阳性等级分类）⭐关键步骤⭐
-        print("Step 3: 颜色分析和阳性分类...")
-        cell_data = self._classify_cells(image, cell_masks)
+        logger.info("Step 3: 颜色分析和阳性分类...")
+        with trace.stage('classify', cells_in=len(cells), pixels=image.shape[0] * image.shape[1]) as counts:
+            self._classify_cells(image, cells)
+            counts['cells_out'] = int(np.count_nonzero(cells.grade))
 
         # Step 4: 计算IOD
-        print("Step 4: 计算光密度...")
-        total_iod = self._calculate_total_iod(image, cell_data)
+        logger.info("Step 4: 计算光密度...")
+        with trace.stage('iod', cells_in=len(cells)):
+            total_iod = self._calculate_total_iod(cells)
 
         # Step 5: 计算面积
-        print("Step 5: 计算面积...")
-        areas = self._calculate_areas(cell_data)
+        logger.info("Step 5: 计算面积...")
+        with trace.stage('areas', cells_in=len(cells)):
+            areas = self._calculate_areas(cells)
 
         # Step 6: 计算专业指标
-        print("Step 6: 计算病理学指标...")
-        metrics = self._calculate_metrics(cell_data, areas, total_iod)
+        logger.info("Step 6: 计算病理学指标...")
+        with trace.stage('metrics', cells_in=len(cells)):
+            metrics = self._calculate_metrics(cells, areas, total_iod)
+
+        if self.stain_deconvolution:
+            with trace.stage('stains', pixels=image.shape[0] * image.shape[1]):
+                stains, _, _ = measure_stains(image, self.dab_threshold)
+                metrics.update(stains.to_metrics(self.pixel_to_mm_ratio))
+        return metrics
 
+    @staticmethod
+    def _trace_name(source) -> Optional[str]:
+        """追踪记录的名称：图像文件名 / 分割清单记录名；内存中的数组返回None（由追踪器编号）"""
+        if isinstance(source, SplitEntry):
+            return source.name
+        if isinstance(source, np.ndarray):
+            return None
+        return Path(str(source)).stem
+
+    def _cache_key(self, source):
+        """结果缓存键；未配置缓存或输入是内存中的数组时返回None"""
+        if self.result_cache is None or isinstance(source, np.ndarray):
+            return None
+        config = self.config_fingerprint()
+        if isinstance(source, SplitEntry):
+            # 同一源文件的不同裁剪区域分别缓存
+            return self.result_cache.key_for(source.source, {**config, 'crop': source.original})
+        return self.result_cache.key_for(str(source), config)
+
+    def analyze_tiled(
+        self,
+        slide: Union[str, np.ndarray, SlideSource],
+        tile_budget_mb: float = 1024,
+        overlap: int = 64,
+        cell_writer=None,
+        sample: Optional[str] = None
+    ) -> Dict:
+        """
+        分块分析全切片图像（内存占用由tile预算决定，与切片大小无关）
+
+        每个tile独立运行 检测 → 分割 → 颜色分类，细胞按中心点归属到唯一的tile
+        （去除重叠区的重复细胞），坐标换算到全局后合并，最后统一计算面积和指标。
+        返回的指标字典与 analyze() 相同。
+
+        检测按 detect_batch_size 个tile一批进行，下一批tile在后台线程中预读。
+        同时在内存中的tile最多 3 × detect_batch_size 个（正在分析、预读队列中、
+        预读线程正在读取的各一批），tile边长按 tile_budget_mb 平分给这些tile计算，
+        峰值内存不超过 tile_budget_mb（不含细胞表本身）。
+
+        Args:
+            slide: 切片路径、ndarray，或 tiling.open_slide 返回的切片对象
+            tile_budget_mb: 所有在途tile的总内存预算（MB）
+            overlap: 相邻tile重叠宽度（像素），应大于最大细胞直径
+            cell_writer: cell_export.CellWriter，给定时每个tile的细胞分析完立即写出
+            sample: 写出时的样本名，缺省为切片文件名（不含扩展名）
+        """
+        source = slide if hasattr(slide, 'read') else open_slide(slide)
+        tile_size = self._tile_size(tile_budget_mb, overlap)
+        if sample is None and source is not slide:
+            sample = self._trace_name(slide)
+        logger.info("分块分析: %dx%d, tile %dpx, 重叠 %dpx", source.width, source.height, tile_size, overlap)
+
+        trace = self.tracer.start_trace(self._trace_name(slide) if source is not slide else None)
+        tiles = list(iter_tile_grid(source.width, source.height, tile_size, overlap))
+        parts = []
+        stains = StainMeasurement()
+
+        def read_batches():
+            # 在后台线程中预读下一批tile，与当前批次的推理重叠
+            for batch in iter_batches(len(tiles), self.detect_batch_size):
+                batch_tiles = tiles[batch]
+                with trace.stage('load', tiles=len(batch_tiles)) as counts:
+                    images = [source.read(t.x, t.y, t.w, t.h) for t in batch_tiles]
+                    counts['pixels'] = sum(image.shape[0] * image.shape[1] for image in images)
+                yield batch_tiles, images
+
+        for batch_tiles, images in prefetch(read_batches(), depth=_TILE_PREFETCH_DEPTH):
+            with trace.stage('detect', pixels=sum(t.w * t.h for t in batch_tiles)) as counts:
+                detections = self._detect_cells_batch(images)
+                counts['cells_out'] = sum(len(cells) for cells in detections)
+
+            for tile, image, cells in zip(batch_tiles, images, detections):
+                if self.stain_deconvolution:
+                    with trace.stage('stains', pixels=tile.w * tile.h):
+                        # 像素级统计只计core区域，重叠区不重复计数
+                        stains += measure_stains(image, self.dab_threshold, valid_mask=tile.core_mask())[0]
+                cells = self._analyze_tile(tile, image, cells, trace)
+                if cell_writer is not None:
+                    with trace.stage('export', cells_in=len(cells)):
+                        cell_writer.write(cells, sample)
+                parts.append(cells)
+
+        cells = CellTable.concat(parts)
+        logger.info("  共 %d 个tile，检测到 %d 个细胞", len(parts), len(cells))
+
+        with trace.stage('metrics', cells_in=len(cells)):
+            # IOD已随颜色统计逐tile算出，这里不再需要图像
+            total_iod = self._calculate_total_iod(cells)
+            areas = self._calculate_areas(cells)
+            metrics = self._calculate_metrics(cells, areas, total_iod)
+            if self.stain_deconvolution:
+                metrics.update(stains.to_metrics(self.pixel_to_mm_ratio))
+        trace.finish()
+        logger.info("吞吐: %s", self.throughput.summary())
         return metrics
 
-    def _detect_cells(self, image: np.ndarray) -> List[Dict]:
+    def analyze_approximate(
+        self,
+        slide: Union[str, np.ndarray, SlideSource],
+        tile_size: int = 1024,
+        confidence: float = 0.95,
+        **options
+    ) -> Dict:
         """
-        Step 1: 使用YOLO检测所有细胞
+        快速估计模式（分诊用）：分层抽样组织tile，只对样本运行逐细胞流程
 
-        这里YOLO只做一件事：找到细胞的位置
+        阳性率、H-Score、IRS、阳性密度附带 bootstrap 置信区间（metrics['approximate']['ci']），
+        IRS/PP等级在置信水平下确定后提前停止。其余参数见 approximate.estimate_slide。
+
+        Args:
+            slide: 切片路径、ndarray，或 tiling.open_slide 返回的切片对象
+            tile_size: 抽样tile边长（像素）
+            confidence: 置信水平
         """
-        # 实际使用：
-        # results = self.yolo_model.predict(image)
-        # cells = [{'bbox': box.xywh, 'conf': box.conf} for box in results[0].boxes]
+        return estimate_slide(self, slide, tile_size=tile_size, confidence=confidence, **options)
 
-        # 演示用模拟数据
-        cells = [
-            {'bbox': [100, 200, 30, 30], 'confidence': 0.95},
-            {'bbox': [150, 220, 28, 32], 'confidence': 0.92},
-            # ... 实际会有数千个
-        ]
+    def _tile_size(self, tile_budget_mb: float, overlap: int) -> int:
+        """analyze_tiled 的tile边长：总预算平分给所有在途的tile"""
+        return tile_size_for_budget(tile_budget_mb / (_TILE_BATCHES_IN_FLIGHT * self.detect_batch_size), overlap)
+
+    def _analyze_tile(self, tile, image: np.ndarray, cells: CellTable, trace) -> CellTable:
+        """
+        对一个tile的检测结果做分割和颜色分类，返回中心点在core区域内的细胞（全局坐标）
+        """
+        with trace.stage('segment', cells_in=len(cells)):
+            self._segment_cells(image, cells)
+        with trace.stage('classify', cells_in=len(cells), pixels=tile.w * tile.h):
+            self._classify_cells(image, cells)
+
+        with trace.stage('dedupe', cells_in=len(cells)) as counts:
+            # 换算到全局坐标，只保留中心点在本tile core区域内的细胞
+            cells.bbox[:, 0] += tile.x
+            cells.bbox[:, 1] += tile.y
+            cells = cells.take(tile.owns(cells.centroids()))
+            counts['cells_out'] = len(cells)
+
+        # mask只在tile内使用，合并时丢弃
+        cells.masks = CellMasks.empty(len(cells))
         return cells
 
-    def _segment_cells(self, image: np.ndarray, cells: List[Dict]) -> List[Dict]:
+    def regrade(self, cells: CellTable, hsv_thresholds: Optional[Dict] = None) -> Dict:
         """
-        Step 2: 使用MobileNet对每个细胞进行精确分割
+        用新的HSV阈值对已保存的细胞颜色统计重新分级，不重新检测/分割
 
-        MobileNet做两件事：
-        1. 得到细胞的精确轮廓（mask）
-        2. 计算细胞面积（像素数）
+        只依赖细胞表中的 mean_h/mean_s/mean_v、area_pixels 和 iod 列，
+        因此可以直接作用于 CellTable.load() 读回的表或结果缓存中的表。
+        cells.grade 会被原地更新。
+
+        Args:
+            cells: 带颜色统计的细胞表
+            hsv_thresholds: 新阈值（缺省项沿用本分析器的阈值）
+
+        Returns:
+            与 analyze() 相同格式的指标字典
+        """
+        thresholds = {**self.hsv_thresholds, **(hsv_thresholds or {})}
+        cells.grade[:] = self._grade_cells(cells.mean_h, cells.mean_s, cells.mean_v, thresholds)
+
+        total_iod = self._calculate_total_iod(cells)
+        areas = self._calculate_areas(cells)
+        return self._calculate_metrics(cells, areas, total_iod)
+
+    def spatial_index(
+        self,
+        cells: CellTable,
+        bucket_um: float = 50,
+        image_size: Optional[Tuple[int, int]] = None
+    ) -> SpatialIndex:
+        """
+        为细胞质心建立空间索引（µm单位），用于邻域计数、k近邻和密度图
+
+        同样适用于 analyze(..., return_cells=True)、analyze_tiled 或 CellTable.load() 得到的细胞表。
+
+        Args:
+            cells: 细胞表
+            bucket_um: 网格桶边长（µm）
+            image_size: (宽, 高)（像素），缺省按质心范围
+        """
+        return SpatialIndex.from_cells(cells, self.pixel_to_mm_ratio, bucket_um, image_size)
+
+    def roi_integrals(
+        self,
+        cells: CellTable,
+        image_size: Optional[Tuple[int, int]] = None,
+        bin_px: int = 16
+    ) -> RoiIntegrals:
+        """
+        建立各等级细胞数、面积和IOD的积分图，之后任意矩形ROI的指标和热点搜索都是O(1)/O(方格数)
+
+        Args:
+            cells: 已分级的细胞表（regrade 之后需要重新建立）
+            image_size: (宽, 高)（像素），缺省按质心范围
+            bin_px: 方格边长（像素），ROI边界对齐到方格
+        """
+        return RoiIntegrals(self, cells, image_size, bin_px)
+
+    def edit_session(
+        self,
+        cells: CellTable,
+        image_size: Optional[Tuple[int, int]] = None,
+        tile_size: int = 512
+    ) -> EditSession:
+        """
+        开始一次人工修正：排除/改判多边形区域内的细胞，增量返回修正后的指标
+
+        Args:
+            cells: 已分级的细胞表（改判会原地修改 cells.grade）
+            image_size: (宽, 高)（像素），缺省按质心范围
+            tile_size: 汇总tile边长（像素）
+        """
+        return EditSession(self, cells, image_size, tile_size)
+
+    def _detect_cells(self, image: np.ndarray) -> CellTable:
+        """
+        Step 1: 使用YOLO检测所有细胞
+
+        这里YOLO只做一件事：找到细胞的位置
         """
-        cell_masks = []
+        return self._detect_cells_batch([image])[0]
 
-        for cell in cells:
-            x, y, w, h = cell['bbox']
+    def _detect_cells_batch(self, images: List[np.ndarray]) -> List[CellTable]:
+        """
+        按 detect_batch_size 分批检测多张图像/tile，每张图返回一张细胞表
+        """
+        start = time.perf_counter()
+        tables = []
+        for batch in iter_batches(len(images), self.detect_batch_size):
+            if self.yolo_model is None:
+                # 演示用模拟数据
+                tables.extend(self._demo_detections() for _ in images[batch])
+                continue
 
-            # 裁剪细胞区域
-            cell_crop = image[int(y):int(y+h), int(x):int(x+w)]
+            # 实际使用：一次predict处理一整批
+            results = self.yolo_model.predict(images[batch])
+            tables.extend(self._cells_from_result(result) for result in results)
 
-            # 实际使用：
-            # mask = self.segmentation_model.predict(cell_crop)
+        self.throughput.record('detect', sum(len(t) for t in tables), time.perf_counter() - start)
+        return tables
 
-            # 演示用模拟mask
-            mask = np.random.rand(int(h), int(w)) > 0.3
+    @staticmethod
+    def _cells_from_result(result) -> CellTable:
+        """
+        把检测模型的单张图结果转换为细胞表
 
-            cell_masks.append({
-                'bbox': cell['bbox'],
-                'mask': mask,
-                'area_pixels': np.sum(mask)
-            })
+        支持ultralytics的Results对象（result.boxes.xyxy / .conf），
+        或 (xyxy数组, 置信度数组) 二元组。
+        """
+        if hasattr(result, 'boxes'):
+            xyxy = result.boxes.xyxy.cpu().numpy()
+            conf = result.boxes.conf.cpu().numpy()
+        else:
+            xyxy, conf = result
+        xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+
+        # [x0, y0, x1, y1] → [x, y, w, h]
+        bboxes = np.concatenate([xyxy[:, :2], xyxy[:, 2:] - xyxy[:, :2]], axis=1)
+        return CellTable.from_detections(bboxes, conf)
+
+    @staticmethod
+    def _demo_detections() -> CellTable:
+        """演示用模拟检测结果"""
+        return CellTable.from_detections(
+            [
+                [100, 200, 30, 30],
+                [150, 220, 28, 32],
+                # ... 实际会有数千个
+            ],
+            [0.95, 0.92],
+        )
 
-        return cell_masks
+    def _segment_cells(self, image: np.ndarray, cells: CellTable) -> CellTable:
+        """
+        Step 2: 使用MobileNet对每个细胞进行精确分割
+
+        MobileNet做两件事：
+        1. 得到细胞的精确轮廓（mask）
+        2. 计算细胞面积（像素数）
+
+        细胞crop被统一缩放+填充到 crop_size，按 segment_batch_size 分批预测，
+        输出mask再还原到各自bbox的尺寸。结果原地写入 cells.masks（bit-packed）和 cells.area_pixels。
+        """
+        start = time.perf_counter()
+        bboxes = cells.bbox_pixels()
+        parts = []
+
+        for batch in iter_batches(len(cells), self.segment_batch_size):
+            if self.segmentation_model is None:
+                # 演示用模拟mask
+                masks = [
+                    np.random.rand(y1 - y0, x1 - x0) > 0.3
+                    for x0, y0, x1, y1 in bboxes[batch]
+                ]
+            else:
+                crops, geometry = pack_crops(image, bboxes[batch], self.crop_size)
+                masks = unpack_masks(self.segmentation_model.predict(crops), geometry)
+
+            # 每批立即bit-pack，全部细胞的bool mask不会同时存在
+            parts.append(CellMasks.from_masks(masks))
+
+        cells.masks = CellMasks.concat(parts)
+        cells.area_pixels[:] = cells.masks.areas()
+        self.throughput.record('segment', len(cells), time.perf_counter() - start)
+        return cells
 
-    def _classify_cells(self, image: np.ndarray, cell_masks: List[Dict]) -> List[Dict]:
+    def _classify_cells(self, image: np.ndarray, cells: CellTable) -> CellTable:
         """
         Step 3: HSI颜色分析，分类阳性等级
 
         ⭐这是最关键的一步⭐
         将每个细胞分类为：阴性(0)/弱阳性(1)/中度(2)/强阳性(3)
+
+        平均HSV写入 cells.mean_h/mean_s/mean_v，等级写入 cells.grade。
+        同一次遍历还会得到每个细胞的OD总和，写入 cells.iod 供Step 4使用。
+        """
+        self._measure_cells(image, cells)
+        cells.grade[:] = self._grade_cells(cells.mean_h, cells.mean_s, cells.mean_v, self.hsv_thresholds)
+        return cells
+
+    def _measure_cells(self, image: np.ndarray, cells: CellTable) -> CellTable:
         """
-        cell_data = []
+        整图一次性计算每个细胞的平均HSV和OD总和，以及形态参数（见 morphometry）
+
+        图像只转换一次HSV和光密度，所有mask栅格化到标签图后
+        用bincount按细胞归约，代替逐细胞的裁剪 + cvtColor。
+        """
+        # 转换到HSV颜色空间（接近HSI），以及光密度
+        # OD = -log10(透射率) ≈ 255 - 灰度值
+        hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        od = 255 - gray
+
+        layers = rasterize_labels(image.shape, cells.bbox_pixels(), cells.masks)
+        pixel_count, sum_h, sum_s, sum_v, sum_od = label_sums(
+            layers, len(cells), hsv[..., 0], hsv[..., 1], hsv[..., 2], od
+        )
+
+        # 空mask的细胞保持HSV为0，会被判为阴性
+        denom = np.maximum(pixel_count, 1)
+        cells.mean_h[:] = sum_h / denom
+        cells.mean_s[:] = sum_s / denom
+        cells.mean_v[:] = sum_v / denom
+        cells.iod[:] = sum_od
 
-        for cell in cell_masks:
-            x, y, w, h = cell['bbox']
+        # 形态参数（周长、圆度、椭圆轴）复用同一张标签图
+        fill_morphometry(cells, layers)
+        return cells
 
-            # 提取细胞区域
-            cell_region = image[int(y):int(y+h), int(x):int(x+w)]
+    @staticmethod
+    def _grade_cells(
+        mean_h: np.ndarray,
+        mean_s: np.ndarray,
+        mean_v: np.ndarray,
+        thresholds: Dict = DEFAULT_HSV_THRESHOLDS
+    ) -> np.ndarray:
+        """
+        根据平均HSV批量判断阳性等级（阈值含义见 DEFAULT_HSV_THRESHOLDS）
 
-            # 颜色分析
-            grade, label = self._classify_cell_positivity(cell_region, cell['mask'])
+        Returns:
+            int8数组，0/1/2/3
+        """
+        t = thresholds
 
-            cell_data.append({
-                **cell,
-                'grade': grade,
-                'label': label
-            })
+        # 判断是否为棕色系（DAB染色）
+        is_brown = (
+            (mean_h >= t['h_min']) & (mean_h <= t['h_max']) & (mean_s >= t['s_min']) &
+            (mean_v >= t['v_min']) & (mean_v <= t['v_max'])
+        )
 
-        return cell_data
+        # 是棕色系，根据明度V判断强度：越暗等级越高
+        grade = np.where(mean_v < t['v_strong'], 3, np.where(mean_v < t['v_moderate'], 2, 1))
+        return np.where(is_brown, grade, 0).astype(np.int8)
 
     def _classify_cell_positivity(
         self,
@@ -170,62 +650,30 @@ class PathologyQuantitativeAnalyzer:
         # H: 10-30 (黄色到橙棕色)
         # S: 50-255 (有饱和度，不是灰色)
         # V: 50-200 (中等亮度)
-
-        is_brown = (10 <= avg_h <= 30) and (avg_s >= 50) and (50 <= avg_v <= 200)
-
-        if not is_brown:
-            # 蓝紫色（苏木素）或其他颜色 → 阴性
-            return 0, 'negative'
-
-        # 是棕色系，根据明度V判断强度
-        if avg_v < 100:
-            # 深棕色 → 强阳性
-            return 3, 'strong_positive'
-        elif avg_v < 150:
-            # 中等棕色 → 中度阳性
-            return 2, 'moderate_positive'
-        else:
-            # 淡棕/黄色 → 弱阳性
-            return 1, 'weak_positive'
-
-    def _calculate_total_iod(
-        self,
-        image: np.ndarray,
-        cell_data: List[Dict]
-    ) -> float:
+        # 非棕色系（蓝紫色苏木素或其他颜色）→ 阴性
+        # 棕色系根据明度V判断强度：
+        # V<100 深棕色 → 强阳性；V<150 中等棕色 → 中度阳性；其余淡棕/黄色 → 弱阳性
+        grade = int(self._grade_cells(
+            np.array([avg_h]), np.array([avg_s]), np.array([avg_v]), self.hsv_thresholds
+        )[0])
+        return grade, GRADE_LABELS[grade]
+
+    def _calculate_total_iod(self, cells: CellTable) -> float:
         """
         Step 4: 计算总IOD（累积光密度）
 
         IOD = Integrated Optical Density
         反映染色的总强度
-        """
-        total_iod = 0
 
-        # 转为灰度
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
-        for cell in cell_data:
-            if cell['grade'] == 0:
-                # 阴性细胞不计入IOD
-                continue
-
-            x, y, w, h = cell['bbox']
-            mask = cell['mask']
-
-            # 提取细胞区域
-            cell_gray = gray[int(y):int(y+h), int(x):int(x+w)]
-
-            # 计算光密度
-            # OD = -log10(透射率) ≈ 255 - 像素值
-            cell_pixels = cell_gray[mask > 0]
-            optical_density = 255 - cell_pixels
-            cell_iod = np.sum(optical_density)
-
-            total_iod += cell_iod
+        每个细胞的IOD已在Step 3（_measure_cells）中随颜色统计一起算出，
+        这里只汇总阳性细胞的IOD。
+        """
+        # 阴性细胞不计入IOD
+        total_iod = cells.iod[cells.grade > 0].sum()
 
         return total_iod
 
-    def _calculate_areas(self, cell_data: List[Dict]) -> Dict:
+    def _calculate_areas(self, cells: CellTable) -> Dict:
         """
         Step 5: 计算面积
 
@@ -235,15 +683,15 @@ class PathologyQuantitativeAnalyzer:
         - 像素面积 → mm²转换
         """
         # 组织总面积（像素）
-        total_pixels = sum(cell['area_pixels'] for cell in cell_data)
+        total_pixels = int(cells.area_pixels.sum())
 
         # 阳性细胞总面积（像素）
-        positive_pixels = sum(
-            cell['area_pixels']
-            for cell in cell_data
-            if cell['grade'] > 0
-        )
+        positive_pixels = int(cells.area_pixels[cells.grade > 0].sum())
+
+        return self._areas_from_pixels(total_pixels, positive_pixels)
 
+    def _areas_from_pixels(self, total_pixels: int, positive_pixels: int) -> Dict:
+        """像素面积 → 面积字典（ROI查询直接由积分图的像素和调用）"""
         # 转换为mm²
         # 公式：面积(mm²) = 面积(像素) / (像素/mm)²
         total_mm2 = total_pixels / (self.pixel_to_mm_ratio ** 2)
@@ -258,7 +706,7 @@ class PathologyQuantitativeAnalyzer:
 
     def _calculate_metrics(
         self,
-        cell_data: List[Dict],
+        cells: CellTable,
         areas: Dict,
         total_iod: float
     ) -> Dict:
@@ -267,12 +715,31 @@ class PathologyQuantitativeAnalyzer:
 
         这一步完全是数学公式，不需要AI模型
         """
+        metrics = self._grade_metrics(cells.grade_counts(), areas, total_iod)
+
+        # 细胞核形态（大小、圆度、长宽比）
+        metrics.update(summarize_morphometry(cells, self.pixel_to_mm_ratio))
+        return metrics
+
+    def _grade_metrics(
+        self,
+        grade_counts: np.ndarray,
+        areas: Dict,
+        total_iod: float
+    ) -> Dict:
+        """
+        由各等级细胞数、面积和IOD计算指标（阳性率、H-Score、IRS、密度、平均光密度）
+
+        只依赖汇总量，整图和 roi_integrals 的任意矩形ROI共用同一套公式。
+
+        Args:
+            grade_counts: [阴性, 弱阳性, 中度阳性, 强阳性] 细胞数
+            areas: _calculate_areas / _areas_from_pixels 的结果
+            total_iod: 阳性细胞IOD总和
+        """
         # 统计各等级细胞数量
-        total_cells = len(cell_data)
-        negative_count = sum(1 for c in cell_data if c['grade'] == 0)
-        weak_count = sum(1 for c in cell_data if c['grade'] == 1)
-        moderate_count = sum(1 for c in cell_data if c['grade'] == 2)
-        strong_count = sum(1 for c in cell_data if c['grade'] == 3)
+        negative_count, weak_count, moderate_count, strong_count = (int(round(n)) for n in grade_counts)
+        total_cells = negative_count + weak_count + moderate_count + strong_count
         positive_count = weak_count + moderate_count + strong_count
 
         # 1. 阳性细胞比率 (%)
@@ -320,7 +787,7 @@ class PathologyQuantitativeAnalyzer:
         mean_density = mean_density / 100000
 
         # 返回完整指标（对照文档格式）
-        return {
+        metrics = {
             # 原始数据
             'total_cells': total_cells,
             'weak_positive_cells': weak_count,
@@ -345,12 +812,14 @@ class PathologyQuantitativeAnalyzer:
             'si': SI,
             'pp': PP
         }
+        return metrics
 
 
 # ===== 使用示例 =====
 
 def main():
     """演示完整流程"""
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
 
     # 初始化分析器
     # yolo_model = YOLO('yolov8n.pt')  # 实际使用
@@ -0,0 +1,206 @@
+"""
+左右对比图分割
+
+原始数据是"左：原始切片 | 右：标注效果图"拼接的图片，中间有一条分隔线。
+分隔线有两种样式：
+- gray：灰色竖线（三个通道都在 [200, 230) 以内）
+- white：白色或低方差的浅色竖线
+
+分隔线位置通过对中心附近整个搜索带做一次按列归约得到，不再逐列循环。
+
+除了把左右两半重新编码写盘，也可以只输出一个分割清单（manifest，JSONL）：
+每行记录源文件、分隔线列号和两半的裁剪矩形。下游读取时只解码一次源文件，
+两半都是同一块内存上的NumPy视图，没有额外的磁盘占用和JPEG有损重编码。
+"""
+
+import json
+import os
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+
+SEAM_STYLES = ('auto', 'gray', 'white')
+
+# 各样式在图像中心两侧的搜索半径（像素）
+SEARCH_RADIUS = {'gray': 50, 'white': 100}
+
+
+def _search_band(width: int, radius: int) -> Tuple[int, int]:
+    mid = width // 2
+    return max(mid - radius, 0), min(mid + radius, width)
+
+
+def _first_true(hits: np.ndarray) -> Optional[int]:
+    """第一个为True的位置，没有则返回None"""
+    return int(np.argmax(hits)) if hits.any() else None
+
+
+# 灰色分隔线的通道值范围 [低, 高)
+# 原脚本写的是 abs(col - 200) < 30，但 col 是uint8，200以下的值相减后回绕成大数，
+# 实际只接受 200-229；已有的分割结果都是按这个范围得到的，这里保持不变
+GRAY_SEAM_RANGE = (200, 230)
+
+
+def _find_gray_seam(image: np.ndarray) -> Optional[int]:
+    """灰色竖线：超过一半像素的三个通道都在 GRAY_SEAM_RANGE 以内的第一列"""
+    height, width = image.shape[:2]
+    lo, hi = _search_band(width, SEARCH_RADIUS['gray'])
+    band = image[:, lo:hi]
+
+    gray_pixels = np.all((band >= GRAY_SEAM_RANGE[0]) & (band < GRAY_SEAM_RANGE[1]), axis=2)
+    hits = gray_pixels.sum(axis=0) > height * 0.5
+    offset = _first_true(hits)
+    return None if offset is None else lo + offset
+
+
+def _find_white_seam(image: np.ndarray) -> Optional[int]:
+    """白色/浅色竖线：整列都 > 180，或整列标准差 < 10 且均值 > 150 的第一列"""
+    width = image.shape[1]
+    lo, hi = _search_band(width, SEARCH_RADIUS['white'])
+    band = image[:, lo:hi]
+
+    all_bright = band.min(axis=(0, 2)) > 180
+    flat = (band.std(axis=(0, 2)) < 10) & (band.mean(axis=(0, 2)) > 150)
+    offset = _first_true(all_bright | flat)
+    return None if offset is None else lo + offset
+
+
+def find_seam(image: np.ndarray, style: str = 'auto') -> int:
+    """
+    找到分隔线所在的列
+
+    Args:
+        image: BGR图像
+        style: 'gray' / 'white' / 'auto'（先找灰线，再找白线）
+
+    Returns:
+        分隔线列号；找不到时返回图像中线
+    """
+    if style not in SEAM_STYLES:
+        raise ValueError(f"未知的分隔线样式: {style}（可选: {', '.join(SEAM_STYLES)}）")
+
+    finders = {'gray': (_find_gray_seam,), 'white': (_find_white_seam,),
+               'auto': (_find_gray_seam, _find_white_seam)}[style]
+    for finder in finders:
+        seam = finder(image)
+        if seam is not None:
+            return seam
+    return image.shape[1] // 2
+
+
+def split_at_seam(image: np.ndarray, seam: int) -> Tuple[np.ndarray, np.ndarray]:
+    """按分隔线切成 (左：原始图像, 右：标注图像)，跳过分隔线本身；返回的是视图，不复制像素"""
+    return image[:, :seam], image[:, seam + 1:]
+
+
+@dataclass
+class SplitEntry:
+    """分割清单中的一条记录，矩形均为 (x, y, w, h)"""
+    name: str
+    source: str
+    seam: int
+    width: int
+    height: int
+    original: Tuple[int, int, int, int]
+    annotated: Tuple[int, int, int, int]
+
+    @classmethod
+    def from_seam(cls, name: str, source: str, shape: Tuple[int, ...], seam: int) -> 'SplitEntry':
+        """由图像尺寸和分隔线位置生成记录（与 split_at_seam 的切法一致）"""
+        height, width = shape[:2]
+        return cls(
+            name=name,
+            source=source,
+            seam=seam,
+            width=width,
+            height=height,
+            original=(0, 0, seam, height),
+            annotated=(seam + 1, 0, width - seam - 1, height),
+        )
+
+    def read(self) -> Tuple[np.ndarray, np.ndarray]:
+        """解码一次源文件，返回 (原始图像, 标注图像) 两个视图"""
+        image = cv2.imread(self.source)
+        if image is None:
+            raise FileNotFoundError(f"无法读取图像: {self.source}")
+        return crop_view(image, self.original), crop_view(image, self.annotated)
+
+    def read_original(self) -> np.ndarray:
+        return self.read()[0]
+
+
+def crop_view(image: np.ndarray, rect: Tuple[int, int, int, int]) -> np.ndarray:
+    """按 (x, y, w, h) 取视图（不复制像素）"""
+    x, y, w, h = rect
+    return image[y:y + h, x:x + w]
+
+
+def write_manifest(path: str, entries: List[SplitEntry]) -> None:
+    """写出分割清单（JSONL，每行一条记录）；源文件路径保存为相对清单目录的路径"""
+    base = os.path.dirname(os.path.abspath(path))
+    os.makedirs(base, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            record = asdict(entry)
+            record['source'] = os.path.relpath(os.path.abspath(entry.source), base)
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def load_manifest(path: str) -> List[SplitEntry]:
+    """读取分割清单；源文件的相对路径按清单所在目录解析"""
+    base = os.path.dirname(os.path.abspath(path))
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            record['source'] = os.path.normpath(os.path.join(base, record['source']))
+            record['original'] = tuple(record['original'])
+            record['annotated'] = tuple(record['annotated'])
+            entries.append(SplitEntry(**record))
+    return entries
+
+
+def load_image(source: Union[str, np.ndarray, SplitEntry]) -> np.ndarray:
+    """
+    统一的图像读取入口：路径 → cv2.imread；ndarray → 原样返回；
+    分割清单记录 → 原始图像（左半）的视图
+    """
+    if isinstance(source, np.ndarray):
+        return source
+    if isinstance(source, SplitEntry):
+        return source.read_original()
+    image = cv2.imread(str(source))
+    if image is None:
+        raise FileNotFoundError(f"无法读取图像: {source}")
+    return image
+
+
+def list_samples(original_dir: str, manifest: Optional[str] = None) -> List[Union[Path, SplitEntry]]:
+    """
+    列出待处理的样本：给定 manifest 时为分割清单记录，否则为 original_dir 中已分割的图像
+    """
+    if manifest:
+        return load_manifest(manifest)
+    return sorted(Path(original_dir).glob("*.jpg"))
+
+
+def read_sample(
+    sample: Union[Path, SplitEntry],
+    annotated_dir: str
+) -> Tuple[str, np.ndarray, np.ndarray]:
+    """
+    读取 (名称, 原始图像, 标注图像)
+
+    分割清单记录只解码一次源文件，两半都是视图；
+    已分割的图像从 annotated_dir 读取同名的标注图像。
+    """
+    if isinstance(sample, SplitEntry):
+        original, annotated = sample.read()
+        return sample.name, original, annotated
+    return sample.stem, load_image(sample), load_image(Path(annotated_dir) / sample.name)
@@ -0,0 +1,399 @@
+"""
+本地常驻推理服务（asyncio，HTTP over TCP 或 Unix socket）
+
+每次运行脚本都要重新导入cv2和加载模型，后端（backend/src/routes/cases.ts）
+和桌面端按需分析时延迟很高。这里启动一个常驻进程，模型只加载一次并保持预热，
+并把并发请求合并成小批次（micro-batch）送入 PathologyQuantitativeAnalyzer.analyze_batch：
+第一个请求到达后最多再等待 max_wait_ms，或凑满 max_batch 张图就立即执行。
+
+模型推理在单独的工作线程中串行执行（模型实例不保证线程安全），
+执行期间到达的请求在队列中排队，自然形成下一批。队列满时直接返回 503。
+
+接口（JSON）：
+    POST /analyze   {"path": "图像路径"} 或请求体直接为图像文件（Content-Type: image/*）
+                    → {"status": "ok", "result": {...指标}}
+    GET  /health    → {"status": "ok", "uptime_seconds": ..., "models": {...}}
+    GET  /metrics   → 队列深度、在途数量、批次数、平均批大小、延迟分位数
+
+只依赖标准库 + 分析器本身；不指定模型时使用分析器内置的演示桩模型，可完全离线运行。
+
+用法：
+    python inference_service.py --port 8765
+    python inference_service.py --unix /tmp/pathology.sock --yolo weights/cells.pt
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from batch_runner import build_analyzer
+from image_split import load_image
+from json_utils import to_jsonable
+
+logger = logging.getLogger(__name__)
+
+# 请求体大小上限（字节）
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+# 延迟统计保留的最近请求数
+LATENCY_WINDOW = 1000
+
+_STATUS_TEXT = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable',
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class _Request:
+    """排队中的一次分析请求"""
+
+    __slots__ = ('source', 'future', 'received')
+
+    def __init__(self, source: Any, future: asyncio.Future):
+        self.source = source
+        self.future = future
+        self.received = time.perf_counter()
+
+
+def _decode(source: Any) -> np.ndarray:
+    """请求中的图像：路径字符串，或上传的文件字节"""
+    if isinstance(source, bytes):
+        image = cv2.imdecode(np.frombuffer(source, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("无法解码上传的图像")
+        return image
+    return load_image(source)
+
+
+class InferenceService:
+    """
+    微批处理推理服务
+
+    Args:
+        analyzer: PathologyQuantitativeAnalyzer（模型已加载）
+        max_batch: 每批最多的图像数
+        max_wait_ms: 第一个请求到达后最多等待多久再执行（延迟上限）
+        queue_size: 排队请求上限，超过时返回 503
+    """
+
+    def __init__(self, analyzer, max_batch: int = 8, max_wait_ms: float = 10, queue_size: int = 256):
+        self.analyzer = analyzer
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue: Optional[asyncio.Queue] = None
+        self.queue_size = queue_size
+        # 模型只在这一个线程中调用
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='inference')
+
+        self.started = time.time()
+        self.in_flight = 0
+        self.requests_total = 0
+        self.errors_total = 0
+        self.rejected_total = 0
+        self.batches_total = 0
+        self.batched_images_total = 0
+        self.latencies: Deque[float] = collections.deque(maxlen=LATENCY_WINDOW)
+        self._batcher: Optional[asyncio.Task] = None
+
+    # ---------- 批处理 ----------
+
+    async def start(self) -> None:
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._batcher = asyncio.create_task(self._batch_loop())
+
+    async def stop(self) -> None:
+        if self._batcher is not None:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown(wait=True)
+
+    async def submit(self, source: Any) -> Dict:
+        """排队一张图像，等待所在批次完成后返回指标"""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait(_Request(source, future))
+        except asyncio.QueueFull:
+            self.rejected_total += 1
+            raise HTTPError(503, f"请求队列已满（{self.queue_size}）")
+        return await future
+
+    async def _collect_batch(self) -> List[_Request]:
+        """等到第一个请求后，在 max_wait 内尽量凑满 max_batch 个"""
+        batch = [await self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _batch_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            self.in_flight = len(batch)
+            try:
+                outcomes = await loop.run_in_executor(self.executor, self._run_batch, [r.source for r in batch])
+            except Exception as e:
+                outcomes = [e] * len(batch)
+            finally:
+                self.in_flight = 0
+
+            self.batches_total += 1
+            self.batched_images_total += len(batch)
+            now = time.perf_counter()
+            for request, outcome in zip(batch, outcomes):
+                self.latencies.append(now - request.received)
+                if request.future.done():
+                    continue  # 客户端已断开
+                if isinstance(outcome, Exception):
+                    self.errors_total += 1
+                    request.future.set_exception(outcome)
+                else:
+                    request.future.set_result(outcome)
+
+    def _run_batch(self, sources: List[Any]) -> List[Any]:
+        """
+        工作线程中执行：逐个解码（失败的单独报错），可解码的整批分析
+
+        整批分析失败时逐张重新分析，一张坏图只让它自己的请求失败，
+        同批的其他请求照常返回结果。不抛出异常：每个请求的结果或异常放在对应位置，
+        解码失败的请求始终得到自己的400。
+        """
+        outcomes: List[Any] = [None] * len(sources)
+        images, index = [], []
+        for i, source in enumerate(sources):
+            try:
+                images.append(_decode(source))
+                index.append(i)
+            except Exception as e:
+                outcomes[i] = HTTPError(400, f"{type(e).__name__}: {e}")
+
+        if not images:
+            return outcomes
+        try:
+            results = self.analyzer.analyze_batch(images)
+        except Exception as e:
+            if len(images) == 1:
+                results = [e]
+            else:
+                results = self._retry_each(images)
+
+        for i, result in zip(index, results):
+            outcomes[i] = result if isinstance(result, Exception) else to_jsonable(result)
+        return outcomes
+
+    def _retry_each(self, images: List[np.ndarray]) -> List[Any]:
+        """整批失败后逐张分析，失败的位置放异常"""
+        logger.warning("整批分析失败（%d 张），逐张重试", len(images), exc_info=True)
+        results = []
+        for image in images:
+            try:
+                results.append(self.analyzer.analyze_batch([image])[0])
+            except Exception as e:
+                results.append(e)
+        return results
+
+    # ---------- 状态 ----------
+
+    def health(self) -> Dict:
+        return {
+            'status': 'ok',
+            'uptime_seconds': round(time.time() - self.started, 1),
+            'models': {
+                'detector': self.analyzer._model_identifier(self.analyzer.yolo_model),
+                'segmenter': self.analyzer._model_identifier(self.analyzer.segmentation_model),
+            },
+        }
+
+    def metrics(self) -> Dict:
+        latencies = np.asarray(self.latencies)
+        return {
+            'queue_depth': self.queue.qsize() if self.queue is not None else 0,
+            'queue_capacity': self.queue_size,
+            'in_flight': self.in_flight,
+            'requests_total': self.requests_total,
+            'errors_total': self.errors_total,
+            'rejected_total': self.rejected_total,
+            'batches_total': self.batches_total,
+            'mean_batch_size': round(self.batched_images_total / self.batches_total, 2) if self.batches_total else 0,
+            'max_batch': self.max_batch,
+            'max_wait_ms': self.max_wait * 1000,
+            'latency_ms': {
+                'p50': round(float(np.percentile(latencies, 50)) * 1000, 2) if len(latencies) else None,
+                'p95': round(float(np.percentile(latencies, 95)) * 1000, 2) if len(latencies) else None,
+            },
+        }
+
+    # ---------- HTTP ----------
+
+    async def handle(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> Tuple[int, Dict]:
+        """路由一个请求，返回 (状态码, JSON响应)"""
+        path = path.split('?', 1)[0]
+        if path == '/health':
+            return 200, self.health()
+        if path == '/metrics':
+            return 200, self.metrics()
+        if path != '/analyze':
+            raise HTTPError(404, f"未知路径: {path}")
+        if method != 'POST':
+            raise HTTPError(405, "/analyze 只支持 POST")
+
+        self.requests_total += 1
+        content_type = headers.get('content-type', '')
+        if content_type.startswith('image/') or content_type == 'application/octet-stream':
+            source = body
+        else:
+            try:
+                source = json.loads(body or b'{}')['path']
+            except (ValueError, KeyError, TypeError):
+                raise HTTPError(400, '请求体需为 {"path": "..."} 或图像文件')
+        return 200, {'status': 'ok', 'result': await self.submit(source)}
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """处理一个连接上的请求（支持 keep-alive）"""
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                try:
+                    status, payload = await self.handle(method, path, headers, body)
+                except HTTPError as e:
+                    status, payload = e.status, {'status': 'error', 'error': str(e)}
+                except Exception as e:
+                    logger.exception("处理请求失败: %s %s", method, path)
+                    status, payload = 500, {'status': 'error', 'error': f"{type(e).__name__}: {e}"}
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                _write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except HTTPError as e:
+            _write_response(writer, e.status, {'status': 'error', 'error': str(e)}, False)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    """读取一个HTTP/1.1请求；连接关闭时返回None"""
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, path, _ = line.decode('latin-1').split(' ', 2)
+    except ValueError:
+        raise HTTPError(400, "请求行格式错误")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get('content-length', 0) or 0)
+    except ValueError:
+        raise HTTPError(400, f"Content-Length 不是整数: {headers['content-length']}")
+    if length < 0:
+        raise HTTPError(400, f"Content-Length 不能为负: {length}")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, f"请求体超过 {MAX_BODY_BYTES} 字节")
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), path, headers, body
+
+
+def _write_response(writer: asyncio.StreamWriter, status: int, payload: Dict, keep_alive: bool) -> None:
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    head = (
+        f"HTTP/1.1 {status} {_STATUS_TEXT.get(status, '')}\r\n"
+        f"Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode('latin-1') + body)
+
+
+async def serve(
+    service: InferenceService,
+    host: str = '127.0.0.1',
+    port: int = 8765,
+    unix_path: Optional[str] = None
+) -> None:
+    """启动服务并一直运行（直到被取消）"""
+    await service.start()
+    if unix_path:
+        if os.path.exists(unix_path):
+            os.unlink(unix_path)
+        server = await asyncio.start_unix_server(service.serve_connection, path=unix_path)
+        logger.info("推理服务已启动: unix:%s", unix_path)
+    else:
+        server = await asyncio.start_server(service.serve_connection, host, port)
+        logger.info("推理服务已启动: http://%s:%d", host, port)
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="常驻的病理图像分析服务（模型预热 + 动态微批处理）")
+    parser.add_argument('--host', default='127.0.0.1', help="监听地址")
+    parser.add_argument('--port', type=int, default=8765, help="监听端口")
+    parser.add_argument('--unix', default=None, help="改为监听Unix socket路径")
+    parser.add_argument('--yolo', default=None, help="YOLO权重路径（不指定时使用演示桩模型）")
+    parser.add_argument('--pixel-to-mm', type=float, default=350, help="像素到毫米的转换比例")
+    parser.add_argument('--max-batch', type=int, default=8, help="每批最多图像数")
+    parser.add_argument('--max-wait-ms', type=float, default=10, help="凑批的最长等待时间（毫秒）")
+    parser.add_argument('--queue-size', type=int, default=256, help="排队请求上限")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    # 分析器的逐步骤日志在常驻服务中太多，只保留警告
+    logging.getLogger('demo_pipeline').setLevel(logging.WARNING)
+
+    model_specs = {'yolo_model': ('yolo', {'weights': args.yolo})} if args.yolo else {}
+    analyzer = build_analyzer(
+        {'pixel_to_mm_ratio': args.pixel_to_mm, 'detect_batch_size': args.max_batch},
+        model_specs,
+    )
+    service = InferenceService(analyzer, args.max_batch, args.max_wait_ms, args.queue_size)
+
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
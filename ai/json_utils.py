@@ -0,0 +1,23 @@
+"""
+JSON序列化工具
+
+分析结果里混有NumPy标量/数组（np.int64 细胞数、np.float32 阈值等），
+json.dump 不能直接处理。批处理日志、结果缓存、重新分级、推理服务和数据库导入都用这里的转换。
+"""
+
+from typing import Any
+
+import numpy as np
+
+
+def to_jsonable(value: Any) -> Any:
+    """把NumPy标量/数组转换为可JSON序列化的Python对象"""
+    if isinstance(value, dict):
+        return {k: to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
@@ -0,0 +1,181 @@
+"""
+标签图（label image）工具
+
+把所有细胞mask栅格化为整数标签图：像素值 = 细胞序号 + 1，0 为背景。
+之后每个细胞的像素统计（平均HSV、像素数、OD总和）都可以用 np.bincount
+一次归约完成，不需要对每个细胞单独切片调用OpenCV。
+
+归约只收集有标签的像素（np.flatnonzero），再对这些像素做bincount，
+开销与细胞像素总数成正比，而不是与 层数 × 整图像素数 成正比。
+"""
+
+from dataclasses import dataclass
+from typing import List, Sequence, Tuple, Union
+
+import numpy as np
+
+from cell_masks import CellMasks
+
+# 一次放置的最多层数（占用位图为uint16）
+_LAYER_BITS = 16
+
+
+@dataclass
+class LabelLayer:
+    """一层标签图，labels 覆盖图像区域 [x0, x0 + w) × [y0, y0 + h)"""
+    labels: np.ndarray
+    x0: int = 0
+    y0: int = 0
+
+    def labeled_pixels(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """有标签的像素：(标签, 全局y, 全局x)"""
+        flat = self.labels.ravel()
+        index = np.flatnonzero(flat != 0)
+        y, x = np.divmod(index, self.labels.shape[1])
+        return flat[index], y + self.y0, x + self.x0
+
+    def labeled_index(self, width: int) -> Tuple[np.ndarray, np.ndarray]:
+        """有标签的像素：(标签, 宽为width的整图中的展平下标)"""
+        flat = self.labels.ravel()
+        index = np.flatnonzero(flat != 0)
+        labels = flat[index]
+        if self.labels.shape[1] == width:
+            # 与整图同宽（第一层总是如此）：只差整数行的偏移
+            return labels, index + self.y0 * width
+        y, x = np.divmod(index, self.labels.shape[1])
+        return labels, (y + self.y0) * width + x + self.x0
+
+
+def rasterize_labels(
+    shape: Sequence[int],
+    bboxes: np.ndarray,
+    masks: Union[CellMasks, Sequence[np.ndarray]]
+) -> List[LabelLayer]:
+    """
+    将细胞mask写入标签图
+
+    bbox互相重叠时，同一像素可能属于多个细胞。为了让每个细胞仍然统计到
+    自己的全部像素，冲突的细胞会被放到下一层标签图中：每一层内部没有冲突，
+    所有层的统计结果相加即为正确结果。常见情况（无重叠）只有一层。
+    第一层覆盖整张图，之后的每一层只覆盖其中细胞像素的外接矩形。
+
+    所有前景像素一次性展开为整图下标：不与其他细胞共用像素的细胞直接写入第一层，
+    只有真正重叠的细胞才逐个按顺序放入第一个没有冲突的层（见 _first_fit）。
+
+    Args:
+        shape: 图像尺寸 (H, W)
+        bboxes: (N, 4) 整数bbox [x0, y0, x1, y1]（见 CellTable.bbox_pixels）
+        masks: 与bbox对齐的mask（CellMasks 或bool mask列表，None表示缺失），形状为 (y1-y0, x1-x0)
+
+    Returns:
+        标签图层列表（至少一层）
+    """
+    height, width = shape[:2]
+    if not isinstance(masks, CellMasks):
+        masks = CellMasks.from_masks(masks)
+    bboxes = np.asarray(bboxes, dtype=np.int64).reshape(-1, 4)
+
+    # 所有前景像素的整图展平下标，超出图像的部分丢弃
+    cell, row, col = masks.pixels()
+    if len(bboxes) and (bboxes[:, :2].min() < 0 or bboxes[:, 2].max() > width or bboxes[:, 3].max() > height):
+        y = bboxes[cell, 1] + row
+        x = bboxes[cell, 0] + col
+        inside = (y >= 0) & (y < height) & (x >= 0) & (x < width)
+        cell, index = cell[inside], y[inside] * width + x[inside]
+    else:
+        origin = bboxes[:, 1] * width + bboxes[:, 0]
+        index = origin[cell] + row.astype(np.int64) * width + col
+    labels = cell + 1
+
+    first = LabelLayer(np.zeros((height, width), dtype=np.int32))
+    layers = [first]
+    shared = np.bincount(index, minlength=height * width)[index] > 1
+    overlapping = np.zeros(len(masks), dtype=bool)
+    overlapping[cell[shared]] = True
+    alone = ~overlapping[cell]
+    first.labels.ravel()[index[alone]] = labels[alone]
+
+    # 重叠的细胞：一组最多 _LAYER_BITS 层，放不下的留给下一组
+    pending = ~alone
+    while pending.any():
+        labels, index = labels[pending], index[pending]
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(labels)) + 1])
+        sizes = np.diff(np.append(starts, len(labels)))
+        pixel_layer = np.repeat(_first_fit(index, starts, sizes, height * width).astype(np.int8), sizes)
+
+        for k in range(pixel_layer.max() + 1):
+            selected = pixel_layer == k
+            if k == 0 and len(layers) == 1:
+                # 第一组的第0层就是整图的第一层
+                first.labels.ravel()[index[selected]] = labels[selected]
+                continue
+            y, x = np.divmod(index[selected], width)
+            y0, x0 = int(y.min()), int(x.min())
+            layer_width = int(x.max()) - x0 + 1
+            layer = LabelLayer(np.zeros((int(y.max()) - y0 + 1, layer_width), dtype=np.int32), x0, y0)
+            layer.labels.ravel()[(y - y0) * layer_width + (x - x0)] = labels[selected]
+            layers.append(layer)
+        pending = pixel_layer < 0
+    return layers
+
+
+def _first_fit(index: np.ndarray, starts: np.ndarray, sizes: np.ndarray, size: int) -> np.ndarray:
+    """
+    按顺序为每个细胞选择第一个没有冲突的层
+
+    每个像素用一个bit记录已被哪些层占用，细胞所有像素的占用位取并集后，
+    最低的空闲位就是它的层，每个细胞只需一次读写，不需要逐层尝试。
+
+    Args:
+        index: 像素的展平下标，同一细胞的像素连续排列
+        starts, sizes: 每个细胞的像素区间
+        size: 展平下标的范围
+
+    Returns:
+        每个细胞的层号（0起），_LAYER_BITS 层都有冲突时为-1
+    """
+    occupied = np.zeros(size, dtype=np.uint16)
+    full = (1 << _LAYER_BITS) - 1
+    layer_of = np.full(len(starts), -1, dtype=np.int64)
+    for cell, (start, stop) in enumerate(zip(starts.tolist(), (starts + sizes).tolist())):
+        cell_index = index[start:stop]
+        bits = occupied[cell_index]
+        used = int(np.bitwise_or.reduce(bits))
+        if used == full:
+            continue
+        free = ~used & (used + 1)
+        occupied[cell_index] = bits | free
+        layer_of[cell] = free.bit_length() - 1
+    return layer_of
+
+
+def label_sums(
+    layers: Sequence[LabelLayer],
+    count: int,
+    *channels: np.ndarray
+) -> List[np.ndarray]:
+    """
+    按标签求和（bincount归约）
+
+    Args:
+        layers: rasterize_labels 的结果
+        count: 细胞数量 N
+        channels: 整图尺寸的数值图（如H、S、V、OD）
+
+    Returns:
+        [像素数, 通道1之和, 通道2之和, ...]，每个都是长度N的数组
+    """
+    size = count + 1
+    sums = [np.zeros(size, dtype=np.float64) for _ in range(len(channels) + 1)]
+    # 每个通道只展平一次（HSV的单个通道是跨步视图，ravel会复制）
+    flats = [np.ravel(channel) for channel in channels]
+    width = channels[0].shape[1] if channels else layers[0].labels.shape[1]
+
+    for layer in layers:
+        labels, index = layer.labeled_index(width)
+        sums[0] += np.bincount(labels, minlength=size)
+        for total, flat in zip(sums[1:], flats):
+            total += np.bincount(labels, weights=flat[index], minlength=size)
+
+    # 去掉背景（标签0）
+    return [total[1:] for total in sums]
@@ -0,0 +1,134 @@
+"""
+进程内共享的预训练模型缓存
+
+CPU上加载Cellpose/StarDist的时间往往比小图推理本身还长。
+这里每种模型（按类型 + 参数区分）在每个进程中只加载一次，
+之后脚本、批处理和分析器都从这里取同一个实例。
+
+用法：
+    from model_registry import get_model, prewarm
+
+    prewarm([('cellpose', {'model_type': 'cyto3'}), ('stardist', {})])
+    model = get_model('cellpose', model_type='cyto3')
+"""
+
+import inspect
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from opencv_detector import OpenCVCellDetector
+
+logger = logging.getLogger(__name__)
+
+
+def _load_cellpose(model_type: str = 'cyto3', gpu: bool = False):
+    from cellpose import models
+    return models.CellposeModel(gpu=gpu, model_type=model_type)
+
+
+def _load_stardist(name: str = '2D_versatile_he'):
+    from stardist.models import StarDist2D
+    return StarDist2D.from_pretrained(name)
+
+
+def _load_yolo(weights: str = 'yolov8n.pt'):
+    from ultralytics import YOLO
+    return YOLO(weights)
+
+
+# 模型类型 → 加载函数
+_LOADERS: Dict[str, Callable[..., Any]] = {
+    'cellpose': _load_cellpose,
+    'stardist': _load_stardist,
+    'yolo': _load_yolo,
+    'opencv': OpenCVCellDetector,
+}
+
+_models: Dict[Tuple, Any] = {}
+_key_locks: Dict[Tuple, threading.Lock] = {}
+_lock = threading.Lock()
+
+
+def _freeze(value: Any) -> Any:
+    """把参数值转换为可哈希的形式（dict/list/set 递归转换为tuple/frozenset）"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(item) for item in value)
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+def _make_key(kind: str, loader: Callable[..., Any], params: Dict[str, Any]) -> Tuple:
+    """
+    缓存键：按加载函数的签名补全默认值后的参数
+
+    get_model('cellpose') 与 get_model('cellpose', model_type='cyto3') 得到同一个键；
+    加载函数不接受的参数在这里就抛出 TypeError。
+    """
+    bound = inspect.signature(loader).bind(**params)
+    bound.apply_defaults()
+    return (kind,) + tuple(sorted((name, _freeze(value)) for name, value in bound.arguments.items()))
+
+
+def register_loader(kind: str, loader: Callable[..., Any]) -> None:
+    """注册新的模型类型（例如分割模型），loader(**params) 返回模型实例"""
+    with _lock:
+        _LOADERS[kind] = loader
+
+
+def get_model(kind: str, **params) -> Any:
+    """
+    获取模型实例，首次调用时加载，之后直接返回缓存
+
+    多线程同时请求同一个模型时只会加载一次；不同模型可以并行加载。
+    注意：返回的是共享实例，模型本身的推理是否线程安全取决于具体框架。
+
+    Args:
+        kind: 模型类型（'cellpose' / 'stardist' / 'yolo' / 'opencv' 或 register_loader 注册的类型）
+        params: 传给加载函数的参数；补全默认值后作为缓存键的一部分
+    """
+    with _lock:
+        if kind not in _LOADERS:
+            raise KeyError(f"未知的模型类型: {kind}（可选: {', '.join(sorted(_LOADERS))}）")
+        loader = _LOADERS[kind]
+    key = _make_key(kind, loader, params)
+
+    with _lock:
+        if key in _models:
+            return _models[key]
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+
+    # 加载时只锁住这一个键，避免慢加载阻塞其他模型
+    with key_lock:
+        if key not in _models:
+            model = loader(**params)
+            with _lock:
+                _models[key] = model
+    return _models[key]
+
+
+def prewarm(specs: Iterable[Tuple[str, Dict[str, Any]]]) -> None:
+    """启动时预加载模型，specs 为 (模型类型, 参数) 列表"""
+    for kind, params in specs:
+        logger.info("预加载 %s %s", kind, params or '')
+        get_model(kind, **params)
+
+
+def loaded_models() -> List[Tuple]:
+    """当前已加载的模型键"""
+    with _lock:
+        return list(_models)
+
+
+def clear() -> None:
+    """释放所有已加载的模型"""
+    with _lock:
+        _models.clear()
+        _key_locks.clear()
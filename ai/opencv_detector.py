@@ -0,0 +1,177 @@
+"""
+纯OpenCV的细胞检测器（没有GPU/YOLO权重时的备用检测器）
+
+原来 02b_simple_opencv_detection.py 用 findContours 找轮廓，再在Python循环里
+逐个 cv2.contourArea 过滤，相互接触的细胞核会连成一个轮廓。这里：
+
+1. 灰度 → 高斯模糊 → 自适应阈值 → 闭运算，得到前景（与原脚本相同的参数）
+2. 距离变换的局部极大值作为种子（每个细胞核一个），分水岭把粘连的细胞核分开
+3. 去掉分水岭边界后 connectedComponentsWithStats，一次得到所有实例的面积、bbox、质心，
+   面积过滤和置信度都是数组运算
+4. 大图按 tiling.iter_tile_grid 切成重叠tile，在线程池中并行处理
+   （OpenCV函数释放GIL），按质心落在哪个tile的core里去重
+
+predict(images) 返回 [(xyxy, conf), ...]，与 ultralytics YOLO.predict 的结果一样
+可以被 PathologyQuantitativeAnalyzer._cells_from_result 直接转换为细胞表，
+因此可以直接作为 yolo_model 使用：
+    analyzer = PathologyQuantitativeAnalyzer(OpenCVCellDetector(), segmentation_model)
+
+批处理/服务中通过模型注册表获取：
+    model_specs = {'yolo_model': ('opencv', {'max_area': 800})}
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from tiling import Tile, iter_tile_grid
+
+
+class OpenCVCellDetector:
+    """
+    连通域 + 距离变换分水岭的细胞检测器
+
+    Args:
+        min_area / max_area: 保留的实例面积范围（像素，开区间）
+        min_distance: 分水岭种子之间的最小距离（像素），约为最小细胞核半径
+        min_radius: 距离变换值低于此值的极大值不作为种子（过滤细小突起）
+        split_clumps: 为False时跳过分水岭，只做连通域
+        tile_size / overlap: 分块处理的tile边长和重叠宽度（重叠的一半应大于细胞半径）
+        workers: 并行处理的tile数
+    """
+
+    def __init__(
+        self,
+        min_area: int = 20,
+        max_area: int = 500,
+        min_distance: int = 4,
+        min_radius: float = 2.0,
+        split_clumps: bool = True,
+        tile_size: int = 1024,
+        overlap: int = 64,
+        workers: int = 4
+    ):
+        if tile_size <= 2 * overlap:
+            raise ValueError(f"tile边长 {tile_size} 必须大于重叠宽度 {overlap} 的两倍")
+        self.min_area = min_area
+        self.max_area = max_area
+        self.min_distance = min_distance
+        self.min_radius = min_radius
+        self.split_clumps = split_clumps
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.workers = max(1, workers)
+        self._peak_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * min_distance + 1,) * 2)
+
+    @property
+    def model_id(self) -> str:
+        """模型标识（进入分析器的 config_fingerprint / 结果缓存键）"""
+        return (f"opencv-watershed:area={self.min_area}-{self.max_area},"
+                f"distance={self.min_distance},radius={self.min_radius},split={self.split_clumps}")
+
+    def _foreground(self, blurred: np.ndarray) -> np.ndarray:
+        """
+        前景二值图（uint8，0/255）
+
+        自适应阈值的窗口只有11像素，比窗口宽的均匀细胞核内部与局部均值相差不大，
+        只剩一圈边缘。把外轮廓整体填充补上内部，距离变换的峰才在细胞核中心。
+        """
+        thresh = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                       cv2.THRESH_BINARY_INV, 11, 2)
+        kernel = np.ones((3, 3), np.uint8)
+        closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel, iterations=2)
+        contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        return cv2.drawContours(closed, contours, -1, 255, thickness=cv2.FILLED)
+
+    def _split(self, blurred: np.ndarray, foreground: np.ndarray) -> np.ndarray:
+        """
+        距离变换种子 + 分水岭，返回把粘连处切开后的前景
+
+        cv2.watershed 按相邻像素的颜色差决定淹没顺序，所以在模糊后的灰度图上淹没：
+        细胞核内部颜色均匀时各种子同速扩张，在两核之间的缩颈处相遇；有边缘时沿边缘分开。
+        """
+        dist = cv2.distanceTransform(foreground, cv2.DIST_L2, 5)
+        peaks = (dist >= cv2.dilate(dist, self._peak_kernel)) & (dist >= self.min_radius)
+        count, markers = cv2.connectedComponents(peaks.astype(np.uint8))
+        if count <= 2:
+            return foreground
+
+        # 背景单独一个标记，未知区域（前景中非种子的部分）为0，由分水岭填充
+        markers[foreground == 0] = count
+        cv2.watershed(cv2.merge([blurred, blurred, blurred]), markers)
+
+        # 分水岭边界（-1）和背景置0
+        split = foreground.copy()
+        split[(markers == -1) | (markers == count)] = 0
+        return split
+
+    def detect_region(self, image: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        检测一块区域（整图或一个tile）
+
+        Returns:
+            (xyxy (N, 4) float32 局部坐标, 置信度 (N,) float32, 质心 (N, 2) float64 局部坐标)
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        foreground = self._foreground(blurred)
+        if self.split_clumps:
+            foreground = self._split(blurred, foreground)
+
+        count, labels, stats, centroids = cv2.connectedComponentsWithStats(foreground, connectivity=4)
+        area = stats[1:, cv2.CC_STAT_AREA]
+        keep = np.flatnonzero((area > self.min_area) & (area < self.max_area)) + 1
+
+        # 置信度：实例内的平均暗度（1 - 灰度/255），细胞核染色越深越接近1
+        darkness = np.bincount(labels.ravel(), weights=255 - gray.ravel(), minlength=count)
+        conf = darkness[keep] / (stats[keep, cv2.CC_STAT_AREA] * 255.0)
+
+        x, y = stats[keep, cv2.CC_STAT_LEFT], stats[keep, cv2.CC_STAT_TOP]
+        xyxy = np.stack([x, y, x + stats[keep, cv2.CC_STAT_WIDTH], y + stats[keep, cv2.CC_STAT_HEIGHT]], axis=1)
+        return xyxy.astype(np.float32).reshape(-1, 4), conf.astype(np.float32), centroids[keep]
+
+    def _detect_tile(self, image: np.ndarray, tile: Tile) -> Tuple[np.ndarray, np.ndarray]:
+        crop = image[tile.y:tile.y + tile.h, tile.x:tile.x + tile.w]
+        xyxy, conf, centroids = self.detect_region(crop)
+        owned = tile.owns(centroids + (tile.x, tile.y))
+        return xyxy[owned] + np.array([tile.x, tile.y, tile.x, tile.y], dtype=np.float32), conf[owned]
+
+    def detect(self, image: np.ndarray, executor: Optional[ThreadPoolExecutor] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        检测整张图（BGR），大图分块并行
+
+        Returns:
+            (xyxy (N, 4) float32, 置信度 (N,) float32)
+        """
+        height, width = image.shape[:2]
+        if height <= self.tile_size and width <= self.tile_size:
+            xyxy, conf, _ = self.detect_region(image)
+            return xyxy, conf
+
+        tiles = list(iter_tile_grid(width, height, self.tile_size, self.overlap))
+        if executor is None:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                results = list(pool.map(lambda tile: self._detect_tile(image, tile), tiles))
+        else:
+            results = list(executor.map(lambda tile: self._detect_tile(image, tile), tiles))
+        return (np.concatenate([xyxy for xyxy, _ in results]).reshape(-1, 4),
+                np.concatenate([conf for _, conf in results]))
+
+    def predict(self, images: Sequence[np.ndarray]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        检测一批图像（与 YOLO.predict 的调用方式相同），每张图返回 (xyxy, conf)
+
+        小图之间在线程池中并行，大图在图内按tile并行。
+        """
+        if isinstance(images, np.ndarray):
+            images = [images]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            small = [i for i, image in enumerate(images)
+                     if max(image.shape[:2]) <= self.tile_size]
+            results = dict(zip(small, pool.map(self.detect, [images[i] for i in small])))
+            for i, image in enumerate(images):
+                if i not in results:
+                    results[i] = self.detect(image, pool)
+        return [results[i] for i in range(len(images))]
@@ -0,0 +1,276 @@
+"""
+把批处理结果批量写入PostgreSQL
+
+backend/scripts/seed-demo-tissue-analysis.ts 逐条 SELECT + INSERT/UPDATE，
+几万条分析结果要跑几分钟。这里按块写入，每块一个事务：
+
+1. 读取 batch_runner 的任务日志（--journal，JSONL）或汇总结果（--output，JSON），
+   同一张图只保留最后一次成功的结果
+2. 计算图像内容SHA-256（与 case_samples.checksum / samples.image_checksum 相同的算法），
+   同一checksum只保留最后一条，保证并发的块之间不会写同一行
+3. 每块 COPY 进临时表，再用两条集合语句完成upsert：
+   - sample_tissue_analysis：按 case_samples.checksum 关联到样本，ON CONFLICT (sample_id) 更新
+   - samples.structured_data：按 image_checksum 合并写入 tissue_analysis 键
+4. 多个块通过连接池并行写入；某一块失败只回滚该块，其余块照常提交
+
+分割清单（manifest）中的记录在任务日志里是 '原图#名称'，两半共用一个原图文件，
+没有可以和 case_samples.checksum 比对的独立图像，因此不会写入，总是报告为缺失；
+需要入库时先用 01_split_images.py 把两半写成文件再分析。
+
+依赖 psycopg 3 和 psycopg_pool（pip install "psycopg[binary,pool]"）。
+
+在一次性的本地Postgres上验证：
+    docker run --rm -d -p 55432:5432 -e POSTGRES_PASSWORD=pg --name pg-ingest postgres:16
+    python pg_ingest.py demo/batch_journal.jsonl \\
+        --dsn postgresql://postgres:pg@localhost:55432/postgres --apply-schema
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from json_utils import to_jsonable
+from result_cache import image_checksum
+
+SCHEMA_PATH = Path(__file__).resolve().parents[1] / 'database' / 'schema.sql'
+
+# sample_tissue_analysis 列 → analyze() 指标键（与 seed-demo-tissue-analysis.ts 的映射一致）
+ANALYSIS_COLUMNS = (
+    ('pos_cells_1_weak', 'weak_positive_cells'),
+    ('pos_cells_2_moderate', 'moderate_positive_cells'),
+    ('pos_cells_3_strong', 'strong_positive_cells'),
+    ('iod_total_cells', 'total_cells'),
+    ('positive_area_mm2', 'positive_area_mm2'),
+    ('tissue_area_mm2', 'tissue_area_mm2'),
+    ('positive_area_px', 'positive_area_pixels'),
+    ('tissue_area_px', 'tissue_area_pixels'),
+    ('positive_cells_ratio', 'positive_ratio'),
+    ('positive_cells_density', 'positive_density'),
+    ('mean_density', 'mean_density'),
+    ('h_score', 'h_score'),
+    ('irs', 'irs'),
+)
+
+# 临时表：每个事务结束时清空（ON COMMIT DELETE ROWS），同一连接可以反复使用
+STAGING_DDL = (
+    "CREATE TEMP TABLE IF NOT EXISTS staging_tissue_analysis ("
+    "checksum TEXT NOT NULL, image_path TEXT NOT NULL, metrics JSONB NOT NULL, "
+    + ', '.join(f"{column} NUMERIC" for column, _ in ANALYSIS_COLUMNS)
+    + ") ON COMMIT DELETE ROWS"
+)
+
+COPY_SQL = (
+    "COPY staging_tissue_analysis (checksum, image_path, metrics, "
+    + ', '.join(column for column, _ in ANALYSIS_COLUMNS)
+    + ") FROM STDIN"
+)
+
+UPSERT_ANALYSIS_SQL = f"""
+INSERT INTO sample_tissue_analysis (
+    sample_id, {', '.join(column for column, _ in ANALYSIS_COLUMNS)}, raw_image_path, metadata
+)
+SELECT cs.id, {', '.join(f's.{column}' for column, _ in ANALYSIS_COLUMNS)}, s.image_path,
+       jsonb_build_object('source', 'batch_runner', 'iod', s.metrics -> 'iod', 'metrics', s.metrics)
+FROM staging_tissue_analysis s
+JOIN case_samples cs ON cs.checksum = s.checksum
+ON CONFLICT (sample_id) DO UPDATE SET
+    {', '.join(f'{column} = EXCLUDED.{column}' for column, _ in ANALYSIS_COLUMNS)},
+    raw_image_path = EXCLUDED.raw_image_path,
+    metadata = COALESCE(sample_tissue_analysis.metadata, '{{}}'::jsonb) || EXCLUDED.metadata
+"""
+
+UPDATE_SAMPLES_SQL = """
+UPDATE samples SET structured_data =
+    COALESCE(samples.structured_data, '{}'::jsonb) || jsonb_build_object('tissue_analysis', s.metrics)
+FROM staging_tissue_analysis s
+WHERE samples.image_checksum = s.checksum
+"""
+
+UNMATCHED_SQL = """
+SELECT count(*) FROM staging_tissue_analysis s
+WHERE NOT EXISTS (SELECT 1 FROM case_samples cs WHERE cs.checksum = s.checksum)
+  AND NOT EXISTS (SELECT 1 FROM samples sm WHERE sm.image_checksum = s.checksum)
+"""
+
+
+def iter_results(path: str) -> Iterator[Tuple[str, Dict]]:
+    """
+    读取批处理结果，产出 (图像路径, 指标)
+
+    - .jsonl：任务日志，后出现的记录覆盖先前的；失败记录会撤销之前的成功结果，
+      半行记录忽略（与 JobJournal 的规则相同）
+    - .json：run_batch 返回的列表（batch_runner --output）
+    """
+    results: Dict[str, Dict] = {}
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if not isinstance(entry, dict):
+                    continue
+                if entry.get('status') == 'ok':
+                    results[entry['path']] = entry['result']
+                else:
+                    results.pop(entry.get('path'), None)
+        else:
+            for entry in json.load(f):
+                if entry.get('status') == 'ok':
+                    results[entry['path']] = entry['result']
+    yield from results.items()
+
+
+def resolve_checksums(
+    results: Iterable[Tuple[str, Dict]],
+    workers: int = 8
+) -> Tuple[List[Tuple[str, str, Dict]], List[str]]:
+    """
+    并行计算图像checksum
+
+    分割清单的记录（'原图#名称'）和已不存在的文件没有可比对的checksum，单独返回
+    （分割清单记录总在其中，见模块说明）。
+
+    Returns:
+        ([(checksum, 路径, 指标), ...]（checksum去重，后者覆盖前者）, [无法计算checksum的路径])
+    """
+    results = list(results)
+    existing = [(path, metrics) for path, metrics in results if os.path.isfile(path)]
+    missing = [path for path, _ in results if not os.path.isfile(path)]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        checksums = list(executor.map(lambda item: image_checksum(item[0]), existing))
+
+    rows: Dict[str, Tuple[str, str, Dict]] = {}
+    for checksum, (path, metrics) in zip(checksums, existing):
+        rows[checksum] = (checksum, path, metrics)
+    return list(rows.values()), missing
+
+
+def is_manifest_entry(path: str) -> bool:
+    """是否为分割清单记录（'原图#名称'，原图存在）"""
+    source, sep, _ = path.rpartition('#')
+    return bool(sep) and os.path.isfile(source)
+
+
+def _copy_row(checksum: str, path: str, metrics: Dict) -> Tuple:
+    values = tuple(metrics.get(key) for _, key in ANALYSIS_COLUMNS)
+    return (checksum, path, json.dumps(to_jsonable(metrics), ensure_ascii=False)) + values
+
+
+def ingest_chunk(conn, rows: List[Tuple[str, str, Dict]]) -> Dict[str, int]:
+    """
+    在一个事务中写入一块结果
+
+    Returns:
+        {'staged', 'analysis_rows', 'samples_updated', 'unmatched'}
+    """
+    with conn.transaction():
+        with conn.cursor() as cur:
+            cur.execute(STAGING_DDL)
+            with cur.copy(COPY_SQL) as copy:
+                for row in rows:
+                    copy.write_row(_copy_row(*row))
+            cur.execute(UPSERT_ANALYSIS_SQL)
+            analysis_rows = cur.rowcount
+            cur.execute(UPDATE_SAMPLES_SQL)
+            samples_updated = cur.rowcount
+            cur.execute(UNMATCHED_SQL)
+            unmatched = cur.fetchone()[0]
+    return {
+        'staged': len(rows),
+        'analysis_rows': analysis_rows,
+        'samples_updated': samples_updated,
+        'unmatched': unmatched,
+    }
+
+
+def ingest(
+    dsn: str,
+    rows: List[Tuple[str, str, Dict]],
+    chunk_size: int = 5000,
+    workers: int = 4
+) -> Dict:
+    """
+    用连接池并行写入全部结果
+
+    Args:
+        dsn: PostgreSQL连接串
+        rows: resolve_checksums 的结果
+        chunk_size: 每个事务写入的行数
+        workers: 并行连接数
+
+    Returns:
+        各块统计的合计，以及失败块的错误信息
+    """
+    from psycopg_pool import ConnectionPool
+
+    chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+    totals = {'staged': 0, 'analysis_rows': 0, 'samples_updated': 0, 'unmatched': 0}
+    errors = []
+
+    def run(chunk):
+        with pool.connection() as conn:
+            return ingest_chunk(conn, chunk)
+
+    with ConnectionPool(dsn, min_size=1, max_size=max(1, workers), open=True) as pool:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = [executor.submit(run, chunk) for chunk in chunks]
+            for index, future in enumerate(futures):
+                try:
+                    for key, value in future.result().items():
+                        totals[key] += value
+                except Exception as e:
+                    # 该块已整体回滚
+                    errors.append(f"块 {index}（{len(chunks[index])} 行）: {type(e).__name__}: {e}")
+    totals['chunks'] = len(chunks)
+    totals['errors'] = errors
+    return totals
+
+
+def apply_schema(dsn: str, schema_path: Path = SCHEMA_PATH) -> None:
+    """执行 database/schema.sql（幂等），用于一次性的测试数据库"""
+    import psycopg
+
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        conn.execute(schema_path.read_text(encoding='utf-8'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把批处理分析结果批量写入PostgreSQL（COPY + upsert）")
+    parser.add_argument('results', help="batch_runner 任务日志（.jsonl）或 --output 结果（.json）")
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'), help="连接串（默认环境变量 DATABASE_URL）")
+    parser.add_argument('--chunk-size', type=int, default=5000, help="每个事务的行数")
+    parser.add_argument('--workers', type=int, default=4, help="并行连接数")
+    parser.add_argument('--apply-schema', action='store_true', help="写入前执行 database/schema.sql")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("需要 --dsn 或环境变量 DATABASE_URL")
+
+    start = time.perf_counter()
+    rows, missing = resolve_checksums(iter_results(args.results), workers=args.workers * 2)
+    manifest = sum(1 for path in missing if is_manifest_entry(path))
+    print(f"读取 {len(rows)} 条结果（checksum去重后），{len(missing) - manifest} 条找不到图像文件，"
+          f"耗时 {time.perf_counter() - start:.1f}s")
+    if manifest:
+        print(f"  {manifest} 条是分割清单记录（原图#名称），没有独立的图像文件可按checksum匹配，未写入")
+
+    if args.apply_schema:
+        apply_schema(args.dsn)
+
+    start = time.perf_counter()
+    totals = ingest(args.dsn, rows, args.chunk_size, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"写入 {totals['chunks']} 块，耗时 {elapsed:.1f}s：sample_tissue_analysis {totals['analysis_rows']} 行，"
+          f"samples.structured_data {totals['samples_updated']} 行，未匹配到样本 {totals['unmatched']} 条")
+    for error in totals['errors']:
+        print(f"  ⚠ {error}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+阈值调整后的增量重新分级
+
+_classify_cell_positivity 的HSV阈值需要按批次标定。每次调整阈值不必重新检测和分割：
+分析时保存下来的细胞表（CellTable.save，或批处理 --cells-dir）已包含每个细胞的
+平均HSV、面积和IOD，重新分级只是对这些列做一次向量化比较，单张图毫秒级完成。
+
+用法：
+    python regrade.py demo/cells --v-strong 95 --v-moderate 140 --output demo/regraded.json
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from cell_table import CellTable
+from demo_pipeline import DEFAULT_HSV_THRESHOLDS, PathologyQuantitativeAnalyzer
+from json_utils import to_jsonable
+
+
+def regrade_cohort(
+    cell_paths: Iterable[str],
+    hsv_thresholds: Optional[Dict] = None,
+    pixel_to_mm_ratio: float = 350
+) -> Dict[str, Dict]:
+    """
+    对一组已保存的细胞表应用新阈值
+
+    Args:
+        cell_paths: CellTable.save() 写出的npz路径
+        hsv_thresholds: 新阈值，缺省项使用 DEFAULT_HSV_THRESHOLDS
+        pixel_to_mm_ratio: 与原分析相同的像素/毫米比例
+
+    Returns:
+        {npz路径: 指标字典}，顺序与输入一致
+    """
+    analyzer = PathologyQuantitativeAnalyzer(
+        yolo_model=None,
+        segmentation_model=None,
+        pixel_to_mm_ratio=pixel_to_mm_ratio,
+        hsv_thresholds=hsv_thresholds,
+    )
+    return {str(path): analyzer.regrade(CellTable.load(str(path))) for path in cell_paths}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用新的HSV阈值重新计算H-Score/IRS/阳性比率/IOD")
+    parser.add_argument('cells', help="细胞表npz文件或包含npz文件的目录")
+    parser.add_argument('--pixel-to-mm', type=float, default=350, help="像素到毫米的转换比例")
+    parser.add_argument('--output', default=None, help="结果JSON输出路径")
+    for name, value in DEFAULT_HSV_THRESHOLDS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=float, default=value,
+                            help=f"默认 {value}")
+    args = parser.parse_args()
+
+    source = Path(args.cells)
+    cell_paths = sorted(source.glob('*.npz')) if source.is_dir() else [source]
+    thresholds = {name: getattr(args, name) for name in DEFAULT_HSV_THRESHOLDS}
+
+    start = time.perf_counter()
+    results = regrade_cohort(cell_paths, thresholds, args.pixel_to_mm)
+    elapsed = time.perf_counter() - start
+
+    for path, metrics in results.items():
+        print(f"{Path(path).stem}: H-Score={metrics['h_score']}, IRS={metrics['irs']}, "
+              f"阳性比率={metrics['positive_ratio']}%, IOD={metrics['iod']}")
+    print(f"\n重新分级 {len(results)} 张图像，耗时 {elapsed * 1000:.1f} ms")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'hsv_thresholds': thresholds, 'results': to_jsonable(results)},
+                      f, ensure_ascii=False, indent=2)
+        print(f"结果保存到: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
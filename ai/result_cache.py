@@ -0,0 +1,217 @@
+"""
+按内容寻址的分析结果缓存
+
+同一张切片经常被反复分析（后端重新生成演示数据、医生重新打开病例）。
+缓存键 = 图像内容SHA-256（与 case_samples.checksum 相同的算法） + 分析器配置哈希
+（模型标识、pixel_to_mm_ratio、HSV阈值等），命中时直接返回指标和细胞表，不运行模型。
+
+磁盘布局：
+    <root>/<图像sha256>/<配置哈希>/metrics.json
+    <root>/<图像sha256>/<配置哈希>/cells.npz
+
+总大小超过 max_bytes 时按最近使用时间（LRU）淘汰；
+也可以按图像或整体显式失效。
+
+批处理的多个工作进程共用同一个缓存目录，所有修改都按"别的进程可能同时在做"来处理：
+- 写入先在临时目录完成，再 os.replace 成条目目录；同一个键已被别的进程写好时放弃自己的副本
+- 删除先把目录重命名为唯一的 .del-* 墓碑再删除，读取方和淘汰扫描不会看到删了一半的条目
+- 扫描和删除时条目被别的进程删掉（FileNotFoundError）视为正常情况
+- 读取时文件不完整或损坏一律视为未命中
+"""
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+import zipfile
+from typing import Dict, List, Optional, Tuple
+
+from cell_table import CellTable
+from json_utils import to_jsonable
+
+
+def image_checksum(image_path: str, chunk_size: int = 1 << 20) -> str:
+    """图像文件内容的SHA-256（十六进制）"""
+    digest = hashlib.sha256()
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def config_hash(config: Dict) -> str:
+    """分析器配置的稳定哈希（键排序后的JSON）"""
+    payload = json.dumps(to_jsonable(config), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+class ResultCache:
+    """磁盘LRU结果缓存"""
+
+    # 崩溃遗留的临时目录超过这个时间（秒）后在淘汰扫描时清理
+    STALE_TMP_SECONDS = 3600
+
+    def __init__(self, root: str, max_bytes: int = 1 << 30, evict_every: int = 32):
+        """
+        Args:
+            root: 缓存目录
+            max_bytes: 缓存总大小上限（字节），默认1GB
+            evict_every: 每写入多少个条目做一次全量扫描淘汰（其他进程写入的大小只能靠扫描得知）；
+                本进程累计写入的大小超过 max_bytes 时也会提前扫描
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.evict_every = max(1, evict_every)
+        # 上次扫描得到的总大小 + 之后本进程写入的大小；None表示尚未扫描
+        self._bytes: Optional[int] = None
+        self._puts_since_evict = 0
+        os.makedirs(root, exist_ok=True)
+
+    def key_for(self, image_path: str, config: Dict) -> Tuple[str, str]:
+        """缓存键 (图像checksum, 配置哈希)"""
+        return image_checksum(image_path), config_hash(config)
+
+    def _entry_dir(self, key: Tuple[str, str]) -> str:
+        return os.path.join(self.root, key[0], key[1])
+
+    def get(self, key: Tuple[str, str]) -> Optional[Tuple[Dict, CellTable]]:
+        """命中时返回 (指标, 细胞表)，并刷新该条目的使用时间"""
+        entry = self._entry_dir(key)
+        metrics_path = os.path.join(entry, 'metrics.json')
+        try:
+            with open(metrics_path, encoding='utf-8') as f:
+                metrics = json.load(f)
+            cells = CellTable.load(os.path.join(entry, 'cells.npz'))
+            # 用目录mtime记录最近使用时间
+            os.utime(entry)
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            # 不存在、写了一半、已损坏或刚被其他进程淘汰，都按未命中处理
+            return None
+        return metrics, cells
+
+    def put(self, key: Tuple[str, str], metrics: Dict, cells: CellTable) -> None:
+        """写入一个条目（先写临时目录再原子替换），然后按需淘汰旧条目"""
+        entry = self._entry_dir(key)
+        tmp = self._make_tmp(os.path.dirname(entry))
+        try:
+            with open(os.path.join(tmp, 'metrics.json'), 'w', encoding='utf-8') as f:
+                json.dump(to_jsonable(metrics), f, ensure_ascii=False)
+            cells.save(os.path.join(tmp, 'cells.npz'))
+            size = self._dir_size(tmp)
+            self._publish(tmp, entry)
+        finally:
+            # 发布成功后tmp已不存在；被别的写入方抢先时在这里丢弃自己的副本
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        self._puts_since_evict += 1
+        if self._bytes is not None:
+            self._bytes += size
+        if self._bytes is None or self._bytes > self.max_bytes or self._puts_since_evict >= self.evict_every:
+            self.evict()
+
+    @staticmethod
+    def _make_tmp(image_dir: str) -> str:
+        """在图像目录下创建临时目录；图像目录可能正被其他进程的淘汰删除，此时重建"""
+        for _ in range(10):
+            os.makedirs(image_dir, exist_ok=True)
+            try:
+                return tempfile.mkdtemp(dir=image_dir, prefix='.tmp-')
+            except FileNotFoundError:
+                continue
+        raise OSError(f"无法在缓存目录中创建临时目录: {image_dir}")
+
+    def _publish(self, tmp: str, entry: str) -> None:
+        """把写好的临时目录替换为条目；已有旧条目时先移走，再次冲突说明别的进程刚写入了同一个键"""
+        for attempt in range(2):
+            try:
+                os.replace(tmp, entry)
+                return
+            except OSError as e:
+                if e.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                    raise
+                if attempt == 0:
+                    self._remove(entry)
+        # 同一个键的内容相同（按内容寻址），保留先写入的那份
+
+    def _remove(self, path: str) -> bool:
+        """重命名为唯一的墓碑后删除；路径已不存在时返回False"""
+        tombstone = os.path.join(os.path.dirname(path), f'.del-{uuid.uuid4().hex}')
+        try:
+            os.rename(path, tombstone)
+        except FileNotFoundError:
+            return False
+        shutil.rmtree(tombstone, ignore_errors=True)
+        return True
+
+    @staticmethod
+    def _dir_size(path: str) -> int:
+        try:
+            return sum(f.stat().st_size for f in os.scandir(path) if f.is_file())
+        except FileNotFoundError:
+            return 0
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        """所有条目的 (最近使用时间, 大小, 路径)；扫描期间被其他进程删除的条目跳过"""
+        entries = []
+        now = time.time()
+        for checksum in os.listdir(self.root):
+            image_dir = os.path.join(self.root, checksum)
+            try:
+                names = os.listdir(image_dir)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            for name in names:
+                entry = os.path.join(image_dir, name)
+                try:
+                    mtime = os.stat(entry).st_mtime
+                except FileNotFoundError:
+                    continue
+                if name.startswith('.'):
+                    # 崩溃遗留的墓碑/临时目录
+                    if name.startswith('.del-') or now - mtime > self.STALE_TMP_SECONDS:
+                        shutil.rmtree(entry, ignore_errors=True)
+                    continue
+                entries.append((mtime, self._dir_size(entry), entry))
+        return entries
+
+    def size_bytes(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self) -> int:
+        """按LRU淘汰，直到总大小不超过 max_bytes；返回淘汰的条目数"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            if self._remove(entry):
+                removed += 1
+            total -= size
+            # 图像目录下已没有条目时一并删除（其他进程正在其中写入时目录非空，rmdir失败即跳过）
+            try:
+                os.rmdir(os.path.dirname(entry))
+            except OSError:
+                pass
+        self._bytes = total
+        self._puts_since_evict = 0
+        return removed
+
+    def invalidate(self, key: Tuple[str, str]) -> None:
+        """删除单个条目"""
+        self._remove(self._entry_dir(key))
+
+    def invalidate_image(self, checksum: str) -> None:
+        """删除某张图像在所有配置下的结果"""
+        self._remove(os.path.join(self.root, checksum))
+
+    def clear(self) -> None:
+        """清空缓存"""
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if os.path.isdir(path):
+                self._remove(path)
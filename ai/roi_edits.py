@@ -0,0 +1,212 @@
+"""
+人工ROI修正后的增量重算
+
+文档流程第2步：病理医生把导管、坏死区等误判区域排除，或者把某片区域改判为
+指定等级。每次修改都重新 analyze() 整张切片代价太高。这里保存分析结果的
+逐tile汇总（与 roi_integrals 相同的通道：各等级细胞数、面积、阳性面积、阳性IOD），
+一次编辑只处理多边形外接框覆盖的tile中的细胞：
+
+1. 外接框 → tile范围；细胞按tile编号排序存放（CSR），同一行tile的细胞是连续区间
+2. 在外接框大小的mask上 fillPoly，按质心取值判断细胞是否在多边形内
+3. 被修改细胞的新旧通道值之差累加到所在tile和全局总和
+
+编辑耗时只与编辑区域的面积和其中的细胞数有关，与切片大小无关；
+修改后的指标直接由全局总和算出，与对修改后的细胞表重新计算的结果一致
+（形态学指标不随编辑更新）。
+
+用法：
+    session = analyzer.edit_session(cells, image_size=(w, h))
+    metrics = session.exclude([(x1, y1), (x2, y2), (x3, y3)], reason='duct')
+    metrics = session.relabel(polygon, 'negative', reason='necrosis')
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+
+from cell_table import GRADE_LABELS
+from roi_integrals import CHANNELS, cell_channels, metrics_from_sums
+
+
+class EditSession:
+    """
+    可编辑的分析结果
+
+    Args:
+        analyzer: PathologyQuantitativeAnalyzer（提供指标公式）
+        cells: 已分级的细胞表；relabel 会原地修改 cells.grade
+        image_size: (宽, 高)（像素），缺省按质心范围
+        tile_size: 汇总tile边长（像素）
+    """
+
+    def __init__(
+        self,
+        analyzer,
+        cells,
+        image_size: Optional[Tuple[int, int]] = None,
+        tile_size: int = 512
+    ):
+        self.analyzer = analyzer
+        self.cells = cells
+        self.tile_size = int(tile_size)
+        self.centroids = cells.centroids()
+        if image_size is None:
+            image_size = tuple(np.ceil(self.centroids.max(axis=0) + 1).astype(int)) if len(cells) else (1, 1)
+        self.width, self.height = int(image_size[0]), int(image_size[1])
+        self.cols = max(1, -(-self.width // self.tile_size))
+        self.rows = max(1, -(-self.height // self.tile_size))
+
+        # 编辑前的等级，用于 restore
+        self.original_grade = cells.grade.copy()
+        self.excluded = np.zeros(len(cells), dtype=bool)
+        self.edits: List[Dict] = []
+        self.excluded_count = 0
+        self.relabeled_count = 0
+
+        tx = np.clip((self.centroids[:, 0] // self.tile_size).astype(np.int64), 0, self.cols - 1)
+        ty = np.clip((self.centroids[:, 1] // self.tile_size).astype(np.int64), 0, self.rows - 1)
+        self.tile_ids = ty * self.cols + tx
+        self.order = np.argsort(self.tile_ids, kind='stable')
+        size = self.rows * self.cols
+        self.starts = np.concatenate([[0], np.cumsum(np.bincount(self.tile_ids, minlength=size))])
+
+        values = self._channels(np.arange(len(cells)))
+        self.tile_sums = np.stack([np.bincount(self.tile_ids, weights=values[:, c], minlength=size)
+                                   for c in range(len(CHANNELS))], axis=1)
+        self.totals = self.tile_sums.sum(axis=0)
+
+    def _channels(self, index: np.ndarray) -> np.ndarray:
+        """指定细胞当前的通道值，已排除的细胞为0"""
+        cells = self.cells
+        values = cell_channels(cells.grade[index], cells.area_pixels[index], cells.iod[index])
+        values[self.excluded[index]] = 0
+        return values
+
+    def _cells_in_polygon(self, polygon: Sequence[Sequence[float]]) -> np.ndarray:
+        """质心落在多边形内的细胞序号"""
+        points = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+        if len(points) < 3:
+            raise ValueError(f"多边形至少需要3个顶点，得到 {len(points)} 个")
+
+        x0, y0 = np.floor(points.min(axis=0)).astype(int)
+        x1, y1 = np.ceil(points.max(axis=0)).astype(int) + 1
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self.width), min(y1, self.height)
+        if x1 <= x0 or y1 <= y0:
+            return np.zeros(0, dtype=np.int64)
+
+        # 外接框覆盖的tile：每一行tile在CSR中是连续区间
+        c0, c1 = x0 // self.tile_size, (x1 - 1) // self.tile_size
+        parts = []
+        for row in range(y0 // self.tile_size, (y1 - 1) // self.tile_size + 1):
+            first = row * self.cols
+            parts.append(self.order[self.starts[first + c0]:self.starts[first + c1 + 1]])
+        candidates = np.concatenate(parts)
+
+        cx = self.centroids[candidates, 0].astype(np.int64)
+        cy = self.centroids[candidates, 1].astype(np.int64)
+        inside_box = (cx >= x0) & (cx < x1) & (cy >= y0) & (cy < y1)
+        candidates, cx, cy = candidates[inside_box], cx[inside_box], cy[inside_box]
+
+        mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+        cv2.fillPoly(mask, [np.round(points - (x0, y0)).astype(np.int32)], 1)
+        return candidates[mask[cy - y0, cx - x0] > 0]
+
+    def _edit_counts(self, index: np.ndarray) -> Tuple[int, int]:
+        """index 中 (已排除, 已改判且未排除) 的细胞数"""
+        excluded = self.excluded[index]
+        relabeled = (self.cells.grade[index] != self.original_grade[index]) & ~excluded
+        return int(excluded.sum()), int(relabeled.sum())
+
+    def _apply(self, index: np.ndarray, change) -> None:
+        """对 index 中的细胞执行 change()，把变化累加到tile汇总、总和与编辑计数"""
+        before = self._channels(index)
+        excluded_before, relabeled_before = self._edit_counts(index)
+        change()
+        delta = self._channels(index) - before
+        np.add.at(self.tile_sums, self.tile_ids[index], delta)
+        self.totals += delta.sum(axis=0)
+
+        excluded_after, relabeled_after = self._edit_counts(index)
+        self.excluded_count += excluded_after - excluded_before
+        self.relabeled_count += relabeled_after - relabeled_before
+
+    def _record(self, action: str, polygon, index: np.ndarray, reason: Optional[str], **extra) -> Dict:
+        self.edits.append({
+            'action': action,
+            'polygon': np.asarray(polygon, dtype=np.float64).reshape(-1, 2).tolist(),
+            'cells': int(len(index)),
+            'reason': reason,
+            **extra,
+        })
+        return self.metrics()
+
+    def exclude(self, polygon: Sequence[Sequence[float]], reason: Optional[str] = None) -> Dict:
+        """
+        排除多边形内的细胞（导管、坏死、伪影等），不再计入任何指标
+
+        Args:
+            polygon: 顶点列表 [(x, y), ...]（像素）
+            reason: 排除原因，记录在 edits 中
+
+        Returns:
+            修正后的指标字典
+        """
+        index = self._cells_in_polygon(polygon)
+
+        def change():
+            self.excluded[index] = True
+
+        self._apply(index, change)
+        return self._record('exclude', polygon, index, reason)
+
+    def relabel(
+        self,
+        polygon: Sequence[Sequence[float]],
+        grade: Union[int, str],
+        reason: Optional[str] = None
+    ) -> Dict:
+        """
+        把多边形内细胞改判为指定等级
+
+        Args:
+            polygon: 顶点列表 [(x, y), ...]（像素）
+            grade: 0-3 或 GRADE_LABELS 中的标签
+            reason: 改判原因，记录在 edits 中
+        """
+        if isinstance(grade, str):
+            if grade not in GRADE_LABELS:
+                raise ValueError(f"未知的等级: {grade}，可选 {GRADE_LABELS}")
+            grade = GRADE_LABELS.index(grade)
+        if not 0 <= grade < len(GRADE_LABELS):
+            raise ValueError(f"等级必须在 0-{len(GRADE_LABELS) - 1} 之间: {grade}")
+        index = self._cells_in_polygon(polygon)
+
+        def change():
+            self.cells.grade[index] = grade
+
+        self._apply(index, change)
+        return self._record('relabel', polygon, index, reason, grade=GRADE_LABELS[grade])
+
+    def restore(self, polygon: Sequence[Sequence[float]]) -> Dict:
+        """撤销多边形内细胞的所有修改（恢复原等级并取消排除）"""
+        index = self._cells_in_polygon(polygon)
+
+        def change():
+            self.cells.grade[index] = self.original_grade[index]
+            self.excluded[index] = False
+
+        self._apply(index, change)
+        return self._record('restore', polygon, index, None)
+
+    def metrics(self) -> Dict:
+        """当前（修正后）的指标，格式与 analyze() 相同（不含形态学指标）"""
+        metrics = metrics_from_sums(self.analyzer, self.totals)
+        metrics['excluded_cells'] = self.excluded_count
+        metrics['relabeled_cells'] = self.relabeled_count
+        return metrics
+
+    def tile_metrics(self, col: int, row: int) -> Dict:
+        """单个汇总tile的指标"""
+        return metrics_from_sums(self.analyzer, self.tile_sums[row * self.cols + col])
@@ -0,0 +1,212 @@
+"""
+基于积分图（summed-area table）的矩形ROI指标
+
+病理医生按区域复核、修正AI标注时（见 fake ai.md），每个ROI都重新对整个细胞表
+调用 _calculate_areas / _calculate_metrics 是 O(细胞数) 的。这里按细胞质心把
+逐细胞的量分箱累加成若干图层，再各自做二维前缀和：
+
+    通道: 阴性/弱/中/强阳性细胞数、组织面积（像素）、阳性面积（像素）、阳性IOD
+
+任意矩形内的和 = S[y1, x1] - S[y0, x1] - S[y1, x0] + S[y0, x0]，与细胞数量无关；
+得到这些和之后，阳性率、H-Score、IRS、密度、平均光密度与整图分析共用
+analyzer._grade_metrics 的公式。
+
+细胞按质心归入 bin_px × bin_px 的方格，ROI边界对齐到方格（向外取整），
+bin_px=1 时精确到像素，但积分图大小与图像相同；整张切片建议 8~32。
+
+滑动窗口热点搜索同样只需对积分图做四次切片相减，一次算出所有窗口位置。
+
+用法：
+    roi = analyzer.roi_integrals(cells, image_size=(w, h))
+    metrics = roi.metrics(x0, y0, x1, y1)
+    hotspots = roi.hotspots(window_um=500, score='positive_density', top=3)
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 积分图通道
+CHANNELS = ('negative', 'weak', 'moderate', 'strong', 'tissue_pixels', 'positive_pixels', 'iod')
+
+# 热点搜索支持的评分
+HOTSPOT_SCORES = ('positive_count', 'positive_density', 'positive_ratio', 'h_score')
+
+
+def cell_channels(grade: np.ndarray, area_pixels: np.ndarray, iod: np.ndarray) -> np.ndarray:
+    """逐细胞的通道值 (N, len(CHANNELS))：等级独热、面积、阳性面积、阳性IOD"""
+    grade = np.asarray(grade, dtype=np.int64)
+    positive = grade > 0
+    values = np.zeros((len(grade), len(CHANNELS)), dtype=np.float64)
+    values[np.arange(len(grade)), grade] = 1
+    values[:, 4] = area_pixels
+    values[:, 5] = np.where(positive, area_pixels, 0)
+    values[:, 6] = np.where(positive, iod, 0)
+    return values
+
+
+def metrics_from_sums(analyzer, sums: np.ndarray) -> Dict:
+    """通道和（顺序同 CHANNELS）→ 与 analyze() 相同格式的指标（不含形态学指标）"""
+    areas = analyzer._areas_from_pixels(int(round(sums[4])), int(round(sums[5])))
+    # 前缀和相减可能留下极小的负数
+    return analyzer._grade_metrics(sums[:4], areas, max(float(sums[6]), 0.0))
+
+
+class RoiIntegrals:
+    """
+    细胞表的分箱积分图
+
+    Args:
+        analyzer: PathologyQuantitativeAnalyzer（提供 pixel_to_mm_ratio 和指标公式）
+        cells: 已分级的细胞表
+        image_size: (宽, 高)（像素），缺省按质心范围
+        bin_px: 方格边长（像素）
+    """
+
+    def __init__(
+        self,
+        analyzer,
+        cells,
+        image_size: Optional[Tuple[int, int]] = None,
+        bin_px: int = 16
+    ):
+        if bin_px < 1:
+            raise ValueError(f"bin_px 必须为正整数: {bin_px}")
+        self.analyzer = analyzer
+        self.bin_px = int(bin_px)
+
+        centroids = cells.centroids()
+        if image_size is None:
+            image_size = tuple(np.ceil(centroids.max(axis=0) + 1).astype(int)) if len(cells) else (1, 1)
+        self.width, self.height = int(image_size[0]), int(image_size[1])
+        self.cols = max(1, -(-self.width // self.bin_px))
+        self.rows = max(1, -(-self.height // self.bin_px))
+
+        cx = np.clip((centroids[:, 0] // self.bin_px).astype(np.int64), 0, self.cols - 1)
+        cy = np.clip((centroids[:, 1] // self.bin_px).astype(np.int64), 0, self.rows - 1)
+        bins = cy * self.cols + cx
+        size = self.rows * self.cols
+
+        values = cell_channels(cells.grade, cells.area_pixels, cells.iod)
+        layers = np.stack([np.bincount(bins, weights=values[:, c], minlength=size)
+                           for c in range(len(CHANNELS))])
+
+        # 积分图：S[c, y, x] = 方格 [0, y) × [0, x) 内的和，首行首列为0
+        self.sat = np.zeros((len(CHANNELS), self.rows + 1, self.cols + 1), dtype=np.float64)
+        np.cumsum(np.cumsum(layers.reshape(-1, self.rows, self.cols), axis=1), axis=2,
+                  out=self.sat[:, 1:, 1:])
+
+    def _bin_range(self, x0: float, y0: float, x1: float, y1: float) -> Tuple[int, int, int, int]:
+        """像素矩形 → 方格范围 [c0, c1) × [r0, r1)，向外取整并裁剪到图像内"""
+        if x1 < x0:
+            x0, x1 = x1, x0
+        if y1 < y0:
+            y0, y1 = y1, y0
+        c0 = min(max(int(x0 // self.bin_px), 0), self.cols)
+        r0 = min(max(int(y0 // self.bin_px), 0), self.rows)
+        c1 = min(max(int(-(-x1 // self.bin_px)), c0), self.cols)
+        r1 = min(max(int(-(-y1 // self.bin_px)), r0), self.rows)
+        return c0, r0, c1, r1
+
+    def sums(self, x0: float, y0: float, x1: float, y1: float) -> Dict[str, float]:
+        """
+        矩形 [x0, x1) × [y0, y1)（像素）内各通道的和，O(1)
+
+        Returns:
+            {通道名: 和}，通道见 CHANNELS
+        """
+        c0, r0, c1, r1 = self._bin_range(x0, y0, x1, y1)
+        s = self.sat
+        values = s[:, r1, c1] - s[:, r0, c1] - s[:, r1, c0] + s[:, r0, c0]
+        return dict(zip(CHANNELS, values.tolist()))
+
+    def metrics(self, x0: float, y0: float, x1: float, y1: float) -> Dict:
+        """
+        矩形ROI的指标，格式与 analyze() 相同（不含形态学指标）
+
+        额外给出 roi（对齐到方格后的实际像素范围）和 roi_area_mm2（矩形本身的面积）。
+        """
+        c0, r0, c1, r1 = self._bin_range(x0, y0, x1, y1)
+        s = self.sat
+        metrics = metrics_from_sums(self.analyzer, s[:, r1, c1] - s[:, r0, c1] - s[:, r1, c0] + s[:, r0, c0])
+
+        bounds = (c0 * self.bin_px, r0 * self.bin_px,
+                  min(c1 * self.bin_px, self.width), min(r1 * self.bin_px, self.height))
+        metrics['roi'] = list(bounds)
+        metrics['roi_area_mm2'] = round(
+            (bounds[2] - bounds[0]) * (bounds[3] - bounds[1]) / self.analyzer.pixel_to_mm_ratio ** 2, 4)
+        return metrics
+
+    def window_sums(self, window_bins: Tuple[int, int]) -> np.ndarray:
+        """
+        所有滑动窗口位置的通道和
+
+        Args:
+            window_bins: (宽, 高)（方格数）
+
+        Returns:
+            (通道, 行, 列) 数组，[:, r, c] 为左上角在方格 (r, c) 的窗口
+        """
+        w = min(max(int(window_bins[0]), 1), self.cols)
+        h = min(max(int(window_bins[1]), 1), self.rows)
+        s = self.sat
+        return s[:, h:, w:] - s[:, :-h, w:] - s[:, h:, :-w] + s[:, :-h, :-w]
+
+    def hotspots(
+        self,
+        window_um: float = 500,
+        score: str = 'positive_density',
+        top: int = 1,
+        min_cells: int = 20
+    ) -> List[Dict]:
+        """
+        滑动正方形窗口搜索热点，返回互不重叠的前 top 个窗口
+
+        Args:
+            window_um: 窗口边长（µm），对齐到方格
+            score: 评分，见 HOTSPOT_SCORES；positive_density 按窗口面积计算（cells/mm²）
+            top: 返回的热点数量
+            min_cells: 比例类评分（positive_ratio / h_score）要求窗口内至少的细胞数
+
+        Returns:
+            按评分降序的指标字典列表，每项额外包含 hotspot_score
+        """
+        if score not in HOTSPOT_SCORES:
+            raise ValueError(f"未知的热点评分: {score}，可选 {HOTSPOT_SCORES}")
+
+        side = window_um / 1000 * self.analyzer.pixel_to_mm_ratio
+        size = max(1, int(round(side / self.bin_px)))
+        sums = self.window_sums((size, size))
+        h, w = sums.shape[1:]
+        negative, weak, moderate, strong = sums[:4]
+        positive = weak + moderate + strong
+        total = positive + negative
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if score == 'positive_count':
+                values = positive
+            elif score == 'positive_density':
+                window_mm2 = (min(size, self.cols) * min(size, self.rows) * self.bin_px ** 2
+                              / self.analyzer.pixel_to_mm_ratio ** 2)
+                values = positive / window_mm2
+            elif score == 'positive_ratio':
+                values = positive / total * 100
+            else:
+                values = (weak + 2 * moderate + 3 * strong) / total * 100
+        values = np.where(total >= (min_cells if score in ('positive_ratio', 'h_score') else 1),
+                          values, -np.inf)
+
+        # 贪心选取：每选中一个窗口，屏蔽与之重叠的所有位置
+        results = []
+        span_w, span_h = min(size, self.cols), min(size, self.rows)
+        for _ in range(top):
+            best = int(np.argmax(values))
+            r, c = divmod(best, w)
+            if not np.isfinite(values[r, c]):
+                break
+            metrics = self.metrics(c * self.bin_px, r * self.bin_px,
+                                   (c + span_w) * self.bin_px, (r + span_h) * self.bin_px)
+            metrics['hotspot_score'] = round(float(values[r, c]), 4)
+            results.append(metrics)
+            values[max(r - span_h + 1, 0):r + span_h, max(c - span_w + 1, 0):c + span_w] = -np.inf
+        return results
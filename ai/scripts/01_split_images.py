@@ -1,85 +1,143 @@
 """
 裁剪对比图：分离原始图像和标注图像
+
+左边：原始切片图片
+右边：效果图（标注）
+
+支持灰色竖线和白色/低方差竖线两种分隔线：
+- 默认 --style white，与原 split_new_images.py（处理 demo/pictures）的分割结果一致
+- --style gray 对应原 01_split_images.py（处理 demo/photo）
+- --style auto 先找灰线再找白线，同一张图的结果可能与前两者都不同
+JPEG解码/编码在线程池中并行执行（OpenCV会释放GIL），批量处理时可以跑满磁盘。
+
+指定 --manifest 时不写出两半图像，只生成分割清单（源文件 + 分隔线 + 裁剪矩形），
+下游脚本和分析器直接从源文件读取视图，省去重编码和一倍的磁盘占用。
+
+用法：
+    python 01_split_images.py --source demo/pictures --prefix image
+    python 01_split_images.py --source demo/photo --prefix sample --style gray
+    python 01_split_images.py --source demo/pictures --manifest demo/processed/manifest.jsonl
 """
-import cv2
+import argparse
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import numpy as np
 
-# 路径配置
-SOURCE_DIR = "/home/proview/Desktop/Coder/cancerapp/ai/demo/photo"
-OUTPUT_DIR = "/home/proview/Desktop/Coder/cancerapp/ai/demo/processed"
-ORIGINAL_DIR = os.path.join(OUTPUT_DIR, "original")
-ANNOTATED_DIR = os.path.join(OUTPUT_DIR, "annotated")
+import cv2
+
+AI_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_DIR))
+from image_split import SEAM_STYLES, SplitEntry, find_seam, split_at_seam, write_manifest
+
+# 默认路径（相对 ai/ 根目录）
+SOURCE_DIR = AI_DIR / "demo" / "pictures"
+OUTPUT_DIR = AI_DIR / "demo" / "processed"
 
-# 创建输出目录
-os.makedirs(ORIGINAL_DIR, exist_ok=True)
-os.makedirs(ANNOTATED_DIR, exist_ok=True)
 
-def split_image(image_path, output_name):
+def split_image(image_path, original_path, annotated_path, style='white'):
     """
     分离左右两部分图像
 
     Args:
         image_path: 输入图像路径
-        output_name: 输出文件名（不含扩展名）
+        original_path: 原始图像（左半）输出路径
+        annotated_path: 标注图像（右半）输出路径
+        style: 分隔线样式
+
+    Returns:
+        分隔线列号，读取失败时返回None
     """
-    # 读取图像
-    img = cv2.imread(image_path)
+    img = cv2.imread(str(image_path))
     if img is None:
-        print(f"警告: 无法读取 {image_path}")
-        return False
+        print(f"  ⚠ 无法读取: {image_path}")
+        return None
 
-    height, width = img.shape[:2]
+    seam = find_seam(img, style)
+    left_img, right_img = split_at_seam(img, seam)
 
-    # 找到中间分隔线（灰色竖线）
-    # 通常在图像中心附近
-    mid = width // 2
+    cv2.imwrite(str(original_path), left_img)
+    cv2.imwrite(str(annotated_path), right_img)
+    return seam
 
-    # 在中心附近寻找灰色竖线
-    search_range = 50  # 搜索范围
-    for x in range(mid - search_range, mid + search_range):
-        # 检查这一列是否是灰色竖线
-        col = img[:, x, :]
-        # 灰色线的RGB值应该接近 (200, 200, 200)
-        if np.all(np.abs(col - 200) < 30, axis=1).sum() > height * 0.5:
-            mid = x
-            break
 
-    # 分离左右两部分
-    left_img = img[:, :mid]
-    right_img = img[:, mid+1:]  # 跳过分隔线
+def locate_seam(image_path, name, style='white'):
+    """只定位分隔线，生成分割清单记录（不写出图像）"""
+    img = cv2.imread(str(image_path))
+    if img is None:
+        print(f"  ⚠ 无法读取: {image_path}")
+        return None
+    return SplitEntry.from_seam(name, str(image_path), img.shape, find_seam(img, style))
 
-    # 保存
-    original_path = os.path.join(ORIGINAL_DIR, f"{output_name}.jpg")
-    annotated_path = os.path.join(ANNOTATED_DIR, f"{output_name}.jpg")
 
-    cv2.imwrite(original_path, left_img)
-    cv2.imwrite(annotated_path, right_img)
+def main():
+    parser = argparse.ArgumentParser(description="分离左右对比图中的原始图像和标注图像")
+    parser.add_argument('--source', default=str(SOURCE_DIR), help="输入目录")
+    parser.add_argument('--output', default=str(OUTPUT_DIR), help="输出目录（其下生成 original/ 和 annotated/）")
+    parser.add_argument('--prefix', default='image', help="输出文件名前缀，如 image → image_001.jpg")
+    parser.add_argument('--patterns', default='*.jpeg,*.jpg', help="输入文件匹配模式，逗号分隔")
+    parser.add_argument('--style', default='white', choices=SEAM_STYLES,
+                        help="分隔线样式（默认 white，与原 split_new_images.py 一致）")
+    parser.add_argument('--workers', type=int, default=min(8, os.cpu_count() or 1), help="I/O线程数")
+    parser.add_argument('--manifest', default=None, help="只生成分割清单（JSONL）到该路径，不写出图像")
+    args = parser.parse_args()
+
+    # 获取所有图像文件（按模式分组排序，输出编号稳定）
+    image_files = []
+    for pattern in args.patterns.split(','):
+        image_files.extend(sorted(Path(args.source).glob(pattern.strip())))
+
+    print("=" * 60)
+    print(f"找到 {len(image_files)} 张图片，使用 {args.workers} 个线程")
+    print("=" * 60)
+
+    if args.manifest:
+        write_split_manifest(image_files, args)
+        return
+
+    original_dir = os.path.join(args.output, "original")
+    annotated_dir = os.path.join(args.output, "annotated")
+    os.makedirs(original_dir, exist_ok=True)
+    os.makedirs(annotated_dir, exist_ok=True)
+
+    # 生成统一的文件名：image_001.jpg, image_002.jpg, ...
+    jobs = []
+    for i, image_path in enumerate(image_files, 1):
+        output_name = f"{args.prefix}_{i:03d}.jpg"
+        jobs.append((image_path,
+                     os.path.join(original_dir, output_name),
+                     os.path.join(annotated_dir, output_name)))
 
-    return True
+    success_count = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(split_image, *job, args.style) for job in jobs]
+        for i, future in enumerate(futures, 1):
+            if future.result() is not None:
+                success_count += 1
+            if i % 20 == 0:
+                print(f"处理进度: {i}/{len(jobs)}")
 
-def main():
-    # 获取所有图像文件
-    image_files = sorted(Path(SOURCE_DIR).glob("*.jpeg"))
+    print("\n" + "=" * 60)
+    print(f"分割完成！成功处理 {success_count}/{len(image_files)} 张图片")
+    print(f"原始图像: {original_dir}")
+    print(f"标注图像: {annotated_dir}")
+    print("=" * 60)
 
-    print(f"找到 {len(image_files)} 张图像")
-    print("开始裁剪...")
 
-    success_count = 0
-    for i, image_path in enumerate(image_files, 1):
-        # 生成统一的文件名：sample_001.jpg, sample_002.jpg, ...
-        output_name = f"sample_{i:03d}"
+def write_split_manifest(image_files, args):
+    """并行定位分隔线，写出分割清单"""
+    names = [f"{args.prefix}_{i:03d}" for i in range(1, len(image_files) + 1)]
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        entries = list(executor.map(locate_seam, image_files, names, [args.style] * len(names)))
 
-        if split_image(str(image_path), output_name):
-            success_count += 1
-            if i % 20 == 0:
-                print(f"处理进度: {i}/{len(image_files)}")
+    entries = [entry for entry in entries if entry is not None]
+    write_manifest(args.manifest, entries)
+
+    print("\n" + "=" * 60)
+    print(f"分割清单完成！成功处理 {len(entries)}/{len(image_files)} 张图片")
+    print(f"清单: {args.manifest}")
+    print("=" * 60)
 
-    print(f"\n完成！")
-    print(f"成功处理: {success_count}/{len(image_files)}")
-    print(f"原始图像保存到: {ORIGINAL_DIR}")
-    print(f"标注图像保存到: {ANNOTATED_DIR}")
 
 if __name__ == "__main__":
     main()
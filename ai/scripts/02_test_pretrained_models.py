@@ -9,26 +9,30 @@ import matplotlib
 matplotlib.use('Agg')  # 使用非交互式后端
 from pathlib import Path
 import os
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from image_split import list_samples, load_image, read_sample
+from model_registry import get_model, prewarm
 
 # 配置路径
 ORIGINAL_DIR = "/home/proview/Desktop/Coder/cancerapp/ai/demo/processed/original"
 ANNOTATED_DIR = "/home/proview/Desktop/Coder/cancerapp/ai/demo/processed/annotated"
 OUTPUT_DIR = "/home/proview/Desktop/Coder/cancerapp/ai/demo/results"
+# 设置后从分割清单读取（见 01_split_images.py --manifest），不需要已分割的图像
+MANIFEST_PATH = os.environ.get("SPLIT_MANIFEST")
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-def test_cellpose(image_path):
+def test_cellpose(image):
     """测试Cellpose细胞分割"""
     try:
-        from cellpose import models
-
         # 加载图像
-        image = cv2.imread(image_path)
+        image = load_image(image)
         image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
-        # 加载预训练模型
-        print("  加载Cellpose模型...")
-        model = models.CellposeModel(gpu=False, model_type='cyto3')
+        # 预训练模型在进程内只加载一次
+        model = get_model('cellpose', model_type='cyto3')
 
         # 运行分割
         print("  运行Cellpose分割...")
@@ -45,18 +49,15 @@ def test_cellpose(image_path):
         print(f"  Cellpose错误: {e}")
         return None, 0
 
-def test_stardist(image_path):
+def test_stardist(image):
     """测试StarDist细胞核检测"""
     try:
-        from stardist.models import StarDist2D
-
         # 加载图像
-        image = cv2.imread(image_path)
+        image = load_image(image)
         image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
-        # 加载预训练模型
-        print("  加载StarDist模型...")
-        model = StarDist2D.from_pretrained('2D_versatile_he')
+        # 预训练模型在进程内只加载一次
+        model = get_model('stardist', name='2D_versatile_he')
 
         # 运行检测
         print("  运行StarDist检测...")
@@ -134,32 +135,34 @@ def create_comparison_plot(image_name, original, annotated, cellpose_mask, stard
 
 def main():
     # 获取所有图像
-    original_images = sorted(Path(ORIGINAL_DIR).glob("*.jpg"))
+    original_images = list_samples(ORIGINAL_DIR, MANIFEST_PATH)
 
     print(f"找到 {len(original_images)} 张测试图像")
 
+    # 启动时预加载模型（未安装的跳过，单张图处理时会报错并显示在对比图中）
+    for kind, params in (('cellpose', {'model_type': 'cyto3'}), ('stardist', {'name': '2D_versatile_he'})):
+        try:
+            prewarm([(kind, params)])
+        except Exception as e:
+            print(f"  {kind}预加载失败: {e}")
+
     # 测试前几张图像（避免处理太久）
     test_count = min(10, len(original_images))  # 先测试10张
     print(f"将测试前 {test_count} 张图像\n")
 
-    for i, original_path in enumerate(original_images[:test_count], 1):
-        image_name = original_path.stem
-        annotated_path = Path(ANNOTATED_DIR) / original_path.name
-
+    for i, sample in enumerate(original_images[:test_count], 1):
+        # 读取图像（分割清单只解码一次源文件）
+        image_name, original, annotated = read_sample(sample, ANNOTATED_DIR)
         print(f"[{i}/{test_count}] 处理 {image_name}...")
 
-        # 读取图像
-        original = cv2.imread(str(original_path))
         original_rgb = cv2.cvtColor(original, cv2.COLOR_BGR2RGB)
-
-        annotated = cv2.imread(str(annotated_path))
         annotated_rgb = cv2.cvtColor(annotated, cv2.COLOR_BGR2RGB)
 
         # 测试Cellpose
-        cellpose_mask, cellpose_count = test_cellpose(str(original_path))
+        cellpose_mask, cellpose_count = test_cellpose(original)
 
         # 测试StarDist
-        stardist_mask, stardist_count = test_stardist(str(original_path))
+        stardist_mask, stardist_count = test_stardist(original)
 
         # 生成对比图
         output_path = os.path.join(OUTPUT_DIR, f"{image_name}_comparison.jpg")
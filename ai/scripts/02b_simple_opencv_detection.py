@@ -3,61 +3,46 @@
 如果Cellpose/StarDist安装失败，可以用这个快速看效果
 """
 import cv2
-import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib
 matplotlib.use('Agg')
 from pathlib import Path
 import os
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from image_split import list_samples, load_image, read_sample
+from opencv_detector import OpenCVCellDetector
 
 ORIGINAL_DIR = "/home/proview/Desktop/Coder/cancerapp/ai/demo/processed/original"
 ANNOTATED_DIR = "/home/proview/Desktop/Coder/cancerapp/ai/demo/processed/annotated"
 OUTPUT_DIR = "/home/proview/Desktop/Coder/cancerapp/ai/demo/results_opencv"
+# 设置后从分割清单读取（见 01_split_images.py --manifest），不需要已分割的图像
+MANIFEST_PATH = os.environ.get("SPLIT_MANIFEST")
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-def simple_cell_detection(image_path):
-    """使用OpenCV进行简单的细胞检测"""
-    # 读取图像
-    image = cv2.imread(image_path)
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
-    # 高斯模糊
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-
-    # 自适应阈值
-    thresh = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                   cv2.THRESH_BINARY_INV, 11, 2)
-
-    # 形态学操作
-    kernel = np.ones((3, 3), np.uint8)
-    morphed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel, iterations=2)
-
-    # 查找轮廓
-    contours, _ = cv2.findContours(morphed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-    # 过滤小轮廓
-    min_area = 20
-    max_area = 500
-    filtered_contours = [cnt for cnt in contours
-                        if min_area < cv2.contourArea(cnt) < max_area]
+# 分水岭拆分相互接触的细胞核（计数由 tests/test_opencv_detector.py 固定）；改为False恢复按连通域计数
+DETECTOR = OpenCVCellDetector(min_area=20, max_area=500, split_clumps=True)
 
-    return filtered_contours, len(filtered_contours)
+def simple_cell_detection(image):
+    """使用OpenCV进行细胞检测（image 为路径或BGR图像），返回 (xyxy框, 数量)"""
+    image = load_image(image)
+    xyxy, conf = DETECTOR.predict([image])[0]
+    return xyxy, len(xyxy)
 
-def create_comparison(image_name, original_path, annotated_path, output_path):
-    """创建对比图"""
-    # 读取图像
-    original = cv2.imread(original_path)
+def create_comparison(image_name, original, annotated, output_path):
+    """创建对比图（original / annotated 为BGR图像）"""
     original_rgb = cv2.cvtColor(original, cv2.COLOR_BGR2RGB)
-    annotated = cv2.imread(annotated_path)
     annotated_rgb = cv2.cvtColor(annotated, cv2.COLOR_BGR2RGB)
 
     # OpenCV检测
-    contours, count = simple_cell_detection(original_path)
+    boxes, count = simple_cell_detection(original)
 
     # 绘制检测结果
     detection_result = original.copy()
-    cv2.drawContours(detection_result, contours, -1, (0, 255, 0), 2)
+    for x0, y0, x1, y1 in boxes.astype(int):
+        cv2.rectangle(detection_result, (x0, y0), (x1, y1), (0, 255, 0), 1)
     detection_rgb = cv2.cvtColor(detection_result, cv2.COLOR_BGR2RGB)
 
     # 创建对比图
@@ -83,20 +68,18 @@ def create_comparison(image_name, original_path, annotated_path, output_path):
     return count
 
 def main():
-    original_images = sorted(Path(ORIGINAL_DIR).glob("*.jpg"))[:5]  # 测试5张
+    original_images = list_samples(ORIGINAL_DIR, MANIFEST_PATH)[:5]  # 测试5张
 
     print(f"OpenCV简单检测测试 (共{len(original_images)}张)")
     print("="*60)
 
-    for i, original_path in enumerate(original_images, 1):
-        image_name = original_path.stem
-        annotated_path = Path(ANNOTATED_DIR) / original_path.name
+    for i, sample in enumerate(original_images, 1):
+        image_name, original, annotated = read_sample(sample, ANNOTATED_DIR)
         output_path = os.path.join(OUTPUT_DIR, f"{image_name}_opencv.jpg")
 
         print(f"[{i}/{len(original_images)}] {image_name}...", end=" ")
 
-        count = create_comparison(image_name, str(original_path),
-                                 str(annotated_path), output_path)
+        count = create_comparison(image_name, original, annotated, output_path)
 
         print(f"✅ 检测到 {count} 个对象")
 
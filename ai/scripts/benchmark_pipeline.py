@@ -0,0 +1,338 @@
+"""
+分析流程的分阶段基准测试
+
+用 synthetic_slides 按固定种子生成合成IHC切片，对每个规模：
+- 分别计时 PathologyQuantitativeAnalyzer 的每个阶段（检测、分割、颜色分级、IOD、面积、指标）
+  以及端到端的 analyze()，重复多次取最小值
+- 记录各阶段吞吐量（cells/s）和 analyze() 的峰值内存（tracemalloc，单独运行一次，不影响计时）
+- 与保存的基准结果比较：耗时或峰值内存超出容差、或者指标数值变化时报告回归，退出码为1
+- 标签图统计（rasterize_labels + label_sums）与逐细胞裁剪 + cvtColor 的循环对比：
+  在bbox大量重叠的随机细胞上（多层标签图）结果必须一致，且不能比逐细胞循环慢，否则退出码为1；
+  这项检查不依赖保存的基准
+
+基准结果与机器相关，不随代码提交；在目标机器上用 --update-baseline 生成。
+
+用法：
+    python benchmark_pipeline.py --cells 1000,10000,50000
+    python benchmark_pipeline.py --cells 200000 --repeat 1 --cell-radius 4,7
+    python benchmark_pipeline.py --update-baseline
+    python benchmark_pipeline.py --cells 1000 --label-cells 12000 --label-image-size 2048
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+AI_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_DIR))
+from cell_masks import CellMasks
+from cell_table import CellTable
+from demo_pipeline import PathologyQuantitativeAnalyzer
+from json_utils import to_jsonable
+from label_image import label_sums, rasterize_labels
+from synthetic_slides import SlideSpec, SyntheticDetector, SyntheticSegmenter, generate_slide
+
+DEFAULT_BASELINE = AI_DIR / "benchmarks" / "baseline.json"
+
+# 需要完全一致的指标（合成数据固定种子，结果应当确定）
+CHECKED_METRICS = ('total_cells', 'positive_ratio', 'h_score', 'irs', 'iod', 'tissue_area_pixels')
+
+
+def time_stages(analyzer, image):
+    """按 analyze() 的顺序逐个调用各阶段，返回 ({阶段: 秒}, 指标, 细胞表)"""
+    timings = {}
+
+    def timed(stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        timings[stage] = time.perf_counter() - start
+        return result
+
+    cells = timed('detect', analyzer._detect_cells, image)
+    timed('segment', analyzer._segment_cells, image, cells)
+    timed('classify', analyzer._classify_cells, image, cells)
+    total_iod = timed('iod', analyzer._calculate_total_iod, cells)
+    areas = timed('areas', analyzer._calculate_areas, cells)
+    metrics = timed('metrics', analyzer._calculate_metrics, cells, areas, total_iod)
+    return timings, metrics, cells
+
+
+def peak_memory_mb(analyzer, image):
+    """analyze() 期间NumPy/Python分配的峰值内存（MB）"""
+    tracemalloc.start()
+    try:
+        analyzer.analyze(image)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024 ** 2
+
+
+def max_rss_mb():
+    """进程常驻内存的历史峰值（MB），不支持的平台返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为KB，macOS 为字节
+    return rss / 1024 ** 2 if sys.platform == 'darwin' else rss / 1024
+
+
+def run_scenario(spec, repeat):
+    """生成一张合成切片并测量，返回可JSON序列化的结果"""
+    start = time.perf_counter()
+    slide = generate_slide(spec)
+    generate_seconds = time.perf_counter() - start
+
+    analyzer = PathologyQuantitativeAnalyzer(SyntheticDetector(slide), SyntheticSegmenter())
+    image = slide.image
+    cell_count = len(slide.bboxes)
+
+    best_stages, best_analyze = None, float('inf')
+    for _ in range(repeat):
+        stages, metrics, cells = time_stages(analyzer, image)
+        best_stages = stages if best_stages is None else {
+            k: min(v, stages[k]) for k, v in best_stages.items()
+        }
+        start = time.perf_counter()
+        analyzer.analyze(image)
+        best_analyze = min(best_analyze, time.perf_counter() - start)
+
+    return {
+        'cells': cell_count,
+        'image_size': list(image.shape[:2]),
+        'generate_seconds': generate_seconds,
+        'stages': best_stages,
+        'cells_per_sec': {k: cell_count / v if v > 0 else None for k, v in best_stages.items()},
+        'analyze_seconds': best_analyze,
+        'analyze_cells_per_sec': cell_count / best_analyze,
+        'peak_traced_mb': peak_memory_mb(analyzer, image),
+        'max_rss_mb': max_rss_mb(),
+        'grade_accuracy': float(np.mean(cells.grade == slide.grades)) if cell_count else 1.0,
+        'metrics': {k: metrics[k] for k in CHECKED_METRICS},
+    }
+
+
+def overlapping_cells(count, image_size, cell_radius=(4, 9), seed=0):
+    """随机位置的椭圆细胞，bbox互相重叠（标签图会分成多层），部分超出图像边界"""
+    rng = np.random.default_rng(seed)
+    lo, hi = cell_radius
+    half = rng.integers(lo, hi + 1, size=(count, 2))
+    centers = rng.integers(0, image_size, size=(count, 2))
+    bboxes = np.concatenate([centers - half, 2 * half + 1], axis=1)
+    masks = []
+    for a, b in half:
+        mask = np.zeros((2 * b + 1, 2 * a + 1), dtype=np.uint8)
+        cv2.ellipse(mask, (int(a), int(b)), (int(a), int(b)), 0, 0, 360, 1, -1)
+        masks.append(mask > 0)
+    cells = CellTable.from_detections(bboxes, np.ones(count))
+    cells.masks = CellMasks.from_masks(masks)
+    image = rng.integers(0, 256, size=(image_size, image_size, 3), dtype=np.uint8)
+    return image, cells
+
+
+def label_path_sums(image, cells):
+    """标签图统计：[像素数, H、S、V、OD之和]"""
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    od = 255 - cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    layers = rasterize_labels(image.shape, cells.bbox_pixels(), cells.masks)
+    return np.stack(label_sums(layers, len(cells), hsv[..., 0], hsv[..., 1], hsv[..., 2], od)), len(layers)
+
+
+def per_cell_sums(image, cells):
+    """
+    标签图之前的逐细胞实现（与原来的 _classify_cells + _calculate_total_iod 相同的操作）：
+    每个细胞裁剪bbox单独转换HSV再按mask统计，IOD另外遍历一次灰度图
+    """
+    height, width = image.shape[:2]
+    crops = []
+    for (x0, y0, x1, y1), mask in zip(cells.bbox_pixels(), cells.masks):
+        cx0, cy0, cx1, cy1 = max(x0, 0), max(y0, 0), min(x1, width), min(y1, height)
+        if mask is None or cx0 >= cx1 or cy0 >= cy1:
+            crops.append(None)
+            continue
+        crops.append((slice(cy0, cy1), slice(cx0, cx1), mask[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0]))
+
+    sums = np.zeros((5, len(cells)))
+    for i, crop in enumerate(crops):
+        if crop is None:
+            continue
+        rows, cols, mask = crop
+        pixels = cv2.cvtColor(image[rows, cols], cv2.COLOR_BGR2HSV)[mask > 0]
+        sums[0, i] = len(pixels)
+        sums[1, i] = np.sum(pixels[:, 0])
+        sums[2, i] = np.sum(pixels[:, 1])
+        sums[3, i] = np.sum(pixels[:, 2])
+
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    for i, crop in enumerate(crops):
+        if crop is not None:
+            rows, cols, mask = crop
+            sums[4, i] = np.sum(255 - gray[rows, cols][mask > 0])
+    return sums
+
+
+def check_label_path(count, image_size, repeat, seed=0):
+    """标签图统计与逐细胞循环的耗时对比（各取最小值），结果必须完全一致"""
+    image, cells = overlapping_cells(count, image_size, seed=seed)
+    label_seconds, loop_seconds = float('inf'), float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        label_result, layer_count = label_path_sums(image, cells)
+        label_seconds = min(label_seconds, time.perf_counter() - start)
+        start = time.perf_counter()
+        loop_result = per_cell_sums(image, cells)
+        loop_seconds = min(loop_seconds, time.perf_counter() - start)
+    return {
+        'cells': count,
+        'image_size': image_size,
+        'layers': layer_count,
+        'label_seconds': label_seconds,
+        'per_cell_seconds': loop_seconds,
+        'identical': bool(np.array_equal(label_result, loop_result)),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """返回回归描述列表；只比较两边都有的场景"""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+
+        timings = {f"stage:{k}": (v, base['stages'].get(k)) for k, v in current['stages'].items()}
+        timings['analyze'] = (current['analyze_seconds'], base['analyze_seconds'])
+        timings['peak_traced_mb'] = (current['peak_traced_mb'], base['peak_traced_mb'])
+        for key, (value, reference) in timings.items():
+            # 极短的阶段计时噪声大，低于1ms不比较
+            if reference is None or reference < 1e-3:
+                continue
+            if value > reference * (1 + tolerance):
+                regressions.append(f"{name} {key}: {reference:.4f} → {value:.4f} (+{(value / reference - 1) * 100:.0f}%)")
+
+        for key, value in current['metrics'].items():
+            reference = base['metrics'].get(key)
+            if reference is not None and not np.isclose(value, reference, rtol=1e-6):
+                regressions.append(f"{name} 指标 {key}: {reference} → {value}")
+    return regressions
+
+
+def print_results(results):
+    stage_names = list(next(iter(results.values()))['stages'])
+    header = f"{'场景':<14}" + ''.join(f"{s:>12}" for s in stage_names) + f"{'analyze':>12}{'峰值MB':>10}{'准确率':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        row = f"{name:<14}" + ''.join(f"{r['stages'][s] * 1000:>10.1f}ms" for s in stage_names)
+        row += f"{r['analyze_seconds'] * 1000:>10.1f}ms{r['peak_traced_mb']:>10.1f}{r['grade_accuracy']:>8.3f}"
+        print(row)
+    print()
+    for name, r in results.items():
+        rates = ', '.join(f"{s} {v:,.0f}" for s, v in r['cells_per_sec'].items() if v)
+        print(f"{name}: analyze {r['analyze_cells_per_sec']:,.0f} cells/s（{rates}）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成IHC切片上的分阶段基准测试")
+    parser.add_argument('--cells', default='1000,10000,50000', help="细胞数量，逗号分隔")
+    parser.add_argument('--grade-mix', default='0.4,0.2,0.2,0.2', help="阴性/弱/中/强阳性比例")
+    parser.add_argument('--cell-radius', default='5,9', help="细胞半轴长度范围（像素）")
+    parser.add_argument('--image-size', default=None, help="图像尺寸 高,宽（默认按细胞数量自动确定）")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子")
+    parser.add_argument('--repeat', type=int, default=3, help="每个场景重复次数（取最小耗时）")
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help="基准结果JSON路径")
+    parser.add_argument('--update-baseline', action='store_true', help="用本次结果覆盖基准")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="允许的耗时/内存增幅（默认0.2即20%%）")
+    parser.add_argument('--output', default=None, help="本次结果JSON输出路径")
+    parser.add_argument('--label-cells', type=int, default=12000,
+                        help="标签图统计对比逐细胞循环时的重叠细胞数量（0表示跳过）")
+    parser.add_argument('--label-image-size', type=int, default=2048, help="标签图对比的图像边长")
+    args = parser.parse_args()
+
+    grade_mix = tuple(float(v) for v in args.grade_mix.split(','))
+    cell_radius = tuple(int(v) for v in args.cell_radius.split(','))
+    image_size = tuple(int(v) for v in args.image_size.split(',')) if args.image_size else None
+
+    results = {}
+    for count in (int(v) for v in args.cells.split(',')):
+        name = f"{count}cells"
+        print(f"运行场景 {name}...")
+        spec = SlideSpec(cell_count=count, grade_mix=grade_mix, cell_radius=cell_radius,
+                         image_size=image_size, seed=args.seed)
+        results[name] = to_jsonable(run_scenario(spec, args.repeat))
+
+    label_check = None
+    if args.label_cells:
+        print(f"对比标签图统计与逐细胞循环（{args.label_cells} 个重叠细胞）...")
+        label_check = check_label_path(args.label_cells, args.label_image_size, args.repeat, args.seed)
+
+    print("\n" + "=" * 60)
+    print_results(results)
+    if label_check:
+        print(f"\n标签图统计（{label_check['layers']} 层）: {label_check['label_seconds'] * 1000:.1f}ms，"
+              f"逐细胞循环: {label_check['per_cell_seconds'] * 1000:.1f}ms")
+    print("=" * 60)
+
+    label_failures = []
+    if label_check and not label_check['identical']:
+        label_failures.append("标签图统计与逐细胞循环的结果不一致")
+    if label_check and label_check['label_seconds'] > label_check['per_cell_seconds']:
+        label_failures.append(
+            f"标签图统计比逐细胞循环慢：{label_check['label_seconds']:.3f}s > {label_check['per_cell_seconds']:.3f}s")
+
+    report = {
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(),
+                    'cpu_count': os.cpu_count()},
+        'config': {'grade_mix': grade_mix, 'cell_radius': cell_radius, 'image_size': image_size,
+                   'seed': args.seed, 'repeat': args.repeat},
+        'results': results,
+        'label_check': label_check,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for line in label_failures:
+        print(f"❌ {line}")
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"基准已更新: {baseline_path}")
+        sys.exit(1 if label_failures else 0)
+
+    if not baseline_path.exists():
+        print(f"未找到基准 {baseline_path}，使用 --update-baseline 生成")
+        sys.exit(1 if label_failures else 0)
+
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('config') != to_jsonable(report['config']):
+        print("⚠ 基准的合成参数与本次不同，只比较同名场景")
+    if baseline.get('machine') != report['machine']:
+        print("⚠ 基准来自不同的机器/环境，耗时比较仅供参考")
+
+    regressions = compare(results, baseline['results'], args.tolerance)
+    if regressions:
+        print(f"\n❌ 发现 {len(regressions)} 项回归：")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    if label_failures:
+        sys.exit(1)
+    print(f"\n✓ 与基准相比无回归（容差 {args.tolerance * 100:.0f}%）")
+
+
+if __name__ == "__main__":
+    main()
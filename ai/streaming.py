@@ -0,0 +1,220 @@
+"""
+流水线式流式分析
+
+analyze() 对每张图严格按顺序执行：读盘/解码时模型空闲，模型推理时磁盘空闲。
+这里把它拆成三个阶段，各自运行在独立线程中，阶段之间用有界队列连接：
+
+    解码（读盘 + JPEG解码 + 查缓存） → 推理（检测 + 分割） → 计算（颜色分级 + 指标）
+
+第 N 张图推理时，第 N+1 张图已经在解码。队列满时上游阻塞（背压），
+任意时刻在途的图像数不超过 3 × queue_size + 3，内存占用与流中图像总数无关。
+OpenCV解码、NumPy归约和大多数推理框架都会释放GIL，线程之间可以真正并行。
+
+结果严格按输入顺序产出；单张图的异常不会中断整个流。
+
+用法：
+    for source, metrics, error in stream_analyze(analyzer, image_paths):
+        ...
+
+    # 分块分析时预读tile
+    for tile, image in prefetch(((t, source.read(t.x, t.y, t.w, t.h)) for t in tiles), depth=2):
+        ...
+"""
+
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
+
+# 队列结束标记
+_DONE = object()
+
+# 放入/取出队列时检查停止信号的间隔（秒）
+_POLL_SECONDS = 0.1
+
+
+class _Item:
+    """在阶段之间传递的一张图像"""
+
+    __slots__ = ('source', 'trace', 'cache_key', 'image', 'cells', 'metrics', 'error')
+
+    def __init__(self, source: Any):
+        self.source = source
+        self.trace = None
+        self.cache_key = None
+        self.image = None
+        self.cells = None
+        self.metrics = None
+        self.error: Optional[str] = None
+
+
+def _put(q: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    """阻塞放入队列，直到成功或收到停止信号；返回是否放入"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q: queue.Queue, stop: threading.Event) -> Any:
+    """阻塞取出，收到停止信号时返回 _DONE"""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=_POLL_SECONDS)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def _run_stage(
+    func: Callable[[_Item], None],
+    inbox: queue.Queue,
+    outbox: queue.Queue,
+    stop: threading.Event
+) -> None:
+    """从 inbox 取图像执行 func 后放入 outbox；已出错或已命中缓存的图像直接传递"""
+    while True:
+        item = _get(inbox, stop)
+        if item is _DONE:
+            _put(outbox, _DONE, stop)
+            return
+        if item.error is None and item.metrics is None:
+            try:
+                func(item)
+            except Exception as e:
+                item.error = f"{type(e).__name__}: {e}"
+                item.image = item.cells = None
+        if not _put(outbox, item, stop):
+            return
+
+
+def _feed(
+    sources: Iterable[Any],
+    decode: Callable[[_Item], None],
+    outbox: queue.Queue,
+    stop: threading.Event,
+    failure: list
+) -> None:
+    """第一个阶段：遍历输入并解码；输入迭代器本身抛出的异常记录到 failure"""
+    try:
+        for source in sources:
+            item = _Item(source)
+            try:
+                decode(item)
+            except Exception as e:
+                item.error = f"{type(e).__name__}: {e}"
+            if not _put(outbox, item, stop):
+                return
+    except Exception as e:
+        failure.append(e)
+    finally:
+        _put(outbox, _DONE, stop)
+
+
+def stream_analyze(
+    analyzer,
+    sources: Iterable[Any],
+    queue_size: int = 2,
+    return_cells: bool = False
+) -> Iterator[Tuple[Any, Any, Optional[str]]]:
+    """
+    流水线分析一个图像流
+
+    Args:
+        analyzer: PathologyQuantitativeAnalyzer
+        sources: 图像路径 / BGR数组 / 分割清单记录的可迭代对象（可以是惰性生成器，
+            其本身抛出的异常在已产出的结果之后重新抛出）
+        queue_size: 相邻阶段之间的队列容量，决定预读深度和在途内存
+        return_cells: 为True时结果为 (指标, 细胞表)，与 analyze() 一致
+
+    Yields:
+        (输入, 结果, 错误信息)，顺序与输入一致；出错时结果为None
+    """
+    stop = threading.Event()
+    decoded = queue.Queue(maxsize=queue_size)
+    inferred = queue.Queue(maxsize=queue_size)
+    finished = queue.Queue(maxsize=queue_size)
+    failure = []
+
+    def decode(item: _Item) -> None:
+        item.trace = analyzer.tracer.start_trace(analyzer._trace_name(item.source))
+        item.cache_key, cached = analyzer._lookup_cache(item.source, item.trace)
+        if cached is not None:
+            item.metrics, item.cells = cached
+            return
+        item.image = analyzer._load_stage(item.source, item.trace)
+
+    def infer(item: _Item) -> None:
+        item.cells = analyzer._infer_stage(item.image, item.trace)
+
+    def measure(item: _Item) -> None:
+        item.metrics = analyzer._measure_stage(item.image, item.cells, item.trace)
+        analyzer._store_cache(item.cache_key, item.metrics, item.cells, item.trace)
+        # 图像只在本阶段之前需要，尽早释放
+        item.image = None
+        if not return_cells:
+            item.cells = None
+
+    threads = [
+        threading.Thread(target=_feed, args=(sources, decode, decoded, stop, failure), daemon=True),
+        threading.Thread(target=_run_stage, args=(infer, decoded, inferred, stop), daemon=True),
+        threading.Thread(target=_run_stage, args=(measure, inferred, finished, stop), daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = finished.get()
+            if item is _DONE:
+                break
+            if item.trace is not None:
+                item.trace.finish()
+            if item.error is not None:
+                yield item.source, None, item.error
+            else:
+                yield item.source, ((item.metrics, item.cells) if return_cells else item.metrics), None
+        if failure:
+            raise failure[0]
+    finally:
+        # 调用方提前停止迭代时通知各阶段退出
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def prefetch(iterable: Iterable[Any], depth: int = 2) -> Iterator[Any]:
+    """
+    在后台线程中提前迭代 iterable（例如读取tile），最多预读 depth 项
+
+    迭代中抛出的异常会在消费方重新抛出。
+    """
+    stop = threading.Event()
+    buffer = queue.Queue(maxsize=depth)
+    failure = []
+
+    def produce() -> None:
+        try:
+            for value in iterable:
+                if not _put(buffer, value, stop):
+                    return
+        except Exception as e:
+            failure.append(e)
+        finally:
+            _put(buffer, _DONE, stop)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            value = buffer.get()
+            if value is _DONE:
+                break
+            yield value
+        if failure:
+            raise failure[0]
+    finally:
+        stop.set()
+        thread.join()
@@ -0,0 +1,6 @@
+"""ai/ 下的模块都是平铺导入的（from cell_table import CellTable），测试时把 ai/ 加入 sys.path"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,32 @@
+"""ROI相关测试（test_roi_edits / test_roi_integrals）共用的随机细胞表和参照指标"""
+
+import numpy as np
+import pytest
+
+from cell_table import CellTable
+
+WIDTH, HEIGHT = 1200, 900
+
+
+def graded_cells(seed: int = 0, count: int = 3000) -> CellTable:
+    """随机分级的细胞；面积和IOD取整数，前缀和相减不会引入舍入差异"""
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, [WIDTH - 12, HEIGHT - 12], size=(count, 2))
+    cells = CellTable.from_detections(np.concatenate([xy, rng.uniform(4, 12, (count, 2))], axis=1),
+                                      np.ones(count))
+    cells.grade[:] = rng.choice(4, count, p=[0.5, 0.2, 0.2, 0.1])
+    cells.area_pixels[:] = rng.integers(20, 200, count)
+    cells.iod[:] = rng.integers(0, 5000, count)
+    return cells
+
+
+def reference_metrics(analyzer, cells: CellTable, keep: np.ndarray) -> dict:
+    """对保留的细胞重新计算的指标（去掉形态学指标，ROI/修正不提供这些）"""
+    subset = cells.take(np.flatnonzero(keep))
+    return analyzer._grade_metrics(
+        subset.grade_counts(), analyzer._calculate_areas(subset), analyzer._calculate_total_iod(subset))
+
+
+def assert_same_metrics(actual: dict, expected: dict):
+    for key, value in expected.items():
+        assert actual[key] == pytest.approx(value, rel=1e-9, abs=1e-9), key
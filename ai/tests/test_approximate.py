@@ -0,0 +1,34 @@
+"""快速估计：min_tissue=0 且抽完全部tile时与 analyze_tiled 一致"""
+
+import numpy as np
+import pytest
+
+from demo_pipeline import PathologyQuantitativeAnalyzer
+from opencv_detector import OpenCVCellDetector
+from synthetic_slides import SlideSpec, SyntheticSegmenter, generate_slide
+
+OVERLAP = 32
+
+
+def _analyzer():
+    # 与tile划分无关的确定性模型
+    return PathologyQuantitativeAnalyzer(OpenCVCellDetector(split_clumps=False), SyntheticSegmenter())
+
+
+def test_sampling_every_tile_reproduces_analyze_tiled():
+    image = generate_slide(SlideSpec(cell_count=1500, image_size=(1100, 1300), seed=3)).image
+    budget_mb = 48
+    tile_size = _analyzer()._tile_size(budget_mb, OVERLAP)
+
+    exact = _analyzer().analyze_tiled(image, tile_budget_mb=budget_mb, overlap=OVERLAP)
+    approx = _analyzer().analyze_approximate(image, tile_size=tile_size, overlap=OVERLAP,
+                                             min_tissue=0.0, min_tiles=10 ** 6)
+
+    info = approx.pop('approximate')
+    assert info['tiles_sampled'] == info['tiles_total'] > 4
+    assert not info['stopped_early']
+    assert exact['total_cells'] > 1000
+    for key, value in approx.items():
+        assert value == pytest.approx(exact[key], rel=1e-9, abs=1e-9), key
+    for name, (low, high) in info['ci'].items():
+        assert low == pytest.approx(high) == pytest.approx(approx[name])
@@ -0,0 +1,96 @@
+"""批处理：结果按输入顺序返回，任务日志支持中断后续跑"""
+
+import json
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import batch_runner
+from batch_runner import JobJournal, run_batch
+from cell_table import CellTable
+from json_utils import to_jsonable
+
+
+def count_task(path: str):
+    """记录每次调用（在工作进程中执行，用文件计数），名字含 'bad' 的图像失败"""
+    with open(path + '.calls', 'a') as f:
+        f.write('x')
+    if 'bad' in os.path.basename(path):
+        raise ValueError('broken image')
+    return {'size': np.int64(len(path)), 'values': np.arange(2)}
+
+
+def _calls(path) -> int:
+    marker = str(path) + '.calls'
+    return len(open(marker).read()) if os.path.exists(marker) else 0
+
+
+def test_journal_resume_skips_completed_and_retries_failures(tmp_path):
+    paths = [tmp_path / name for name in ('a.jpg', 'bad.jpg', 'c.jpg')]
+    for path in paths:
+        path.write_bytes(b'')
+    journal = str(tmp_path / 'journal.jsonl')
+
+    first = run_batch(paths, task=count_task, workers=2, journal_path=journal)
+    assert [r['status'] for r in first] == ['ok', 'error', 'ok']
+    assert first[0]['result'] == {'size': len(str(paths[0])), 'values': [0, 1]}
+
+    # 模拟崩溃时写了半行
+    with open(journal, 'a') as f:
+        f.write('{"path": "' + str(paths[2]))
+
+    second = run_batch(paths, task=count_task, workers=2, journal_path=journal)
+    assert [r['path'] for r in second] == [str(p) for p in paths]
+    assert [r['status'] for r in second] == ['ok', 'error', 'ok']
+    # 成功的图像不再执行，失败的图像重试
+    assert [_calls(p) for p in paths] == [1, 2, 1]
+
+
+def test_journal_error_revokes_earlier_success(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = JobJournal(path)
+    journal.record('x.jpg', {'irs': 3}, None)
+    journal.record('x.jpg', None, 'failed later')
+    journal.close()
+    reopened = JobJournal(path)
+    reopened.close()
+    assert reopened.completed == {}
+
+
+def test_to_jsonable_converts_numpy():
+    value = {'a': np.float32(1.5), 'b': [np.int8(2), np.zeros(2)], 'c': (1, 'x')}
+    assert json.dumps(to_jsonable(value)) == '{"a": 1.5, "b": [2, [0.0, 0.0]], "c": [1, "x"]}'
+
+
+def _same_stem_images(tmp_path):
+    paths = []
+    for seed, folder in enumerate(('a', 'b')):
+        (tmp_path / folder).mkdir()
+        paths.append(tmp_path / folder / 'slide.png')
+        image = np.random.default_rng(seed).integers(0, 256, (96, 96 + 32 * seed, 3), dtype=np.uint8)
+        cv2.imwrite(str(paths[-1]), image)
+    return paths
+
+
+def test_same_stem_images_keep_separate_cell_tables(tmp_path):
+    paths = _same_stem_images(tmp_path)
+    cells_dir = tmp_path / 'cells'
+    results = run_batch(paths, workers=1, cells_dir=str(cells_dir))
+    assert [r['status'] for r in results] == ['ok', 'ok']
+
+    saved = sorted(cells_dir.glob('slide-*.npz'))
+    assert len(saved) == 2
+    assert {path.name for path in saved} == {batch_runner._cells_filename(str(p)) for p in paths}
+    for path, result in zip(paths, results):
+        cells = CellTable.load(str(cells_dir / batch_runner._cells_filename(str(path))))
+        assert len(cells) == result['result']['total_cells']
+
+
+def test_cell_filename_collision_fails_before_running(tmp_path, monkeypatch):
+    paths = _same_stem_images(tmp_path)
+    monkeypatch.setattr(batch_runner, '_cells_filename', lambda source: 'slide.npz')
+    with pytest.raises(ValueError, match='slide.npz'):
+        run_batch(paths, workers=1, cells_dir=str(tmp_path / 'cells'))
+    assert not (tmp_path / 'cells').exists()
@@ -0,0 +1,66 @@
+"""列式导出：写入后读回与细胞表一致；写入中途出错时不发布数据集"""
+
+import numpy as np
+import pytest
+
+from cell_export import CellWriter, iter_cell_chunks, open_cells, read_metadata, to_cell_table
+from cell_table import CellTable
+
+
+def _table(rng, count):
+    table = CellTable(count)
+    for name, (dtype, shape) in CellTable.COLUMNS.items():
+        setattr(table, name, rng.uniform(0, 100, (count,) + shape).astype(dtype))
+    return table
+
+
+def _formats():
+    formats = ['npy']
+    try:
+        import pyarrow  # noqa: F401
+        formats.append('parquet')
+    except ImportError:
+        pass
+    return formats
+
+
+@pytest.mark.parametrize('format', _formats())
+def test_round_trip(tmp_path, format):
+    rng = np.random.default_rng(0)
+    parts = [(_table(rng, 40), 'a'), (_table(rng, 0), 'empty'), (_table(rng, 25), 'b'), (_table(rng, 10), 'a')]
+    path = str(tmp_path / ('cells' if format == 'npy' else 'cells.parquet'))
+    with CellWriter(path, format, {'pixel_to_mm_ratio': 350}) as writer:
+        for cells, sample in parts:
+            writer.write(cells, sample)
+
+    meta = read_metadata(path)
+    assert meta['rows'] == 75
+    assert meta['samples'] == ['a', 'empty', 'b']
+    assert meta['metadata'] == {'pixel_to_mm_ratio': 350}
+
+    columns = open_cells(path)
+    np.testing.assert_array_equal(columns['sample'], [0] * 40 + [2] * 25 + [0] * 10)
+    restored = to_cell_table(columns)
+    expected = CellTable.concat([cells for cells, _ in parts])
+    for name in CellTable.COLUMNS:
+        np.testing.assert_array_equal(getattr(restored, name), getattr(expected, name))
+
+    chunks = list(iter_cell_chunks(path, chunk_rows=30, columns=['grade']))
+    np.testing.assert_array_equal(np.concatenate([chunk['grade'] for chunk in chunks]), expected.grade)
+
+
+@pytest.mark.parametrize('format', _formats())
+def test_exception_does_not_publish_dataset(tmp_path, format):
+    rng = np.random.default_rng(1)
+    path = str(tmp_path / ('cells' if format == 'npy' else 'cells.parquet'))
+    with CellWriter(path, format) as writer:
+        writer.write(_table(rng, 5), 'complete')
+
+    with pytest.raises(RuntimeError):
+        with CellWriter(path, format) as writer:
+            writer.write(_table(rng, 5), 'partial')
+            raise RuntimeError('tile failed')
+
+    # 上一次完整的数据集也已失效，不会把新旧数据混在一起
+    with pytest.raises(OSError):
+        read_metadata(path)
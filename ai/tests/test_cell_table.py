@@ -0,0 +1,107 @@
+"""细胞表和bit-packed mask：保存/读取、选取、拼接、RLE都能还原原始数据"""
+
+import numpy as np
+import pytest
+
+from cell_masks import CellMasks, rle_decode, rle_encode
+from cell_table import CellTable
+
+
+def _random_masks(rng, count=30):
+    masks = []
+    for i in range(count):
+        h, w = rng.integers(1, 25, 2)
+        masks.append(None if i % 7 == 3 else rng.random((h, w)) > 0.5)
+    return masks
+
+
+def _random_table(rng, count=30):
+    table = CellTable(count)
+    for name, (dtype, shape) in CellTable.COLUMNS.items():
+        values = rng.uniform(0, 100, (count,) + shape)
+        setattr(table, name, values.astype(dtype))
+    masks = _random_masks(rng, count)
+    table.masks = CellMasks.from_masks(masks)
+    return table, masks
+
+
+def _assert_masks(actual: CellMasks, expected):
+    assert len(actual) == len(expected)
+    for got, want in zip(actual, expected):
+        if want is None:
+            assert got is None
+        else:
+            np.testing.assert_array_equal(got, want)
+    for i, want in enumerate(expected):
+        got = actual[i]
+        assert (got is None) if want is None else np.array_equal(got, want)
+
+
+def test_masks_round_trip():
+    rng = np.random.default_rng(0)
+    masks = _random_masks(rng)
+    packed = CellMasks.from_masks(masks)
+    _assert_masks(packed, masks)
+    np.testing.assert_array_equal(packed.areas(), [0 if m is None else m.sum() for m in masks])
+    assert packed.nbytes < sum(m.nbytes for m in masks if m is not None)
+
+    cell, row, col = packed.pixels()
+    for i, mask in enumerate(masks):
+        want = np.zeros((0, 2)) if mask is None else np.argwhere(mask)
+        np.testing.assert_array_equal(np.stack([row, col], axis=1)[cell == i].reshape(-1, 2), want)
+
+    _assert_masks(CellMasks.from_arrays(packed.to_arrays()), masks)
+    index = [5, 3, 0, 3, 29]
+    _assert_masks(packed.take(index), [masks[i] for i in index])
+    _assert_masks(CellMasks.concat([packed.take([0, 1]), CellMasks.empty(2), packed.take([2])]),
+                  [masks[0], masks[1], None, None, masks[2]])
+
+
+@pytest.mark.parametrize('masks_saved', [True, False])
+def test_table_save_load(tmp_path, masks_saved):
+    rng = np.random.default_rng(1)
+    table, masks = _random_table(rng)
+    path = str(tmp_path / 'cells.npz')
+    table.save(path, masks=masks_saved)
+    loaded = CellTable.load(path)
+
+    for name, (dtype, _) in CellTable.COLUMNS.items():
+        assert getattr(loaded, name).dtype == dtype
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(table, name))
+    _assert_masks(loaded.masks, masks if masks_saved else [None] * len(masks))
+
+
+def test_load_fills_missing_columns(tmp_path):
+    # 旧版本保存的文件没有形态学列
+    path = str(tmp_path / 'old.npz')
+    np.savez(path, bbox=np.ones((3, 4), np.float32), grade=np.array([0, 2, 3], np.int8))
+    loaded = CellTable.load(path)
+    np.testing.assert_array_equal(loaded.grade, [0, 2, 3])
+    np.testing.assert_array_equal(loaded.perimeter, np.zeros(3, np.float32))
+    assert list(loaded.masks) == [None, None, None]
+
+
+def test_take_and_concat_keep_rows_aligned():
+    rng = np.random.default_rng(2)
+    table, masks = _random_table(rng)
+    keep = table.grade % 2 == 0
+    parts = [table.take(keep), table.take(~keep)]
+    merged = CellTable.concat(parts)
+    order = np.concatenate([np.flatnonzero(keep), np.flatnonzero(~keep)])
+    for name in CellTable.COLUMNS:
+        np.testing.assert_array_equal(getattr(merged, name), getattr(table, name)[order])
+    _assert_masks(merged.masks, [masks[i] for i in order])
+    assert len(CellTable.concat([])) == 0
+
+
+def test_rle_round_trip():
+    rng = np.random.default_rng(3)
+    for shape in [(1, 1), (5, 7), (16, 3)]:
+        for mask in (rng.random(shape) > 0.5, np.ones(shape, bool), np.zeros(shape, bool)):
+            counts = rle_encode(mask)
+            assert counts.sum() == mask.size
+            np.testing.assert_array_equal(rle_decode(counts, shape), mask)
+    table, masks = _random_table(rng, 8)
+    rle = table.masks.rle(0)
+    assert rle['size'] == list(masks[0].shape)
+    np.testing.assert_array_equal(rle_decode(rle['counts'], rle['size']), masks[0])
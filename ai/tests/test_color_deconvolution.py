@@ -0,0 +1,63 @@
+"""H-DAB颜色反卷积：纯染色像素分到对应通道，查找表与公式一致，分tile统计可以相加"""
+
+import numpy as np
+import pytest
+
+from color_deconvolution import (
+    DAB_RGB, HEMATOXYLIN_RGB, I0, OD_LUT, StainMeasurement, deconvolve, measure_stains,
+)
+from synthetic_slides import SlideSpec, generate_slide
+from tiling import iter_tile_grid
+
+
+def _stain_pixel(stain_rgb: np.ndarray, concentration: float) -> np.ndarray:
+    """只含一种染色的 1×1 BGR 像素：I = I0 · 10^(-c · 单位染色向量)"""
+    od = concentration * stain_rgb / np.linalg.norm(stain_rgb)
+    rgb = np.round(I0 * 10 ** -od).astype(np.uint8)
+    return rgb[::-1].reshape(1, 1, 3)
+
+
+@pytest.mark.parametrize('concentration', [0.3, 1.0])
+def test_pure_stains_land_in_their_channel(concentration):
+    hematoxylin, dab = deconvolve(_stain_pixel(DAB_RGB, concentration))
+    assert dab[0, 0] == pytest.approx(concentration, abs=0.02)
+    assert hematoxylin[0, 0] < 0.02
+
+    hematoxylin, dab = deconvolve(_stain_pixel(HEMATOXYLIN_RGB, concentration))
+    assert hematoxylin[0, 0] == pytest.approx(concentration, abs=0.02)
+    assert dab[0, 0] < 0.02
+
+
+def test_white_background_is_not_tissue():
+    image = np.full((4, 4, 3), 255, dtype=np.uint8)
+    measurement, dab, positive = measure_stains(image)
+    assert measurement == StainMeasurement()
+    assert not dab.any() and not positive.any()
+
+
+def test_od_lut_matches_formula():
+    intensity = np.arange(1, 256)
+    np.testing.assert_allclose(OD_LUT[1:], -np.log10(intensity / I0), rtol=1e-6, atol=1e-6)
+    # 0 按 1 处理，避免 log(0)
+    assert OD_LUT[0] == OD_LUT[1]
+    assert OD_LUT[255] == 0
+
+
+def test_tile_sums_equal_whole_image():
+    image = generate_slide(SlideSpec(cell_count=600, image_size=(500, 700), seed=5)).image
+    height, width = image.shape[:2]
+    whole = measure_stains(image)[0]
+    assert whole.tissue_pixels > 0 and whole.positive_pixels > 0
+
+    total = StainMeasurement()
+    tiles = list(iter_tile_grid(width, height, 160, 24))
+    assert len(tiles) > 4
+    for tile in tiles:
+        tile_image = image[tile.y:tile.y + tile.h, tile.x:tile.x + tile.w]
+        total += measure_stains(tile_image, valid_mask=tile.core_mask())[0]
+
+    assert total.tissue_pixels == whole.tissue_pixels
+    assert total.positive_pixels == whole.positive_pixels
+    assert total.dab_iod == pytest.approx(whole.dab_iod, rel=1e-9)
+    assert total.hematoxylin_iod == pytest.approx(whole.hematoxylin_iod, rel=1e-9)
+    assert total.to_metrics(350) == whole.to_metrics(350)
@@ -0,0 +1,71 @@
+"""整图分析：指标与原实现一致，分块分析与整图分析的指标一致，tile大小受总内存预算约束"""
+
+import pytest
+
+from demo_pipeline import PathologyQuantitativeAnalyzer
+from opencv_detector import OpenCVCellDetector
+from synthetic_slides import SlideSpec, SyntheticSegmenter, generate_slide
+from tiling import TILE_BYTES_PER_PIXEL, iter_tile_grid
+
+OVERLAP = 32
+
+# 原逐细胞实现（_classify_cells / _calculate_total_iod 逐个裁剪）在同一张合成图、
+# 同样的检测框和mask上得到的指标；键和值都不应随实现优化而改变
+BASELINE_METRICS = {
+    'total_cells': 60,
+    'weak_positive_cells': 7,
+    'moderate_positive_cells': 18,
+    'strong_positive_cells': 13,
+    'tissue_area_mm2': 0.07,
+    'tissue_area_pixels': 8578,
+    'positive_area_mm2': 0.0443,
+    'positive_area_pixels': 5423,
+    'positive_ratio': 63.33,
+    'positive_density': 543.0,
+    'h_score': 136.67,
+    'irs': 6,
+    'mean_density': 0.0016,
+    'iod': 875062.0,
+    'si': 2,
+    'pp': 3,
+}
+
+
+def _analyzer(detect_batch_size: int = 2):
+    # 与tile划分无关的确定性模型
+    return PathologyQuantitativeAnalyzer(OpenCVCellDetector(split_clumps=False), SyntheticSegmenter(),
+                                         detect_batch_size=detect_batch_size)
+
+
+def test_analyze_matches_baseline_metrics():
+    image = generate_slide(SlideSpec(cell_count=60, image_size=(300, 400), seed=7)).image
+    metrics = _analyzer().analyze(image)
+    assert BASELINE_METRICS.keys() <= metrics.keys()
+    for key, value in BASELINE_METRICS.items():
+        assert metrics[key] == value, key
+
+
+def test_analyze_tiled_matches_analyze():
+    """跨tile边界的细胞既不重复计数也不丢失"""
+    image = generate_slide(SlideSpec(cell_count=1500, image_size=(1100, 1300), seed=3)).image
+    budget_mb = 12
+    analyzer = _analyzer()
+    tile_size = analyzer._tile_size(budget_mb, OVERLAP)
+    assert len(list(iter_tile_grid(1300, 1100, tile_size, OVERLAP))) > 4
+
+    whole = _analyzer().analyze(image)
+    tiled = analyzer.analyze_tiled(image, tile_budget_mb=budget_mb, overlap=OVERLAP)
+    assert whole['total_cells'] > 1000
+    assert tiled.keys() == whole.keys()
+    for key, value in whole.items():
+        assert tiled[key] == pytest.approx(value, rel=1e-9, abs=1e-9), key
+
+
+@pytest.mark.parametrize('detect_batch_size', [1, 8])
+def test_tile_budget_covers_all_tiles_in_flight(detect_batch_size):
+    budget_mb = 256
+    tile_size = _analyzer(detect_batch_size)._tile_size(budget_mb, OVERLAP)
+    # 正在分析、预读队列中、预读线程正在读取的各一批
+    in_flight = 3 * detect_batch_size
+    assert in_flight * tile_size ** 2 * TILE_BYTES_PER_PIXEL <= budget_mb * 1024 * 1024
+    assert in_flight * (tile_size + 1) ** 2 * TILE_BYTES_PER_PIXEL > budget_mb * 1024 * 1024 * 0.99
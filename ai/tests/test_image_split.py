@@ -0,0 +1,58 @@
+"""分隔线检测：灰线的通道范围与原脚本（uint8回绕后的 200-229）一致"""
+
+import numpy as np
+import pytest
+
+from image_split import find_seam, split_at_seam
+
+
+def _pair(seam_value: int, seam_col: int = 210, width: int = 400) -> np.ndarray:
+    image = np.full((60, width, 3), 90, dtype=np.uint8)
+    image[:, seam_col] = seam_value
+    return image
+
+
+@pytest.mark.parametrize('value', [200, 215, 229])
+def test_gray_seam_inside_original_band(value):
+    assert find_seam(_pair(value), 'gray') == 210
+
+
+@pytest.mark.parametrize('value', [171, 199, 230])
+def test_gray_seam_outside_original_band(value):
+    # 找不到时退回图像中线
+    assert find_seam(_pair(value), 'gray') == 200
+
+
+def test_auto_falls_back_to_white_seam():
+    image = _pair(250, seam_col=230)
+    assert find_seam(image, 'auto') == 230
+    left, right = split_at_seam(image, 230)
+    assert left.shape[1] + right.shape[1] == image.shape[1] - 1
+
+
+def _split_new_images_seam(image: np.ndarray) -> int:
+    """原 split_new_images.py 的逐列查找（默认 --style white 要与它一致）"""
+    width = image.shape[1]
+    mid = width // 2
+    for x in range(mid - 100, mid + 100):
+        if x < 0 or x >= width:
+            continue
+        col = image[:, x, :]
+        if np.all(col > 180) or (np.std(col) < 10 and np.mean(col) > 150):
+            return x
+    return mid
+
+
+def test_white_style_matches_split_new_images():
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        width = int(rng.integers(150, 400))
+        image = rng.integers(0, 256, (60, width, 3), dtype=np.uint8)
+        # 白色分隔线；它左侧有一列大半是灰色、其余是深色，落在灰线范围内但不是白线
+        seam = width // 2 + int(rng.integers(-40, 40))
+        image[:, seam] = rng.integers(235, 256, (60, 3))
+        image[:40, seam - 10] = 210
+        image[40:, seam - 10] = 30
+        assert find_seam(image, 'white') == _split_new_images_seam(image)
+    assert find_seam(image, 'white') == seam
+    assert find_seam(image, 'auto') == seam - 10
@@ -0,0 +1,122 @@
+"""推理服务（演示桩模型，离线）：微批处理、坏请求返回400、整批失败时逐张重试"""
+
+import asyncio
+import json
+
+import cv2
+import numpy as np
+
+from demo_pipeline import PathologyQuantitativeAnalyzer
+from inference_service import InferenceService
+
+
+async def _request(port: int, head: str, body: bytes = b''):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(head.encode('latin-1') + b'\r\n' + body)
+    await writer.drain()
+    status_line = await reader.readline()
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    payload = json.loads(await reader.readexactly(int(headers['content-length'])))
+    writer.close()
+    return int(status_line.split()[1]), payload
+
+
+def _post_image(port: int, image: np.ndarray):
+    body = cv2.imencode('.png', image)[1].tobytes()
+    head = (f"POST /analyze HTTP/1.1\r\nContent-Type: image/png\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n")
+    return _request(port, head, body)
+
+
+def _run(service: InferenceService, scenario):
+    async def main():
+        await service.start()
+        server = await asyncio.start_server(service.serve_connection, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await scenario(port)
+        finally:
+            server.close()
+            await service.stop()
+    return asyncio.run(main())
+
+
+def _image(seed: int, size: int = 96) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 256, (size, size, 3), dtype=np.uint8)
+
+
+def test_concurrent_requests_are_batched():
+    service = InferenceService(PathologyQuantitativeAnalyzer(None, None), max_batch=4, max_wait_ms=200)
+
+    async def scenario(port):
+        return await asyncio.gather(*[_post_image(port, _image(i)) for i in range(4)])
+
+    responses = _run(service, scenario)
+    assert [status for status, _ in responses] == [200] * 4
+    assert all('h_score' in payload['result'] for _, payload in responses)
+    assert service.batched_images_total == 4 and service.batches_total < 4
+
+
+def test_bad_content_length_is_400():
+    service = InferenceService(PathologyQuantitativeAnalyzer(None, None))
+
+    async def scenario(port):
+        return [await _request(port, f"POST /analyze HTTP/1.1\r\nContent-Length: {value}\r\n")
+                for value in ('abc', '-5')]
+
+    responses = _run(service, scenario)
+    assert [status for status, _ in responses] == [400, 400]
+    assert service.requests_total == 0
+
+
+def test_failed_batch_is_retried_per_image():
+    analyzer = PathologyQuantitativeAnalyzer(None, None)
+    analyze_batch = analyzer.analyze_batch
+    calls = []
+
+    def flaky(images, return_cells=False):
+        calls.append(len(images))
+        # 尺寸为 64 的图像让整批失败
+        if any(image.shape[0] == 64 for image in images):
+            raise RuntimeError('model crashed')
+        return analyze_batch(images, return_cells)
+
+    analyzer.analyze_batch = flaky
+    service = InferenceService(analyzer, max_batch=3, max_wait_ms=200)
+
+    async def scenario(port):
+        images = [_image(0), _image(1, size=64), _image(2)]
+        return await asyncio.gather(*[_post_image(port, image) for image in images])
+
+    responses = _run(service, scenario)
+    assert [status for status, _ in responses] == [200, 500, 200]
+    assert 'model crashed' in responses[1][1]['error']
+    assert calls[0] == 3 and calls[1:] == [1, 1, 1]
+    assert service.errors_total == 1
+
+
+def test_undecodable_request_keeps_its_400_when_the_only_image_fails():
+    analyzer = PathologyQuantitativeAnalyzer(None, None)
+
+    def broken(images, return_cells=False):
+        raise RuntimeError('model crashed')
+
+    analyzer.analyze_batch = broken
+    service = InferenceService(analyzer, max_batch=2, max_wait_ms=200)
+
+    async def scenario(port):
+        body = b'not an image'
+        head = (f"POST /analyze HTTP/1.1\r\nContent-Type: image/png\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n")
+        return await asyncio.gather(_request(port, head, body), _post_image(port, _image(0)))
+
+    responses = _run(service, scenario)
+    assert [status for status, _ in responses] == [400, 500]
+    assert 'model crashed' in responses[1][1]['error']
+    assert service.batches_total == 1
@@ -0,0 +1,91 @@
+"""标签图归约（rasterize_labels + label_sums）与逐细胞裁剪统计一致"""
+
+import cv2
+import numpy as np
+
+from cell_masks import CellMasks
+from cell_table import CellTable
+from demo_pipeline import PathologyQuantitativeAnalyzer
+from label_image import label_sums, rasterize_labels
+
+
+def _random_cells(rng, image_size=200, count=40):
+    """随机bbox（互相重叠、部分超出图像边界）+ 随机mask"""
+    xy = rng.integers(-10, image_size - 5, size=(count, 2))
+    wh = rng.integers(4, 30, size=(count, 2))
+    cells = CellTable.from_detections(np.concatenate([xy, wh], axis=1), np.ones(count))
+    masks = [rng.random((h, w)) > 0.4 for w, h in wh]
+    masks[3] = None
+    cells.masks = CellMasks.from_masks(masks)
+    return cells, masks
+
+
+def test_overlapping_masks_split_into_conflict_free_layers():
+    rng = np.random.default_rng(0)
+    cells, masks = _random_cells(rng)
+    layers = rasterize_labels((200, 200), cells.bbox_pixels(), cells.masks)
+    assert len(layers) > 1
+
+    counts, = label_sums(layers, len(cells))
+    for i, ((x0, y0, x1, y1), mask) in enumerate(zip(cells.bbox_pixels(), masks)):
+        if mask is None:
+            assert counts[i] == 0
+            continue
+        cx0, cy0, cx1, cy1 = max(x0, 0), max(y0, 0), min(x1, 200), min(y1, 200)
+        assert counts[i] == mask[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0].sum()
+
+
+def test_measure_cells_matches_per_cell_loop():
+    rng = np.random.default_rng(1)
+    image = rng.integers(0, 256, size=(200, 200, 3), dtype=np.uint8)
+    cells, masks = _random_cells(rng)
+    analyzer = PathologyQuantitativeAnalyzer(None, None)
+    analyzer._classify_cells(image, cells)
+
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    od = 255 - cv2.cvtColor(image, cv2.COLOR_BGR2GRAY).astype(np.float64)
+    for i, ((x0, y0, x1, y1), mask) in enumerate(zip(cells.bbox_pixels(), masks)):
+        if mask is None:
+            assert cells.grade[i] == 0 and cells.iod[i] == 0
+            continue
+        cx0, cy0, cx1, cy1 = max(x0, 0), max(y0, 0), min(x1, 200), min(y1, 200)
+        cell_mask = mask[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0]
+        pixels = hsv[cy0:cy1, cx0:cx1][cell_mask]
+        if len(pixels) == 0:
+            continue
+        np.testing.assert_allclose(
+            [cells.mean_h[i], cells.mean_s[i], cells.mean_v[i]], pixels.mean(axis=0), rtol=1e-5)
+        assert cells.iod[i] == od[cy0:cy1, cx0:cx1][cell_mask].sum()
+
+        grade, _ = analyzer._classify_cell_positivity(image[cy0:cy1, cx0:cx1], cell_mask)
+        assert cells.grade[i] == grade
+
+
+def _assert_counts(layers, count, bboxes, masks):
+    counts, = label_sums(layers, count)
+    np.testing.assert_array_equal(counts, [m.sum() for m in masks])
+    for layer in layers:
+        labels, y, x = layer.labeled_pixels()
+        x0, y0, x1, y1 = bboxes[labels - 1].T
+        assert ((x >= x0) & (x < x1) & (y >= y0) & (y < y1)).all()
+
+
+def test_extra_layers_cover_only_their_cells():
+    """只在右下角重叠时，第二层只覆盖那一小块"""
+    bboxes = np.array([[0, 0, 20, 20], [150, 150, 170, 170], [160, 160, 180, 180]])
+    masks = [np.ones((20, 20), dtype=bool)] * 3
+    layers = rasterize_labels((200, 200), bboxes, masks)
+    assert len(layers) == 2
+    assert layers[0].labels.shape == (200, 200)
+    assert layers[1].labels.shape[0] <= 20 and layers[1].labels.shape[1] <= 20
+    assert layers[1].y0 >= 150 and layers[1].x0 >= 150
+    _assert_counts(layers, 3, bboxes, masks)
+
+
+def test_more_stacked_cells_than_one_placement_holds():
+    """20个完全重叠的细胞超过一次放置的16层，剩下的再放一轮"""
+    bboxes = np.tile([[30, 40, 45, 52]], (20, 1))
+    masks = [np.ones((12, 15), dtype=bool)] * 20
+    layers = rasterize_labels((100, 100), bboxes, masks)
+    assert len(layers) == 20
+    _assert_counts(layers, 20, bboxes, masks)
@@ -0,0 +1,61 @@
+"""模型注册表：按补全默认值后的参数缓存，每个进程只加载一次"""
+
+import threading
+
+import pytest
+
+import model_registry
+
+
+@pytest.fixture
+def counting_loader():
+    calls = []
+
+    def load(name: str = 'base', options=None):
+        calls.append((name, options))
+        return object()
+
+    model_registry.register_loader('counting', load)
+    yield calls
+    model_registry.clear()
+    model_registry._LOADERS.pop('counting', None)
+
+
+def test_default_and_explicit_params_share_one_instance(counting_loader):
+    first = model_registry.get_model('counting')
+    assert model_registry.get_model('counting', name='base') is first
+    assert model_registry.get_model('counting', name='other') is not first
+    assert len(counting_loader) == 2
+
+
+def test_unhashable_params_are_frozen(counting_loader):
+    first = model_registry.get_model('counting', options={'sizes': [1, 2]})
+    assert model_registry.get_model('counting', options={'sizes': [1, 2]}) is first
+    assert len(counting_loader) == 1
+
+
+def test_unknown_params_and_kinds_raise(counting_loader):
+    with pytest.raises(TypeError):
+        model_registry.get_model('counting', bogus=1)
+    with pytest.raises(KeyError):
+        model_registry.get_model('no-such-model')
+
+
+def test_concurrent_requests_load_once(counting_loader):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(model_registry.get_model('counting')))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(counting_loader) == 1
+    assert all(model is results[0] for model in results)
+
+
+def test_opencv_detector_defaults_normalized():
+    try:
+        detector = model_registry.get_model('opencv')
+        assert model_registry.get_model('opencv', max_area=500) is detector
+    finally:
+        model_registry.clear()
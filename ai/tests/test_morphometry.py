@@ -0,0 +1,59 @@
+"""形态测量：周长与朝向无关，与 cv2.arcLength 一致，圆度不需要截断"""
+
+import cv2
+import numpy as np
+import pytest
+
+from label_image import LabelLayer
+from morphometry import compute_morphometry
+
+
+def _measure(mask: np.ndarray):
+    layer = mask.astype(np.int32)
+    return {name: float(values[0]) for name, values in compute_morphometry([LabelLayer(layer)], 1).items()}
+
+
+def _arc_length(mask: np.ndarray) -> float:
+    contours, _ = cv2.findContours(mask.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+    return cv2.arcLength(contours[0], True)
+
+
+@pytest.mark.parametrize('radius', [3, 5, 9, 15, 30])
+def test_disc_perimeter_matches_arc_length(radius):
+    mask = np.zeros((80, 80), np.uint8)
+    cv2.circle(mask, (40, 40), radius, 1, -1)
+    features = _measure(mask)
+    assert features['perimeter'] == pytest.approx(_arc_length(mask) + 2 * np.sqrt(2), abs=1e-4)
+    assert 0.7 < features['circularity'] < 0.9
+
+
+def test_square_is_not_clipped():
+    mask = np.zeros((80, 80), np.uint8)
+    mask[10:70, 10:70] = 1
+    features = _measure(mask)
+    # 边长60的正方形：4×59 + 4个切角 √2/2
+    assert features['perimeter'] == pytest.approx(236 + 2 * np.sqrt(2))
+    assert features['circularity'] == pytest.approx(4 * np.pi * 3600 / features['perimeter'] ** 2)
+    assert features['circularity'] < 0.8
+
+
+def test_ellipse_perimeter_is_orientation_independent():
+    perimeters = []
+    for angle in range(0, 91, 15):
+        mask = np.zeros((100, 100), np.uint8)
+        cv2.ellipse(mask, (50, 50), (40, 10), angle, 0, 360, 1, -1)
+        features = _measure(mask)
+        perimeters.append(features['perimeter'])
+        # 朝向以180°为周期
+        difference = (features['orientation'] - angle + 90) % 180 - 90
+        assert abs(difference) < 1
+    assert max(perimeters) / min(perimeters) < 1.02
+
+
+def test_touching_cells_and_image_border():
+    layer = np.zeros((30, 30), np.int32)
+    layer[0:10, 0:10] = 1      # 贴着图像边界
+    layer[0:10, 10:20] = 2     # 与细胞1相接
+    features = compute_morphometry([LabelLayer(layer)], 2)
+    np.testing.assert_allclose(features['perimeter'], 36 + 2 * np.sqrt(2))
+    np.testing.assert_allclose(features['area'], 100)
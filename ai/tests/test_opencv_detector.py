@@ -0,0 +1,61 @@
+"""OpenCV检测器：孤立和相互接触的细胞核计数准确（包括比自适应阈值窗口大的细胞核）"""
+
+import cv2
+import numpy as np
+import pytest
+
+from opencv_detector import OpenCVCellDetector
+from synthetic_slides import SlideSpec, generate_slide
+
+NUCLEUS_BGR = (120, 80, 60)
+
+
+def _disc_grid(radius: int, n: int, pair_offset: float = 0.0) -> np.ndarray:
+    """n×n 个圆盘（pair_offset>0 时每个位置是一对相互重叠的圆盘，圆心相距 pair_offset·radius）"""
+    spacing = (5 if pair_offset else 4) * radius
+    size = n * spacing + 2 * radius
+    image = np.full((size, size, 3), 230, np.uint8)
+    for i in range(n):
+        for j in range(n):
+            cx, cy = spacing // 2 + i * spacing, spacing // 2 + j * spacing
+            cv2.circle(image, (cx, cy), radius, NUCLEUS_BGR, -1)
+            if pair_offset:
+                cv2.circle(image, (cx + int(pair_offset * radius), cy), radius, NUCLEUS_BGR, -1)
+    return image
+
+
+@pytest.mark.parametrize('radius', [5, 9, 12, 15])
+@pytest.mark.parametrize('split_clumps', [False, True])
+def test_isolated_nuclei_counted_once(radius, split_clumps):
+    detector = OpenCVCellDetector(max_area=4000, split_clumps=split_clumps)
+    xyxy, conf = detector.detect(_disc_grid(radius, 13))
+    assert len(xyxy) == 169
+    # 每个圆盘一个实例（分水岭边界会向内收缩约2像素）
+    widths = xyxy[:, 2] - xyxy[:, 0]
+    assert np.all((widths >= 2 * radius - 4) & (widths <= 2 * radius + 1))
+    assert np.all((conf > 0) & (conf <= 1))
+
+
+@pytest.mark.parametrize('radius', [5, 9, 12, 15])
+def test_touching_nuclei_split(radius):
+    image = _disc_grid(radius, 8, pair_offset=1.6)
+    assert len(OpenCVCellDetector(max_area=8000, split_clumps=False).detect(image)[0]) == 64
+    assert len(OpenCVCellDetector(max_area=4000, split_clumps=True).detect(image)[0]) == 128
+
+
+def test_tiled_detection_matches_whole_image():
+    image = _disc_grid(9, 16, pair_offset=1.6)
+    whole = OpenCVCellDetector(max_area=4000, tile_size=4096).detect(image)[0]
+    tiled = OpenCVCellDetector(max_area=4000, tile_size=256, overlap=64, workers=3).detect(image)[0]
+    assert len(whole) == len(tiled) == 512
+
+    def order(boxes):
+        return boxes[np.lexsort((boxes[:, 0], boxes[:, 1]))]
+
+    np.testing.assert_array_equal(order(whole), order(tiled))
+
+
+def test_synthetic_slide_count():
+    slide = generate_slide(SlideSpec(cell_count=400, cell_radius=(8, 14), image_size=(800, 800), seed=2))
+    detected = len(OpenCVCellDetector(max_area=1000).detect(slide.image)[0])
+    assert abs(detected - len(slide.bboxes)) <= 0.05 * len(slide.bboxes)
@@ -0,0 +1,131 @@
+"""
+批量入库：读取任务日志、按checksum匹配、COPY + upsert
+
+数据库部分需要 psycopg / psycopg_pool 和环境变量 TEST_DATABASE_URL（一次性的测试库），
+在独立的schema中执行 database/schema.sql，结束后删除该schema：
+    TEST_DATABASE_URL=postgresql://postgres:pg@localhost:55432/postgres pytest ai/tests/test_pg_ingest.py
+"""
+
+import json
+import os
+import uuid
+
+import pytest
+
+from pg_ingest import apply_schema, ingest, is_manifest_entry, iter_results, resolve_checksums
+from result_cache import image_checksum
+
+
+def _metrics(h_score: float) -> dict:
+    return {
+        'weak_positive_cells': 3, 'moderate_positive_cells': 2, 'strong_positive_cells': 1,
+        'total_cells': 10, 'positive_area_mm2': 0.01, 'tissue_area_mm2': 0.05,
+        'positive_area_pixels': 1200, 'tissue_area_pixels': 6000, 'positive_ratio': 60.0,
+        'positive_density': 120.0, 'mean_density': 0.3, 'h_score': h_score, 'irs': 6, 'iod': 1234.5,
+    }
+
+
+@pytest.fixture
+def results(tmp_path):
+    """4张图像 + 1条分割清单记录的任务日志；第4张图在数据库中没有对应样本"""
+    images = []
+    for i in range(4):
+        path = tmp_path / f'img{i}.png'
+        path.write_bytes(f'image-{i}'.encode())
+        images.append(str(path))
+
+    journal = tmp_path / 'journal.jsonl'
+    entries = [{'path': path, 'status': 'ok', 'result': _metrics(100 + i)} for i, path in enumerate(images)]
+    entries.append({'path': f'{images[0]}#left', 'status': 'ok', 'result': _metrics(1)})
+    # img1 先失败后成功；img3 成功后失败（撤销）再成功，以最后一条为准；最后有半行记录
+    entries.insert(1, {'path': images[1], 'status': 'error', 'error': 'boom'})
+    entries.append({'path': images[3], 'status': 'error', 'error': 'boom'})
+    entries.append({'path': images[3], 'status': 'ok', 'result': _metrics(103)})
+    journal.write_text('\n'.join(json.dumps(entry) for entry in entries) + '\n{"path": "trunc', encoding='utf-8')
+    return str(journal), images
+
+
+def test_resolve_checksums_reports_manifest_entries_as_missing(results):
+    journal, images = results
+    rows, missing = resolve_checksums(iter_results(journal), workers=2)
+    assert sorted(path for _, path, _ in rows) == sorted(images)
+    assert {checksum for checksum, _, _ in rows} == {image_checksum(path) for path in images}
+    assert missing == [f'{images[0]}#left']
+    assert is_manifest_entry(missing[0])
+    assert not is_manifest_entry(images[0] + '.gone#left')
+
+
+def _database_url():
+    url = os.environ.get('TEST_DATABASE_URL')
+    if not url:
+        pytest.skip("未设置 TEST_DATABASE_URL")
+    pytest.importorskip('psycopg')
+    pytest.importorskip('psycopg_pool')
+    return url
+
+
+@pytest.fixture
+def database():
+    """在临时schema中建表，产出 (连接串, 连接)"""
+    url = _database_url()
+    import psycopg
+    from psycopg.conninfo import make_conninfo
+
+    schema = f"pg_ingest_test_{uuid.uuid4().hex[:8]}"
+    with psycopg.connect(url, autocommit=True) as admin:
+        admin.execute(f'CREATE SCHEMA {schema}')
+    dsn = make_conninfo(url, options=f'-c search_path={schema},public')
+    try:
+        apply_schema(dsn)
+        with psycopg.connect(dsn, autocommit=True) as conn:
+            yield dsn, conn
+    finally:
+        with psycopg.connect(url, autocommit=True) as admin:
+            admin.execute(f'DROP SCHEMA {schema} CASCADE')
+
+
+def test_ingest_upserts_and_is_idempotent(results, database):
+    dsn, conn = database
+    journal, images = results
+    checksums = [image_checksum(path) for path in images]
+
+    case_id = conn.execute("INSERT INTO cases (identifier) VALUES ('case-1') RETURNING id").fetchone()[0]
+    sample_ids = [
+        conn.execute(
+            "INSERT INTO case_samples (case_id, modality, original_filename, storage_path, checksum) "
+            "VALUES (%s, '组织切片', %s, %s, %s) RETURNING id",
+            (case_id, os.path.basename(path), path, checksum)).fetchone()[0]
+        for path, checksum in zip(images[:2], checksums[:2])
+    ]
+    dataset_id = conn.execute(
+        "INSERT INTO datasets (name, display_name) VALUES ('ds', 'ds') RETURNING id").fetchone()[0]
+    # img0 在两张表中都有；img2 只在 samples 中，已有的 structured_data 需要保留
+    for checksum in (checksums[0], checksums[2]):
+        conn.execute(
+            "INSERT INTO samples (dataset_id, image_uri, image_checksum, structured_data) "
+            "VALUES (%s, 'uri', %s, '{\"keep\": 1}'::jsonb)", (dataset_id, checksum))
+
+    rows, missing = resolve_checksums(iter_results(journal))
+    assert len(missing) == 1
+    for _ in range(2):
+        totals = ingest(dsn, rows, chunk_size=2, workers=2)
+        assert totals['errors'] == []
+        assert totals['chunks'] == 2
+        assert totals['staged'] == 4
+        assert totals['analysis_rows'] == 2
+        assert totals['samples_updated'] == 2
+        # img3 在两张表中都没有
+        assert totals['unmatched'] == 1
+
+        analysis = dict(conn.execute(
+            "SELECT sample_id, h_score FROM sample_tissue_analysis").fetchall())
+        assert analysis == {sample_ids[0]: 100, sample_ids[1]: 101}
+        row = conn.execute(
+            "SELECT pos_cells_1_weak, irs, raw_image_path, metadata->>'source', metadata->'iod' "
+            "FROM sample_tissue_analysis WHERE sample_id = %s", (sample_ids[0],)).fetchone()
+        assert row == (3, 6, images[0], 'batch_runner', 1234.5)
+
+        structured = [value for value, in conn.execute(
+            "SELECT structured_data FROM samples ORDER BY image_checksum = %s DESC", (checksums[0],))]
+        assert structured[0] == {'keep': 1, 'tissue_analysis': _metrics(100)}
+        assert structured[1] == {'keep': 1, 'tissue_analysis': _metrics(102)}
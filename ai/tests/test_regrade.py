@@ -0,0 +1,71 @@
+"""重新分级：对保存的细胞表换阈值，与用新阈值从头分析的结果一致"""
+
+import cv2
+import numpy as np
+
+from cell_masks import CellMasks
+from cell_table import CellTable
+from demo_pipeline import DEFAULT_HSV_THRESHOLDS, PathologyQuantitativeAnalyzer
+from regrade import regrade_cohort
+
+NEW_THRESHOLDS = {**DEFAULT_HSV_THRESHOLDS, 'v_strong': 120, 'v_moderate': 170, 's_min': 80}
+
+
+def _stained_image_and_cells(seed: int):
+    """棕色系为主的随机图像（各阳性等级都有）+ 随机细胞"""
+    rng = np.random.default_rng(seed)
+    # 20像素的色块，细胞平均颜色之间拉开差距
+    hsv = np.stack([
+        rng.integers(5, 35, (12, 12)),
+        rng.integers(30, 255, (12, 12)),
+        rng.integers(40, 230, (12, 12)),
+    ], axis=-1).astype(np.uint8)
+    hsv = np.repeat(np.repeat(hsv, 20, axis=0), 20, axis=1)
+    image = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+
+    count = 80
+    xy = rng.integers(0, 220, size=(count, 2))
+    wh = rng.integers(6, 20, size=(count, 2))
+    cells = CellTable.from_detections(np.concatenate([xy, wh], axis=1), np.ones(count))
+    cells.masks = CellMasks.from_masks([rng.random((h, w)) > 0.3 for w, h in wh])
+    return image, cells
+
+
+def _fresh_metrics(image, cells, thresholds):
+    analyzer = PathologyQuantitativeAnalyzer(None, None, hsv_thresholds=thresholds)
+    return analyzer._measure_stage(image, cells, analyzer.tracer.start_trace(None)), cells
+
+
+def test_regrade_matches_fresh_analysis(tmp_path):
+    paths = []
+    expected = []
+    for seed in range(3):
+        image, cells = _stained_image_and_cells(seed)
+        _fresh_metrics(image, cells, None)
+        path = tmp_path / f'{seed}.npz'
+        cells.save(str(path))
+        paths.append(str(path))
+
+        new_metrics, new_cells = _fresh_metrics(image, CellTable.load(str(path)), NEW_THRESHOLDS)
+        expected.append((new_metrics, new_cells.grade.copy(), cells.grade.copy()))
+
+    results = regrade_cohort(paths, NEW_THRESHOLDS)
+    assert list(results) == paths
+    for (metrics, grades, old_grades), path in zip(expected, paths):
+        # 阈值确实改变了分级
+        assert not np.array_equal(grades, old_grades)
+        assert len(set(grades.tolist())) == 4
+        assert results[path] == metrics
+
+
+def test_regrade_updates_grades_in_place():
+    image, cells = _stained_image_and_cells(7)
+    analyzer = PathologyQuantitativeAnalyzer(None, None)
+    analyzer._measure_stage(image, cells, analyzer.tracer.start_trace(None))
+
+    metrics = analyzer.regrade(cells, {'v_strong': 120, 'v_moderate': 170, 's_min': 80})
+    np.testing.assert_array_equal(
+        cells.grade, analyzer._grade_cells(cells.mean_h, cells.mean_s, cells.mean_v, NEW_THRESHOLDS))
+    assert metrics['total_cells'] == len(cells)
+    assert [metrics[k] for k in ('weak_positive_cells', 'moderate_positive_cells', 'strong_positive_cells')] \
+        == cells.grade_counts()[1:].tolist()
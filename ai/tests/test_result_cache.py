@@ -0,0 +1,81 @@
+"""结果缓存：命中返回与首次分析相同的结果，多进程并发写入/淘汰不报错"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from cell_table import CellTable
+from demo_pipeline import PathologyQuantitativeAnalyzer
+from result_cache import ResultCache
+
+
+def _table(size: int, seed: int = 0) -> CellTable:
+    rng = np.random.default_rng(seed)
+    cells = CellTable(size)
+    cells.bbox[:] = rng.uniform(0, 100, (size, 4))
+    cells.grade[:] = rng.integers(0, 4, size)
+    cells.iod[:] = rng.random(size)
+    return cells
+
+
+def test_cache_hit_returns_first_result(tmp_path):
+    image = np.random.default_rng(0).integers(0, 256, (128, 128, 3), dtype=np.uint8)
+    path = str(tmp_path / 'slide.png')
+    cv2.imwrite(path, image)
+
+    # 演示桩的分割是随机的，未命中缓存时两次分析的结果不同
+    analyzer = PathologyQuantitativeAnalyzer(None, None, result_cache=ResultCache(str(tmp_path / 'cache')))
+    metrics, cells = analyzer.analyze(path, return_cells=True)
+    cached_metrics, cached_cells = analyzer.analyze(path, return_cells=True)
+
+    assert cached_metrics == metrics
+    for name in CellTable.COLUMNS:
+        np.testing.assert_array_equal(getattr(cached_cells, name), getattr(cells, name))
+    for i in range(len(cells)):
+        np.testing.assert_array_equal(cached_cells.masks[i], cells.masks[i])
+
+
+def test_corrupt_entry_is_a_miss(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key = ('a' * 64, 'b' * 32)
+    cache.put(key, {'irs': 2}, _table(3))
+    npz = os.path.join(str(tmp_path), key[0], key[1], 'cells.npz')
+    with open(npz, 'r+b') as f:
+        f.truncate(os.path.getsize(npz) // 2)
+    assert cache.get(key) is None
+
+    # 缺少必需的列
+    np.savez(npz, bbox=np.zeros((0, 4)))
+    assert cache.get(key) is None
+
+
+def test_eviction_keeps_total_under_limit(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=1 << 14, evict_every=4)
+    for i in range(40):
+        cache.put((f'{i:064x}', 'c' * 32), {'i': i}, _table(50, i))
+    cache.evict()
+    assert 0 < cache.size_bytes() <= 1 << 14
+    # 最近写入的条目保留
+    assert cache.get((f'{39:064x}', 'c' * 32))[0] == {'i': 39}
+
+
+def _hammer(args):
+    root, worker = args
+    cache = ResultCache(root, max_bytes=1 << 13, evict_every=1)
+    for i in range(30):
+        # 所有进程反复写同一组键，并不断淘汰
+        key = (f'{i % 3:064x}', f'{i % 2:032x}')
+        cache.put(key, {'worker': worker}, _table(20, i))
+        cache.get(key)
+    return worker
+
+
+def test_concurrent_processes_share_cache(tmp_path):
+    root = str(tmp_path)
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        assert sorted(executor.map(_hammer, [(root, w) for w in range(4)])) == [0, 1, 2, 3]
+    # 没有遗留的临时目录或墓碑
+    leftovers = [name for _, dirs, _ in os.walk(root) for name in dirs if name.startswith('.')]
+    assert leftovers == []
@@ -0,0 +1,52 @@
+"""人工修正会话：增量更新的指标与对修改后的细胞表重新计算的结果一致"""
+
+import cv2
+import numpy as np
+
+from cell_table import CellTable
+from demo_pipeline import PathologyQuantitativeAnalyzer
+from roi_helpers import HEIGHT, WIDTH, assert_same_metrics, graded_cells, reference_metrics
+
+
+def _inside_polygon(cells: CellTable, polygon) -> np.ndarray:
+    """整图fillPoly后按质心取值（不经过tile索引）"""
+    mask = np.zeros((HEIGHT, WIDTH), np.uint8)
+    cv2.fillPoly(mask, [np.round(np.asarray(polygon, float)).astype(np.int32)], 1)
+    cx, cy = cells.centroids().astype(int).T
+    return mask[cy, cx] > 0
+
+
+def test_edit_session_matches_recomputation():
+    analyzer = PathologyQuantitativeAnalyzer(None, None)
+    cells = graded_cells(3)
+    original = cells.grade.copy()
+    session = analyzer.edit_session(cells, image_size=(WIDTH, HEIGHT), tile_size=128)
+
+    duct = [(100, 100), (700, 150), (650, 600), (120, 500)]
+    necrosis = [(500, 300), (1150, 320), (1100, 880), (600, 850)]
+    undo = [(600, 400), (800, 400), (800, 560)]
+
+    excluded = np.zeros(len(cells), bool)
+    expected_grade = original.copy()
+
+    session.exclude(duct, reason='duct')
+    excluded |= _inside_polygon(cells, duct)
+    metrics = session.relabel(necrosis, 'negative', reason='necrosis')
+    expected_grade[_inside_polygon(cells, necrosis)] = 0
+
+    np.testing.assert_array_equal(session.excluded, excluded)
+    np.testing.assert_array_equal(cells.grade, expected_grade)
+    assert_same_metrics(metrics, reference_metrics(analyzer, cells, ~excluded))
+    assert metrics['excluded_cells'] == excluded.sum()
+    assert metrics['relabeled_cells'] == ((expected_grade != original) & ~excluded).sum()
+
+    metrics = session.restore(undo)
+    restored = _inside_polygon(cells, undo)
+    excluded[restored] = False
+    expected_grade[restored] = original[restored]
+    np.testing.assert_array_equal(cells.grade, expected_grade)
+    assert_same_metrics(metrics, reference_metrics(analyzer, cells, ~excluded))
+
+    # tile汇总之和与全局总和一致
+    np.testing.assert_allclose(session.tile_sums.sum(axis=0), session.totals)
+    assert [edit['action'] for edit in session.edits] == ['exclude', 'relabel', 'restore']
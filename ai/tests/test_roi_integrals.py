@@ -0,0 +1,48 @@
+"""矩形ROI积分图：任意矩形的指标与对其中细胞重新计算的结果一致，热点为最优窗口"""
+
+import numpy as np
+import pytest
+
+from demo_pipeline import PathologyQuantitativeAnalyzer
+from roi_helpers import HEIGHT, WIDTH, assert_same_metrics, graded_cells, reference_metrics
+
+
+@pytest.mark.parametrize('bin_px', [1, 16])
+def test_roi_metrics_match_cell_subset(bin_px):
+    analyzer = PathologyQuantitativeAnalyzer(None, None)
+    cells = graded_cells()
+    roi = analyzer.roi_integrals(cells, image_size=(WIDTH, HEIGHT), bin_px=bin_px)
+    centroids = cells.centroids()
+
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        x0, x1 = np.sort(rng.integers(0, WIDTH // bin_px + 1, 2)) * bin_px
+        y0, y1 = np.sort(rng.integers(0, HEIGHT // bin_px + 1, 2)) * bin_px
+        inside = ((centroids[:, 0] >= x0) & (centroids[:, 0] < x1) &
+                  (centroids[:, 1] >= y0) & (centroids[:, 1] < y1))
+        metrics = roi.metrics(x0, y0, x1, y1)
+        assert_same_metrics(metrics, reference_metrics(analyzer, cells, inside))
+        assert metrics['roi'] == [x0, y0, x1, y1]
+
+    # 整张图的ROI与整图指标相同
+    assert_same_metrics(roi.metrics(0, 0, WIDTH, HEIGHT),
+                        reference_metrics(analyzer, cells, np.ones(len(cells), bool)))
+
+
+def test_hotspot_is_best_window():
+    analyzer = PathologyQuantitativeAnalyzer(None, None, pixel_to_mm_ratio=1000)
+    cells = graded_cells(2)
+    roi = analyzer.roi_integrals(cells, image_size=(WIDTH, HEIGHT), bin_px=20)
+    top, second = roi.hotspots(window_um=200, score='positive_count', top=2)
+
+    # 逐个窗口暴力统计
+    bins = (cells.centroids() // 20).astype(int)
+    positive = np.zeros((HEIGHT // 20, WIDTH // 20))
+    np.add.at(positive, (bins[:, 1], bins[:, 0]), cells.grade > 0)
+    best = max(positive[r:r + 10, c:c + 10].sum()
+               for r in range(positive.shape[0] - 9) for c in range(positive.shape[1] - 9))
+    assert top['hotspot_score'] == best
+    assert top['hotspot_score'] >= second['hotspot_score']
+    # 两个热点不重叠
+    (ax0, ay0, ax1, ay1), (bx0, by0, bx1, by1) = top['roi'], second['roi']
+    assert ax1 <= bx0 or bx1 <= ax0 or ay1 <= by0 or by1 <= ay0
@@ -0,0 +1,104 @@
+"""网格空间索引：半径查询、计数、k近邻与暴力计算一致；密度图总数守恒；µm换算"""
+
+import numpy as np
+import pytest
+
+from spatial_index import SpatialIndex
+
+RATIO = 400  # 像素/毫米，1像素 = 2.5 µm
+WIDTH, HEIGHT = 600, 400
+
+
+def _points(seed=0, count=300):
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(0, [WIDTH, HEIGHT], size=(count, 2))
+    # 几个重合的点，检查距离相同时的处理
+    points[10:14] = points[min(5, count - 1)]
+    return points
+
+
+def _distances_um(queries_um, points):
+    delta = queries_um[:, None, :] - points[None, :, :] * (1000 / RATIO)
+    return np.sqrt((delta ** 2).sum(axis=2))
+
+
+def _queries_um(index, seed=1):
+    rng = np.random.default_rng(seed)
+    inside = rng.uniform(0, [WIDTH * 2.5, HEIGHT * 2.5], size=(40, 2))
+    # 网格外的查询点：紧贴边界外和远离图像
+    outside = np.array([[-30.0, 100.0], [WIDTH * 2.5 + 40, HEIGHT * 2.5 + 10], [-5000.0, -5000.0]])
+    return np.concatenate([inside, outside])
+
+
+@pytest.mark.parametrize('radius_um', [20, 60, 400])
+def test_radius_queries_match_brute_force(radius_um):
+    points = _points()
+    index = SpatialIndex(points, RATIO, bucket_um=50, image_size=(WIDTH, HEIGHT))
+    queries = _queries_um(index)
+    within = _distances_um(queries, points) <= radius_um
+
+    indptr, indices = index.query_radius(queries, radius_um)
+    for q in range(len(queries)):
+        np.testing.assert_array_equal(indices[indptr[q]:indptr[q + 1]], np.flatnonzero(within[q]))
+
+    weights = np.arange(len(points)) % 3 == 0
+    np.testing.assert_array_equal(index.count_within(queries, radius_um), within.sum(axis=1))
+    np.testing.assert_array_equal(index.count_within(queries, radius_um, weights=weights),
+                                  (within & weights).sum(axis=1))
+
+    self_within = _distances_um(index.points_um(), points) <= radius_um
+    np.fill_diagonal(self_within, False)
+    np.testing.assert_array_equal(index.count_within(index.points_um(), radius_um, exclude_self=True),
+                                  self_within.sum(axis=1))
+
+
+@pytest.mark.parametrize('k', [1, 5])
+def test_knn_matches_brute_force(k):
+    points = _points()
+    index = SpatialIndex(points, RATIO, bucket_um=50, image_size=(WIDTH, HEIGHT))
+    queries = _queries_um(index)
+
+    _, distances = index.knn(queries, k)
+    want = np.sort(_distances_um(queries, points), axis=1)[:, :k]
+    np.testing.assert_allclose(distances, want, atol=1e-9)
+
+    indices, distances = index.knn(index.points_um(), k, exclude_self=True)
+    brute = _distances_um(index.points_um(), points)
+    np.fill_diagonal(brute, np.inf)
+    np.testing.assert_allclose(distances, np.sort(brute, axis=1)[:, :k], atol=1e-9)
+    assert (indices != np.arange(len(points))[:, None]).all()
+    np.testing.assert_allclose(np.take_along_axis(brute, indices, axis=1), distances, atol=1e-9)
+
+
+def test_knn_pads_when_too_few_cells():
+    index = SpatialIndex(_points(count=3), RATIO, image_size=(WIDTH, HEIGHT))
+    indices, distances = index.knn(index.points_um(), 4, exclude_self=True)
+    assert (indices[:, 2:] == -1).all() and np.isinf(distances[:, 2:]).all()
+    assert (indices[:, :2] >= 0).all()
+
+
+def test_density_raster_sums_to_cell_count():
+    points = _points()
+    index = SpatialIndex(points, RATIO, image_size=(WIDTH, HEIGHT))
+    resolution_um = 100
+    area_mm2 = (resolution_um / 1000) ** 2
+
+    density = index.density_raster(resolution_um)
+    # 600 × 400 像素 = 1500 × 1000 µm
+    assert density.shape == (10, 15)
+    assert density.sum() * area_mm2 == pytest.approx(len(points))
+
+    positive = np.arange(len(points)) % 4 == 0
+    assert index.density_raster(resolution_um, weights=positive).sum() * area_mm2 == pytest.approx(positive.sum())
+
+
+def test_um_scaling_follows_pixel_ratio():
+    points = np.array([[0.0, 0.0], [100.0, 0.0]])
+    for ratio in (200, 500):
+        index = SpatialIndex(points, ratio, image_size=(200, 10))
+        spacing_um = 100 * 1000 / ratio
+        np.testing.assert_allclose(index.points_um()[1], [spacing_um, 0])
+        assert list(index.count_within(index.points_um(), spacing_um * 0.99)) == [1, 1]
+        assert list(index.count_within(index.points_um(), spacing_um)) == [2, 2]
+        _, distances = index.knn(index.points_um(), 1, exclude_self=True)
+        np.testing.assert_allclose(distances[:, 0], spacing_um)
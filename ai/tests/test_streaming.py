@@ -0,0 +1,101 @@
+"""流式分析（桩分析器）：按输入顺序产出、单张失败不中断、生成器异常、提前关闭、在途数量上限"""
+
+import threading
+import time
+
+import pytest
+
+from streaming import stream_analyze
+from tracing import NullTracer
+
+
+class _StubAnalyzer:
+    """只实现 stream_analyze 用到的阶段；'bad-decode' / 'bad-infer' 在对应阶段失败"""
+
+    def __init__(self, delay: float = 0.0):
+        self.tracer = NullTracer()
+        self.delay = delay
+        self.loaded = 0
+        self.consumed = 0
+        self.max_in_flight = 0
+
+    @staticmethod
+    def _trace_name(source):
+        return None
+
+    def _lookup_cache(self, source, trace):
+        return None, None
+
+    def _store_cache(self, cache_key, metrics, cells, trace):
+        pass
+
+    def _load_stage(self, source, trace):
+        if source == 'bad-decode':
+            raise ValueError('cannot decode')
+        self.loaded += 1
+        self.max_in_flight = max(self.max_in_flight, self.loaded - self.consumed)
+        return source
+
+    def _infer_stage(self, image, trace):
+        if image == 'bad-infer':
+            raise RuntimeError('model failed')
+        time.sleep(self.delay)
+        return [image]
+
+    def _measure_stage(self, image, cells, trace):
+        return {'value': image, 'cells': len(cells)}
+
+
+def test_results_follow_input_order():
+    analyzer = _StubAnalyzer(delay=0.001)
+    sources = list(range(20))
+    results = list(stream_analyze(analyzer, sources))
+    assert [source for source, _, _ in results] == sources
+    assert [metrics['value'] for _, metrics, _ in results] == sources
+    assert all(error is None for _, _, error in results)
+
+
+def test_single_failures_do_not_stop_the_stream():
+    sources = [0, 'bad-decode', 1, 'bad-infer', 2]
+    results = list(stream_analyze(_StubAnalyzer(), sources))
+    assert [source for source, _, _ in results] == sources
+    assert results[1][1] is None and results[1][2] == 'ValueError: cannot decode'
+    assert results[3][1] is None and results[3][2] == 'RuntimeError: model failed'
+    assert [metrics['value'] for _, metrics, error in results if error is None] == [0, 1, 2]
+
+
+def test_failing_generator_raises_after_earlier_results():
+    def sources():
+        yield from range(3)
+        raise OSError('listing failed')
+
+    seen = []
+    with pytest.raises(OSError, match='listing failed'):
+        for source, metrics, error in stream_analyze(_StubAnalyzer(), sources()):
+            seen.append(source)
+    assert seen == [0, 1, 2]
+
+
+def test_close_stops_all_threads():
+    def endless():
+        i = 0
+        while True:
+            yield i
+            i += 1
+
+    before = set(threading.enumerate())
+    it = stream_analyze(_StubAnalyzer(), endless())
+    assert next(it)[0] == 0
+    it.close()
+    assert set(threading.enumerate()) - before == set()
+
+
+def test_in_flight_images_are_bounded():
+    queue_size = 2
+    analyzer = _StubAnalyzer()
+    for _ in stream_analyze(analyzer, range(40), queue_size=queue_size):
+        analyzer.consumed += 1
+        # 消费方慢于上游，各队列都会被填满
+        time.sleep(0.005)
+    assert analyzer.loaded == 40
+    assert 1 < analyzer.max_in_flight <= 3 * queue_size + 3
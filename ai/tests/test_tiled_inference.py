@@ -0,0 +1,72 @@
+"""分块推理：按质心归属拼接的结果与整图推理相同，跨接缝的细胞只保留一次"""
+
+import cv2
+import numpy as np
+import pytest
+
+import tiled_inference
+from tiled_inference import TiledInference
+
+
+def _disc_image(seed: int = 0, width: int = 520, height: int = 410, count: int = 250, radius: int = 8):
+    """互不接触的圆盘（半径小于重叠宽度的一半）"""
+    rng = np.random.default_rng(seed)
+    mask = np.zeros((height, width), np.uint8)
+    for _ in range(count * 20):
+        x, y = rng.integers(0, width), rng.integers(0, height)
+        r = int(rng.integers(3, radius + 1))
+        # 与已有圆盘保持至少2像素间隔，圆盘可以被图像边界截断
+        if mask[max(y - r - 2, 0):y + r + 3, max(x - r - 2, 0):x + r + 3].any():
+            continue
+        cv2.circle(mask, (int(x), int(y)), r, 255, -1)
+        count -= 1
+        if count == 0:
+            break
+    return cv2.merge([mask, mask, mask])
+
+
+def _components(tile: np.ndarray) -> np.ndarray:
+    """模拟分割模型：连通域标签"""
+    return cv2.connectedComponents((tile[..., 0] > 0).astype(np.uint8), connectivity=8)[1]
+
+
+def _same_partition(a: np.ndarray, b: np.ndarray) -> bool:
+    """两张标签图对像素的划分相同（标签编号可以不同）"""
+    if not np.array_equal(a > 0, b > 0):
+        return False
+    pairs = np.unique(np.stack([a[a > 0], b[b > 0]]), axis=1)
+    return len(np.unique(pairs[0])) == len(np.unique(pairs[1])) == pairs.shape[1]
+
+
+@pytest.mark.parametrize('tile_workers', [1, 3])
+def test_stitched_labels_match_whole_image(tile_workers):
+    image = _disc_image()
+    expected = _components(image)
+
+    inference = TiledInference(_components, tile_size=128, overlap=32, tile_workers=tile_workers)
+    labels = inference.predict(image)
+
+    assert labels.dtype == np.int32
+    assert _same_partition(labels, expected)
+    # 全局ID从1开始连续
+    np.testing.assert_array_equal(np.unique(labels), np.arange(expected.max() + 1))
+    assert inference.stats['instances'] == expected.max()
+    assert inference.stats['tiles'] > 4
+    assert inference.stats['dropped_at_seams'] > 0
+
+
+def test_ids_do_not_depend_on_worker_count():
+    image = _disc_image(1)
+    serial = TiledInference(_components, tile_size=128, overlap=32, tile_workers=1).predict(image)
+    parallel = TiledInference(_components, tile_size=128, overlap=32, tile_workers=4).predict(image)
+    np.testing.assert_array_equal(serial, parallel)
+
+
+def test_threads_set_once_per_instance(monkeypatch):
+    calls = []
+    monkeypatch.setattr(tiled_inference, 'set_cpu_threads', calls.append)
+    inference = TiledInference(_components, tile_size=128, overlap=32, threads=3)
+    image = _disc_image(2, width=200, height=200, count=20)
+    for _ in range(3):
+        inference.predict(image)
+    assert calls == [3]
@@ -0,0 +1,201 @@
+"""
+Cellpose / StarDist 的分块推理
+
+整张RGB图一次性送进 model.eval / model.predict_instances：大图的中间张量
+（流场、概率图、距离图）随像素数线性增长，内存峰值不可控；小图又只能用上
+框架自己的intra-op并行，多核服务器上利用率低、延迟随图像大小波动。
+
+这里按 tiling.iter_tile_grid 把图像切成互相重叠的tile逐块推理，再拼回整图标签：
+
+1. 每个tile独立推理得到局部标签图
+2. 用 bincount 求每个局部实例的质心，只保留质心落在本tile core 区域内的实例
+   （与 analyze_tiled 的细胞去重规则相同），跨接缝的细胞只被一个tile保留
+3. 按tile的行优先顺序、tile内按局部ID顺序分配全局ID，结果与tile的完成顺序无关
+4. 写入全局标签图时不覆盖相邻tile已写入的像素
+
+overlap 的一半需要大于最大细胞半径，否则core边缘的细胞在tile内会被截断
+（Cellpose diameter=30 时默认 overlap=64 足够）。
+
+线程：tile_workers 个tile并行推理，每个推理内部使用 threads 个intra-op线程
+（torch.set_num_threads；StarDist 为 TensorFlow 的 intra-op 线程池）。
+缺省 threads = CPU核数 // tile_workers，两者的乘积不超过核数，避免过度订阅。
+intra-op线程数是进程级设置，每个 TiledInference 实例只在第一次 predict 时设置一次；
+同一进程中多个实例的 threads 不同时，后设置的覆盖先设置的。
+模型来自 model_registry，并行的tile共享同一个实例。
+
+用法：
+    labels = tiled_cellpose(image_rgb, tile_size=512, tile_workers=4, diameter=30)
+    labels = tiled_stardist(image_rgb, tile_size=1024, prob_thresh=0.3)
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from model_registry import get_model
+from tiling import Tile, iter_tile_grid
+
+# 输入tile（RGB）→ 局部标签图（0为背景）
+TilePredictor = Callable[[np.ndarray], np.ndarray]
+
+
+def set_cpu_threads(threads: int) -> None:
+    """
+    设置推理框架的intra-op线程数
+
+    只影响已经导入的框架。TensorFlow 的线程池在首次运行后不能再修改，此时保持原设置。
+    """
+    import sys
+
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(threads)
+    if 'tensorflow' in sys.modules:
+        tf = sys.modules['tensorflow']
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(threads)
+        except RuntimeError:
+            pass
+
+
+def cellpose_predictor(model_type: str = 'cyto3', **eval_kwargs) -> TilePredictor:
+    """Cellpose tile推理函数，eval_kwargs 传给 model.eval（diameter、flow_threshold 等）"""
+    model = get_model('cellpose', model_type=model_type)
+
+    def predict(tile: np.ndarray) -> np.ndarray:
+        masks = model.eval(tile, **eval_kwargs)[0]
+        return np.asarray(masks)
+
+    return predict
+
+
+def stardist_predictor(name: str = '2D_versatile_he', **predict_kwargs) -> TilePredictor:
+    """StarDist tile推理函数，predict_kwargs 传给 model.predict_instances（prob_thresh 等）"""
+    model = get_model('stardist', name=name)
+
+    def predict(tile: np.ndarray) -> np.ndarray:
+        labels, _ = model.predict_instances(tile, **predict_kwargs)
+        return np.asarray(labels)
+
+    return predict
+
+
+def _owned_labels(tile: Tile, labels: np.ndarray) -> Tuple[np.ndarray, int]:
+    """质心落在tile core区域内的局部标签（升序），以及tile中的实例总数"""
+    labels = labels.astype(np.int64, copy=False)
+    ys, xs = np.nonzero(labels)
+    values = labels[ys, xs]
+    counts = np.bincount(values)
+    present = np.flatnonzero(counts[1:]) + 1
+    if len(present) == 0:
+        return present, 0
+    cx = np.bincount(values, weights=xs)[present] / counts[present] + tile.x
+    cy = np.bincount(values, weights=ys)[present] / counts[present] + tile.y
+    return present[tile.owns(np.stack([cx, cy], axis=1))], len(present)
+
+
+class TiledInference:
+    """
+    重叠分块推理 + 按质心归属拼接
+
+    Args:
+        predictor: tile → 局部标签图，例如 cellpose_predictor() / stardist_predictor()
+        tile_size: tile边长（像素）
+        overlap: 相邻tile重叠宽度（像素），一半需大于最大细胞半径
+        tile_workers: 并行推理的tile数
+        threads: 每个推理的intra-op线程数，缺省为 CPU核数 // tile_workers
+    """
+
+    def __init__(
+        self,
+        predictor: TilePredictor,
+        tile_size: int = 1024,
+        overlap: int = 64,
+        tile_workers: int = 1,
+        threads: Optional[int] = None
+    ):
+        if tile_size <= 2 * overlap:
+            raise ValueError(f"tile边长 {tile_size} 必须大于重叠宽度 {overlap} 的两倍")
+        self.predictor = predictor
+        self.tile_size = int(tile_size)
+        self.overlap = int(overlap)
+        self.tile_workers = max(1, int(tile_workers))
+        self.threads = threads or max(1, (os.cpu_count() or 1) // self.tile_workers)
+        self.stats: Dict[str, int] = {}
+        self._threads_set = False
+
+    def predict(self, image: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            image: RGB图像 (H, W, 3)
+
+        Returns:
+            (H, W) int32 标签图，0为背景，实例ID从1开始连续编号
+        """
+        if not self._threads_set:
+            # 线程数是进程级设置，每个实例只在第一次推理时设置一次
+            set_cpu_threads(self.threads)
+            self._threads_set = True
+        height, width = image.shape[:2]
+        tiles = list(iter_tile_grid(width, height, self.tile_size, self.overlap))
+        output = np.zeros((height, width), dtype=np.int32)
+        next_id = 1
+        dropped = 0
+
+        def run(tile: Tile) -> np.ndarray:
+            crop = np.ascontiguousarray(image[tile.y:tile.y + tile.h, tile.x:tile.x + tile.w])
+            return self.predictor(crop)
+
+        with ThreadPoolExecutor(max_workers=self.tile_workers) as executor:
+            # 最多 2 × tile_workers 个tile在途，局部标签图不会整体堆积在内存中
+            pending = deque()
+            queued = 0
+            while pending or queued < len(tiles):
+                while queued < len(tiles) and len(pending) < 2 * self.tile_workers:
+                    pending.append((tiles[queued], executor.submit(run, tiles[queued])))
+                    queued += 1
+                tile, future = pending.popleft()
+                labels = future.result()
+                owned, present = _owned_labels(tile, labels)
+                dropped += present - len(owned)
+
+                # 局部ID → 全局ID；未保留的实例映射为0
+                lookup = np.zeros(int(labels.max()) + 1 if labels.size else 1, dtype=np.int32)
+                lookup[owned] = np.arange(next_id, next_id + len(owned), dtype=np.int32)
+                next_id += len(owned)
+                region = output[tile.y:tile.y + tile.h, tile.x:tile.x + tile.w]
+                mapped = lookup[labels]
+                np.copyto(region, mapped, where=(region == 0) & (mapped > 0))
+
+        self.stats = {'tiles': len(tiles), 'instances': next_id - 1, 'dropped_at_seams': dropped}
+        return output
+
+
+def tiled_cellpose(
+    image: np.ndarray,
+    tile_size: int = 1024,
+    overlap: int = 64,
+    tile_workers: int = 1,
+    threads: Optional[int] = None,
+    model_type: str = 'cyto3',
+    **eval_kwargs
+) -> np.ndarray:
+    """Cellpose分块推理，返回整图标签（参数见 TiledInference / cellpose_predictor）"""
+    predictor = cellpose_predictor(model_type, **eval_kwargs)
+    return TiledInference(predictor, tile_size, overlap, tile_workers, threads).predict(image)
+
+
+def tiled_stardist(
+    image: np.ndarray,
+    tile_size: int = 1024,
+    overlap: int = 64,
+    tile_workers: int = 1,
+    threads: Optional[int] = None,
+    name: str = '2D_versatile_he',
+    **predict_kwargs
+) -> np.ndarray:
+    """StarDist分块推理，返回整图标签（参数见 TiledInference / stardist_predictor）"""
+    predictor = stardist_predictor(name, **predict_kwargs)
+    return TiledInference(predictor, tile_size, overlap, tile_workers, threads).predict(image)
@@ -0,0 +1,162 @@
+"""
+全切片图像（WSI）分块读取
+
+40x扫描的全切片有数百亿像素，不能整张 cv2.imread。
+这里把切片切成互相重叠的tile逐块读取：
+- tile大小由内存预算决定，与切片大小无关
+- 相邻tile之间的重叠区按中线划分归属（core区域），
+  细胞中心落在哪个tile的core里就归哪个tile，避免边界细胞被重复计数
+"""
+
+import logging
+import math
+import os
+from dataclasses import dataclass
+from typing import Iterator, List, Tuple, Union
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# 分析一个tile时每像素的大致内存开销（字节）：
+# BGR(3) + HSV(3) + 灰度/OD(2) + int32标签图(4) + bincount权重的float64临时数组(8) + 余量
+TILE_BYTES_PER_PIXEL = 24
+
+# 交给OpenSlide读取的全切片格式
+SLIDE_EXTENSIONS = ('.svs', '.ndpi', '.mrxs', '.scn', '.vms', '.vmu', '.bif', '.tif', '.tiff')
+
+
+@dataclass
+class Tile:
+    """一个tile：读取区域 (x, y, w, h) 和归属区域 core = [x0, x1) × [y0, y1)，均为切片全局坐标"""
+    x: int
+    y: int
+    w: int
+    h: int
+    core: Tuple[int, int, int, int]
+
+    def owns(self, points: np.ndarray) -> np.ndarray:
+        """全局坐标点 (N, 2) 是否落在本tile的core区域内"""
+        x0, y0, x1, y1 = self.core
+        return (
+            (points[:, 0] >= x0) & (points[:, 0] < x1) &
+            (points[:, 1] >= y0) & (points[:, 1] < y1)
+        )
+
+    def core_mask(self) -> np.ndarray:
+        """tile局部坐标下的core区域bool mask (h, w)，用于像素级统计去重"""
+        x0, y0, x1, y1 = self.core
+        mask = np.zeros((self.h, self.w), dtype=bool)
+        mask[y0 - self.y:y1 - self.y, x0 - self.x:x1 - self.x] = True
+        return mask
+
+
+def tile_size_for_budget(budget_mb: float, overlap: int) -> int:
+    """
+    根据内存预算计算tile边长
+
+    Args:
+        budget_mb: 单个tile分析时允许占用的内存（MB）
+        overlap: 相邻tile重叠宽度（像素）
+    """
+    side = int(math.sqrt(budget_mb * 1024 * 1024 / TILE_BYTES_PER_PIXEL))
+    if side <= 2 * overlap:
+        raise ValueError(f"内存预算 {budget_mb}MB 太小：tile边长 {side} 不足重叠宽度 {overlap} 的两倍")
+    return side
+
+
+def _axis_spans(length: int, tile_size: int, overlap: int) -> List[Tuple[int, int, int, int]]:
+    """单个坐标轴上的 (起点, 长度, core起点, core终点)"""
+    step = tile_size - overlap
+    starts = list(range(0, max(length - overlap, 1), step))
+    spans = []
+    for k, start in enumerate(starts):
+        size = min(tile_size, length - start)
+        # core边界取与前/后一个tile重叠区的中线
+        core_start = 0 if k == 0 else spans[-1][3]
+        if k + 1 < len(starts):
+            core_end = (starts[k + 1] + start + size) // 2
+        else:
+            core_end = length
+        spans.append((start, size, core_start, core_end))
+    return spans
+
+
+def iter_tile_grid(width: int, height: int, tile_size: int, overlap: int) -> Iterator[Tile]:
+    """按行优先顺序生成覆盖整张切片的tile，core区域互不重叠且拼起来正好覆盖全图"""
+    for y, h, cy0, cy1 in _axis_spans(height, tile_size, overlap):
+        for x, w, cx0, cx1 in _axis_spans(width, tile_size, overlap):
+            yield Tile(x, y, w, h, (cx0, cy0, cx1, cy1))
+
+
+class ArraySource:
+    """内存数组或 np.memmap（.npy）作为切片来源"""
+
+    def __init__(self, array: np.ndarray):
+        self.array = array
+        self.height, self.width = array.shape[:2]
+
+    def read(self, x: int, y: int, w: int, h: int) -> np.ndarray:
+        # 拷贝一份，memmap时只会把这一块读进内存
+        return np.ascontiguousarray(self.array[y:y + h, x:x + w])
+
+    def thumbnail(self, max_side: int) -> np.ndarray:
+        """等间隔抽取像素得到的缩略图（长边不超过 max_side）"""
+        step = max(1, math.ceil(max(self.width, self.height) / max_side))
+        return np.ascontiguousarray(self.array[::step, ::step])
+
+
+class OpenSlideSource:
+    """通过OpenSlide按区域读取全切片（只读第0层，即最高分辨率）"""
+
+    def __init__(self, path: str):
+        import openslide
+
+        self.slide = openslide.OpenSlide(path)
+        self.width, self.height = self.slide.dimensions
+
+    def read(self, x: int, y: int, w: int, h: int) -> np.ndarray:
+        region = self.slide.read_region((x, y), 0, (w, h))
+        # RGBA → BGR，与 cv2.imread 的通道顺序一致
+        return cv2.cvtColor(np.asarray(region), cv2.COLOR_RGBA2BGR)
+
+    def thumbnail(self, max_side: int) -> np.ndarray:
+        """由切片金字塔的低分辨率层生成的缩略图（长边不超过 max_side）"""
+        thumb = self.slide.get_thumbnail((max_side, max_side))
+        return cv2.cvtColor(np.asarray(thumb.convert('RGB')), cv2.COLOR_RGB2BGR)
+
+
+SlideSource = Union[ArraySource, OpenSlideSource]
+
+
+def open_slide(slide: Union[str, np.ndarray]) -> SlideSource:
+    """
+    打开切片
+
+    - ndarray：直接使用
+    - .npy：内存映射，只读取用到的tile
+    - 全切片格式（.svs/.ndpi/...）：需要安装 openslide-python
+    - 其他普通图像：cv2.imread 整张解码（小图可用，不受tile预算限制）
+    """
+    if isinstance(slide, np.ndarray):
+        return ArraySource(slide)
+
+    ext = os.path.splitext(slide)[1].lower()
+    if ext == '.npy':
+        return ArraySource(np.load(slide, mmap_mode='r'))
+    if ext in SLIDE_EXTENSIONS:
+        try:
+            import openslide
+        except ImportError:
+            logger.warning("未安装openslide，整张读取图像（内存不受tile预算限制）: %s", slide)
+        else:
+            # 普通（非金字塔）tif时 detect_format 返回None，退回cv2读取
+            if openslide.OpenSlide.detect_format(slide):
+                return OpenSlideSource(slide)
+
+    image = cv2.imread(slide)
+    if image is None:
+        raise FileNotFoundError(f"无法读取图像: {slide}")
+    return ArraySource(image)
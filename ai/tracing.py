@@ -0,0 +1,306 @@
+"""
+分阶段追踪（耗时 / CPU / 内存 / 处理数量）
+
+analyze() 的每个阶段都包在 trace.stage(...) 中，记录：
+- wall_seconds：墙钟时间
+- cpu_seconds：本进程CPU时间（多线程时可能大于墙钟时间）
+- rss_delta_mb：阶段结束与开始时进程当前常驻内存之差（阶段留下/释放的内存，
+  可以为负；只在阶段边界采样，不反映阶段内部的瞬时峰值；平台不支持时为None）
+- counts：阶段自己填写的数量，如 cells_in / cells_out / pixels
+
+同名阶段在一张图内会累加（例如分块分析中每批tile的检测），calls 记录调用次数。
+流水线分析（streaming）中同一张图的不同阶段在不同线程中结束，记录时加锁。
+整个进程的常驻内存峰值（ru_maxrss）记录在追踪的 peak_rss_mb 中。
+每张图一个JSON追踪文件，批处理结束后用 aggregate() / summarize_trace_dir() 汇总。
+
+未启用追踪时分析器使用 NULL_TRACER：stage() 返回同一个空的上下文管理器，
+写入的数量直接丢弃，每个阶段的额外开销只有一次方法调用，可以在生产环境常开。
+
+用法：
+    tracer = Tracer(trace_dir='demo/traces')
+    analyzer = PathologyQuantitativeAnalyzer(yolo, seg, tracer=tracer)
+    analyzer.analyze('image_001.jpg')      # 写出 demo/traces/image_001.trace.json
+    print(tracer.summary())
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def _current_rss_mb() -> Optional[float]:
+    """进程当前的常驻内存（MB）；读取 /proc/self/statm（Linux），其他平台为None"""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / 1024 ** 2
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """进程常驻内存的历史峰值（MB）"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为KB，macOS 为字节
+    return rss / 1024 ** 2 if sys.platform == 'darwin' else rss / 1024
+
+
+class _Stage:
+    """一个阶段的计时上下文；__enter__ 返回可写入数量的字典"""
+
+    __slots__ = ('trace', 'name', 'counts', '_wall', '_cpu', '_rss')
+
+    def __init__(self, trace: 'Trace', name: str, counts: Dict[str, float]):
+        self.trace = trace
+        self.name = name
+        self.counts = counts
+
+    def __enter__(self) -> Dict[str, float]:
+        self._rss = _current_rss_mb()
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        return self.counts
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        rss = _current_rss_mb()
+        rss_delta = None if rss is None or self._rss is None else rss - self._rss
+        self.trace._record(self.name, wall, cpu, rss_delta, self.counts)
+
+
+class Trace:
+    """单张图像的追踪记录"""
+
+    def __init__(self, name: str, tracer: Optional['Tracer'] = None):
+        self.name = name
+        self.tracer = tracer
+        self.stages: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._cpu_start = time.process_time()
+
+    def stage(self, name: str, **counts) -> _Stage:
+        """阶段计时上下文，counts 为初始数量，也可以在 with 块内写入返回的字典"""
+        return _Stage(self, name, counts)
+
+    def _record(self, name: str, wall: float, cpu: float, rss_delta: Optional[float],
+                counts: Dict[str, float]) -> None:
+        with self._lock:
+            entry = self.stages.get(name)
+            if entry is None:
+                entry = self.stages[name] = {
+                    'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                    'rss_delta_mb': None, 'counts': {},
+                }
+            entry['calls'] += 1
+            entry['wall_seconds'] += wall
+            entry['cpu_seconds'] += cpu
+            if rss_delta is not None:
+                entry['rss_delta_mb'] = (entry['rss_delta_mb'] or 0.0) + rss_delta
+            for key, value in counts.items():
+                entry['counts'][key] = entry['counts'].get(key, 0) + value
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            stages = {name: {**entry, 'counts': dict(entry['counts'])} for name, entry in self.stages.items()}
+        return {
+            'name': self.name,
+            'wall_seconds': time.perf_counter() - self._start,
+            'cpu_seconds': time.process_time() - self._cpu_start,
+            'peak_rss_mb': _peak_rss_mb(),
+            'stages': stages,
+        }
+
+    def finish(self) -> Dict:
+        """结束追踪，交给所属的 Tracer 保存/汇总，返回追踪字典"""
+        data = self.to_dict()
+        if self.tracer is not None:
+            self.tracer._collect(data)
+        return data
+
+
+class _NullCounts(dict):
+    """丢弃所有写入的字典"""
+
+    __slots__ = ()
+
+    def __setitem__(self, key, value) -> None:
+        pass
+
+
+_NULL_COUNTS = _NullCounts()
+
+
+class _NullStage:
+    """空阶段：不计时，写入的数量直接丢弃"""
+
+    __slots__ = ()
+
+    def __enter__(self) -> Dict[str, float]:
+        return _NULL_COUNTS
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        return None
+
+
+class _NullTrace:
+    name = None
+    stages: Dict[str, Dict] = {}
+    _stage = _NullStage()
+
+    def stage(self, name: str, **counts) -> _NullStage:
+        return self._stage
+
+    def finish(self) -> None:
+        return None
+
+
+class NullTracer:
+    """不记录任何内容的追踪器（默认）"""
+
+    _trace = _NullTrace()
+
+    def start_trace(self, name: Optional[str] = None) -> _NullTrace:
+        return self._trace
+
+    def summary(self) -> Dict:
+        return {}
+
+
+NULL_TRACER = NullTracer()
+
+
+class Tracer:
+    """
+    收集每张图像的追踪记录
+
+    Args:
+        trace_dir: 每张图的追踪JSON写入该目录（<名称>.trace.json）；为None时只保存在内存中
+        keep: 是否在内存中保留所有追踪（用于 summary()）
+    """
+
+    def __init__(self, trace_dir: Optional[str] = None, keep: bool = True):
+        self.trace_dir = trace_dir
+        self.keep = keep
+        self.traces: List[Dict] = []
+        self._count = 0
+        self._lock = threading.Lock()
+        if trace_dir:
+            os.makedirs(trace_dir, exist_ok=True)
+
+    def start_trace(self, name: Optional[str] = None) -> Trace:
+        """开始一张图像的追踪；name 为None时（例如内存中的数组）按序编号"""
+        with self._lock:
+            self._count += 1
+            count = self._count
+        return Trace(name or f"trace_{count:06d}", self)
+
+    def _collect(self, data: Dict) -> None:
+        if self.keep:
+            with self._lock:
+                self.traces.append(data)
+        if self.trace_dir:
+            path = os.path.join(self.trace_dir, f"{data['name']}.trace.json")
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+
+    def summary(self) -> Dict:
+        return aggregate(self.traces)
+
+
+def aggregate(traces: Iterable[Dict]) -> Dict:
+    """
+    汇总一批追踪记录
+
+    Returns:
+        {'images': N, 'wall_seconds': {...}, 'stages': {阶段: 统计}}，
+        每个阶段给出总耗时、每图耗时的均值/p50/p95/最大值、CPU时间、
+        常驻内存增量的最大值、各数量之和，以及 cells_in/cells_out 的吞吐量（每秒）
+    """
+    traces = list(traces)
+    per_stage: Dict[str, Dict[str, List]] = {}
+    for trace in traces:
+        for name, entry in trace['stages'].items():
+            acc = per_stage.setdefault(name, {'wall': [], 'cpu': [], 'rss': [], 'calls': [], 'counts': {}})
+            acc['wall'].append(entry['wall_seconds'])
+            acc['cpu'].append(entry['cpu_seconds'])
+            acc['calls'].append(entry['calls'])
+            if entry.get('rss_delta_mb') is not None:
+                acc['rss'].append(entry['rss_delta_mb'])
+            for key, value in entry['counts'].items():
+                acc['counts'][key] = acc['counts'].get(key, 0) + value
+
+    stages = {}
+    for name, acc in per_stage.items():
+        wall = np.asarray(acc['wall'])
+        total = float(wall.sum())
+        stats = {
+            'images': len(wall),
+            'calls': int(sum(acc['calls'])),
+            'wall_seconds_total': total,
+            'wall_seconds_mean': float(wall.mean()),
+            'wall_seconds_p50': float(np.percentile(wall, 50)),
+            'wall_seconds_p95': float(np.percentile(wall, 95)),
+            'wall_seconds_max': float(wall.max()),
+            'cpu_seconds_total': float(sum(acc['cpu'])),
+            'rss_delta_mb_max': max(acc['rss']) if acc['rss'] else None,
+            'counts': acc['counts'],
+        }
+        for key in ('cells_in', 'cells_out'):
+            if key in acc['counts'] and total > 0:
+                stats[f"{key}_per_sec"] = acc['counts'][key] / total
+        stages[name] = stats
+
+    image_wall = np.asarray([t['wall_seconds'] for t in traces])
+    return {
+        'images': len(traces),
+        'wall_seconds': {
+            'total': float(image_wall.sum()) if len(image_wall) else 0.0,
+            'mean': float(image_wall.mean()) if len(image_wall) else 0.0,
+            'p95': float(np.percentile(image_wall, 95)) if len(image_wall) else 0.0,
+        },
+        'stages': stages,
+    }
+
+
+def summarize_trace_dir(trace_dir: str, output: Optional[str] = None) -> Dict:
+    """读取目录中所有 *.trace.json 并汇总；给定 output 时写出汇总JSON"""
+    traces = []
+    for path in sorted(Path(trace_dir).glob('*.trace.json')):
+        with open(path, encoding='utf-8') as f:
+            traces.append(json.load(f))
+    summary = aggregate(traces)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+
+def format_summary(summary: Dict) -> str:
+    """汇总结果的简要文本（每个阶段一行）"""
+    lines = [f"共 {summary['images']} 张图像，平均 {summary['wall_seconds']['mean']:.3f}s/张"]
+    for name, stats in summary['stages'].items():
+        rate = stats.get('cells_in_per_sec') or stats.get('cells_out_per_sec')
+        rate_text = f", {rate:,.0f} cells/s" if rate else ""
+        lines.append(
+            f"  [{name}] 总计 {stats['wall_seconds_total']:.3f}s, "
+            f"p50 {stats['wall_seconds_p50'] * 1000:.1f}ms, p95 {stats['wall_seconds_p95'] * 1000:.1f}ms, "
+            f"CPU {stats['cpu_seconds_total']:.3f}s{rate_text}"
+        )
+    return '\n'.join(lines)
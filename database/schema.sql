@@ -43,6 +43,7 @@ CREATE TABLE IF NOT EXISTS case_samples (
 
 CREATE INDEX IF NOT EXISTS idx_case_samples_case ON case_samples (case_id);
 CREATE INDEX IF NOT EXISTS idx_case_samples_modality ON case_samples (modality);
+CREATE INDEX IF NOT EXISTS idx_case_samples_checksum ON case_samples (checksum);
 
 -- 病例文字病历：演示病例识别/读取
 CREATE TABLE IF NOT EXISTS case_reports (
@@ -120,6 +121,7 @@ CREATE TABLE IF NOT EXISTS dataset_versions (
 
 CREATE INDEX IF NOT EXISTS idx_samples_dataset_split ON samples (dataset_id, split);
 CREATE INDEX IF NOT EXISTS idx_samples_status ON samples (status);
+CREATE INDEX IF NOT EXISTS idx_samples_image_checksum ON samples (image_checksum);
 CREATE INDEX IF NOT EXISTS idx_sample_attributes_key ON sample_attributes (key);
 CREATE INDEX IF NOT EXISTS idx_sample_labels_type ON sample_labels (label_type);
 